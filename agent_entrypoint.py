@@ -4,62 +4,141 @@ import logging
 import os
 
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli
-from livekit.agents.voice_assistant import VoiceAssistant
+from livekit.agents import NOT_GIVEN, Agent, AgentSession, JobContext, JobProcess, WorkerOptions, cli
 from livekit.plugins import groq, silero
 
+from config import GREETING_MESSAGE, SPECULATIVE_RETRIEVAL, TTS_VOICE
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ist-agent")
 
 
+def prewarm(proc: JobProcess) -> None:
+    """Runs once per job process before it is offered any job: RAG, embedding model, VAD."""
+    from app.metrics import start_exporter
+    from app.warmup import mark_ready, prewarm_rag
+
+    start_exporter()
+    prewarm_rag()
+    proc.userdata["vad"] = silero.VAD.load()
+    mark_ready()
+    logger.info("job process %s ready", os.getpid())
+
+
 async def entrypoint(ctx: JobContext):
     """Main agent entrypoint called for each LiveKit room."""
+    from app.warmup import is_ready
+
+    if not is_ready():
+        # Only reachable if the worker skipped prewarm for this process
+        logger.warning("job started before prewarm finished; warming up now")
+        await asyncio.get_running_loop().run_in_executor(None, prewarm, ctx.proc)
+
     await ctx.connect()
 
+    from app import metrics
+    from app.tracing import RoomTracer
+    tracer = RoomTracer(ctx.room.name or "default")
+    metrics.inc("ist_rooms_total")
+    metrics.inc("ist_active_rooms")
+
+    async def _room_closed() -> None:
+        metrics.inc("ist_active_rooms", -1)
+
+    ctx.add_shutdown_callback(_room_closed)
+
     # Import here to avoid issues at module load time
+    on_transcript = None
     try:
-        from llm_rag import RAGLLM
-        llm = RAGLLM(session_id=ctx.room.name or "default")
+        from app.llm_rag import RAGLLM
+        from app.speculative import SpeculativeRetriever
+        llm = RAGLLM(
+            session_id=ctx.room.name or "default",
+            speculative=SpeculativeRetriever() if SPECULATIVE_RETRIEVAL else None,
+            tracer=tracer,
+        )
+        on_transcript = llm.on_user_transcript
+        ctx.add_shutdown_callback(llm.aclose)
     except Exception as e:
         logger.warning("RAGLLM import failed, falling back to groq LLM: %s", e)
         from livekit.plugins import groq as groq_plugin
         llm = groq_plugin.LLM(model="llama3-70b-8192", api_key=os.getenv("GROQ_API_KEY"))
 
     try:
-        from tts_edge import EdgeTTS
-        tts = EdgeTTS(voice="en-US-AriaNeural")
+        from app.tts_edge import EdgeTTS
+        tts = EdgeTTS(voice=TTS_VOICE, tracer=tracer)
     except Exception as e:
         logger.warning("EdgeTTS import failed: %s", e)
         from livekit.plugins import groq as groq_plugin
         # fallback - no tts if edge unavailable
         tts = None
 
-    assistant = VoiceAssistant(
-        vad=silero.VAD.load(),
+    session = AgentSession(
+        vad=ctx.proc.userdata["vad"],
         stt=groq.STT(
             model="whisper-large-v3",
             api_key=os.getenv("GROQ_API_KEY"),
             language="en",
         ),
         llm=llm,
-        tts=tts,
+        tts=tts if tts is not None else NOT_GIVEN,
         allow_interruptions=True,
-        interrupt_speech_duration=0.5,
-        interrupt_min_words=0,
+        min_interruption_duration=0.5,
+        min_interruption_words=0,
     )
 
-    assistant.start(ctx.room)
+    # Wall-clock end of the user's last utterance, until the agent starts answering it
+    end_of_speech = {"at": None}
 
-    await assistant.say(
-        "Hello! I'm the IST admissions assistant. How can I help you today?",
-        allow_interruptions=True,
+    @session.on("user_state_changed")
+    def _on_user_state(ev) -> None:
+        # A turn starts when the user starts speaking; its clock runs from there
+        if ev.new_state == "speaking":
+            tracer.new_turn()
+            end_of_speech["at"] = None
+        elif ev.old_state == "speaking":
+            tracer.mark("end_of_speech", at=ev.created_at)
+            end_of_speech["at"] = ev.created_at
+
+    @session.on("user_input_transcribed")
+    def _on_transcribed(ev) -> None:
+        if ev.is_final:
+            tracer.mark("transcript_final", at=ev.created_at, once=False)
+        if on_transcript is not None:
+            # Interim transcripts (streaming STT) and each final segment start retrieval early;
+            # with Whisper the final segment still lands before the endpointing delay ends the turn.
+            on_transcript(ev.transcript, ev.is_final)
+
+    @session.on("agent_state_changed")
+    def _on_agent_state(ev) -> None:
+        if ev.new_state == "speaking":
+            tracer.mark("first_audio_played", at=ev.created_at)
+            tracer.finish_turn()
+            if end_of_speech["at"] is not None:
+                metrics.observe("ist_turn_latency_seconds", ev.created_at - end_of_speech["at"])
+                end_of_speech["at"] = None
+
+    await session.start(
+        agent=Agent(instructions="IST admissions voice assistant; replies come from the RAG LLM."),
+        room=ctx.room,
     )
 
+    await session.say(GREETING_MESSAGE, allow_interruptions=True)
+
     await asyncio.sleep(3600)  # keep alive for 1 hour max
 
 
 if __name__ == "__main__":
+    from app.reload import start_watcher
+    from app.warmup import build_indexes, prewarm_audio
+
+    # Register with LiveKit only once the indexes are current; each job process then
+    # prewarms from them before it is handed a room.
+    build_indexes()
+    prewarm_audio()
+    # Later data/ changes are rebuilt here and picked up by job processes without a restart
+    start_watcher()
     cli.run_app(
-        WorkerOptions(entrypoint_fnc=entrypoint)
+        WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm)
     )
\ No newline at end of file
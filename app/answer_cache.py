@@ -0,0 +1,248 @@
+"""Semantic answer cache: reuse a previous non-escalated answer for a near-duplicate question.
+
+A hit needs cosine similarity >= ANSWER_CACHE_THRESHOLD with a cached question AND the same set
+of retrieved chunks, so a paraphrase only reuses an answer grounded in identical context.
+
+Tune the threshold by replaying logged queries:
+    python -m app.answer_cache logs/query_log.jsonl --thresholds 0.85,0.9,0.95
+"""
+import argparse
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+from typing import FrozenSet, List, Optional, Sequence
+
+import numpy as np
+
+from config import ANSWER_CACHE_MAX_ITEMS, ANSWER_CACHE_THRESHOLD, PHONE_REGEX, QUERY_LOG_ENABLED, QUERY_LOG_PATH
+from app.metrics import register_collector
+
+logger = logging.getLogger("ist-agent.answer_cache")
+
+# Follow-ups that lean on earlier turns ("that program", "what about hostels") are never cached
+_HISTORY_REFERENCE = re.compile(
+    r"\b(that|this|those|these|they|them|their|same|above|previous|earlier|mentioned|"
+    r"what about|how about|and for)\b",
+    re.IGNORECASE,
+)
+
+_PHONE_RE = re.compile(PHONE_REGEX)
+
+# Lines for the query log, appended by one writer thread so callers (the event loop) never touch the disk
+_query_log_lines: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+_query_log_writer: Optional[threading.Thread] = None
+_query_log_lock = Lock()
+
+
+def is_cacheable(query: str) -> bool:
+    return bool(query.strip()) and not _HISTORY_REFERENCE.search(query)
+
+
+def redact(query: str) -> str:
+    """The query with Pakistani phone numbers replaced by [phone]."""
+    return _PHONE_RE.sub("[phone]", query)
+
+
+def _write_query_log() -> None:
+    while True:
+        lines = [_query_log_lines.get()]
+        while not _query_log_lines.empty():
+            lines.append(_query_log_lines.get())
+        try:
+            with open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError as e:
+            logger.warning("could not write query log: %s", e)
+
+
+def log_query(query: str, session_id: Optional[str], escalated: bool) -> None:
+    """Queue one turn for the query log replayed by the threshold tuning tool; a no-op unless QUERY_LOG_ENABLED."""
+    global _query_log_writer
+    if not QUERY_LOG_ENABLED:
+        return
+    line = json.dumps({
+        "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "query": redact(query),
+        "session_id": session_id or "",
+        "escalated": escalated,
+    })
+    if _query_log_writer is None:
+        with _query_log_lock:
+            if _query_log_writer is None:
+                _query_log_writer = threading.Thread(target=_write_query_log, name="query-log", daemon=True)
+                _query_log_writer.start()
+    _query_log_lines.put(line + "\n")
+
+
+@dataclass
+class _Entry:
+    query: str
+    embedding: np.ndarray
+    chunk_ids: FrozenSet[str]
+    answer: str
+    llm_ms: float
+
+
+class AnswerCache:
+    """Bounded LRU of answered questions, searched by one matrix-vector product over their embeddings."""
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_items: int = ANSWER_CACHE_MAX_ITEMS) -> None:
+        self.threshold = threshold
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._corpus_version = ""
+        self._lock = Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.ms_saved = 0.0
+
+    def _check_version(self, corpus_version: str) -> None:
+        if corpus_version != self._corpus_version:
+            self._entries.clear()
+            self._matrix = None
+            self._corpus_version = corpus_version
+
+    def _rebuild_matrix(self) -> None:
+        self._keys = list(self._entries)
+        self._matrix = (
+            np.stack([self._entries[k].embedding for k in self._keys]) if self._keys else None
+        )
+
+    def lookup(
+        self, embedding: np.ndarray, chunk_ids: Sequence[str], corpus_version: str
+    ) -> Optional[str]:
+        unit = _unit(embedding)
+        wanted = frozenset(chunk_ids)
+        with self._lock:
+            self._check_version(corpus_version)
+            self.lookups += 1
+            if self._matrix is None:
+                return None
+            sims = self._matrix @ unit
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                entry = self._entries[self._keys[i]]
+                if entry.chunk_ids == wanted:
+                    self._entries.move_to_end(self._keys[i])
+                    self.hits += 1
+                    self.ms_saved += entry.llm_ms
+                    return entry.answer
+        return None
+
+    def store(
+        self,
+        query: str,
+        embedding: np.ndarray,
+        chunk_ids: Sequence[str],
+        answer: str,
+        corpus_version: str,
+        llm_ms: float,
+    ) -> None:
+        key = " ".join(query.lower().split())
+        with self._lock:
+            self._check_version(corpus_version)
+            self._entries[key] = _Entry(query, _unit(embedding), frozenset(chunk_ids), answer, llm_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+            self._rebuild_matrix()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "ms_saved": self.ms_saved,
+        }
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+        cache = _answer_cache
+        register_collector(lambda: {
+            "ist_answer_cache_lookups_total": cache.lookups,
+            "ist_answer_cache_hits_total": cache.hits,
+            "ist_answer_cache_ms_saved_total": cache.ms_saved,
+        })
+    return _answer_cache
+
+
+def _read_queries(path: str) -> List[str]:
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                queries.append(line)
+                continue
+            if isinstance(record, dict) and not record.get("escalated"):
+                queries.append(record.get("query", ""))
+    return [q for q in queries if q]
+
+
+def replay(queries: Sequence[str], thresholds: Sequence[float], show: int = 5) -> None:
+    """
+    Replay queries in order against a fresh cache per threshold. A miss stores the question
+    (its answer stands in for the LLM's), so the hit rate is what production would have seen.
+    Printed pairs show which questions would have shared an answer; check they really should.
+    """
+    from app.rag import get_rag
+
+    rag = get_rag()
+    start = time.perf_counter()
+    retrievals = [(q, rag.retrieve(q)) for q in queries if is_cacheable(q)]
+    print(f"{len(queries)} queries, {len(retrievals)} cacheable, retrieval {time.perf_counter() - start:.1f}s")
+    for threshold in thresholds:
+        cache = AnswerCache(threshold=threshold, max_items=ANSWER_CACHE_MAX_ITEMS)
+        pairs = []
+        for query, r in retrievals:
+            if r.embedding is None:
+                continue
+            hit = cache.lookup(r.embedding, r.chunk_ids, rag.corpus_version)
+            if hit is None:
+                cache.store(query, r.embedding, r.chunk_ids, query, rag.corpus_version, 0.0)
+            elif hit.lower() != query.lower():
+                pairs.append((query, hit))
+        stats = cache.stats()
+        print(f"threshold {threshold:.3f}: hit rate {stats['hit_rate']:.1%} ({stats['hits']}/{stats['lookups']})")
+        for query, cached in pairs[:show]:
+            print(f"    {query!r}  ->  answered as  {cached!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay logged queries to tune ANSWER_CACHE_THRESHOLD")
+    parser.add_argument("queries", nargs="?", default=str(QUERY_LOG_PATH), help="JSONL query log or one query per line")
+    parser.add_argument("--thresholds", default="0.85,0.88,0.9,0.92,0.95")
+    parser.add_argument("--show", type=int, default=5, help="matched pairs to print per threshold")
+    args = parser.parse_args()
+    replay(_read_queries(args.queries), [float(t) for t in args.thresholds.split(",")], show=args.show)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Content-addressed cache of synthesized speech: in-memory LRU in front of an on-disk store.
+
+Lookups and stores are awaited on the event loop. The memory tier is used inline; disk reads,
+writes and pruning run in asyncio.to_thread, so a slow disk cannot hold up other sessions' audio.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from config import AUDIO_CACHE_DIR, AUDIO_CACHE_DISK_ITEMS, AUDIO_CACHE_MEMORY_ITEMS
+from app.cache import LRUCache
+from app.metrics import register_collector
+from app.shared_index import tmp_path
+
+logger = logging.getLogger("ist-agent.audio-cache")
+
+# Prune the disk tier every this many writes rather than listing the directory on each one
+_PRUNE_EVERY = 50
+
+
+def audio_key(text: str, voice: str, rate: str, volume: str) -> str:
+    """Same words with different spacing share an entry; any voice setting change does not."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256("\0".join((normalized, voice, rate, volume)).encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """MP3 bytes by audio_key. Disk entries survive restarts and are shared by all worker processes."""
+
+    def __init__(
+        self,
+        directory: Path = AUDIO_CACHE_DIR,
+        memory_items: int = AUDIO_CACHE_MEMORY_ITEMS,
+        disk_items: int = AUDIO_CACHE_DISK_ITEMS,
+    ) -> None:
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._memory = LRUCache(memory_items, float("inf"))
+        self._disk_items = disk_items
+        self._writes = 0
+        self._lock = Lock()
+        self.disk_hits = 0
+
+    def _path(self, key: str) -> Path:
+        return self._dir / f"{key}.mp3"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Memory tier inline; a memory miss reads the disk tier in a worker thread, off the event loop."""
+        data = self._memory.get(key)
+        if data is not None:
+            return data
+        data = await asyncio.to_thread(self._read, key)
+        if data is None:
+            return None
+        self.disk_hits += 1
+        self._memory.put(key, data)
+        return data
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Memory tier inline; the disk write and any pruning run in a worker thread."""
+        if not data:
+            return
+        self._memory.put(key, data)
+        await asyncio.to_thread(self._write, key, data)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except OSError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp = tmp_path(path)
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("could not write audio cache entry: %s", e)
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Drop the least recently written files beyond disk_items."""
+        files = []
+        for path in self._dir.glob("*.mp3"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        files.sort()
+        for _, path in files[: max(0, len(files) - self._disk_items)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        stats = self._memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+
+_audio_cache: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> AudioCache:
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+        cache = _audio_cache
+
+        def _collect() -> dict:
+            stats = cache.stats()
+            return {
+                "ist_audio_cache_lookups_total": stats["hits"] + stats["misses"],
+                "ist_audio_cache_hits_total": stats["hits"] + stats["disk_hits"],
+            }
+
+        register_collector(_collect)
+    return _audio_cache
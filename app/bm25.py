@@ -0,0 +1,148 @@
+"""Okapi BM25 as a precomputed sparse term-document matrix (same scores as rank_bm25.BM25Okapi)."""
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.shared_index import tmp_path
+
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class SparseBM25:
+    """
+    CSR matrix stored term-major: row t holds the documents containing term t and, as data,
+    the full BM25 term weight idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)).
+    Scoring a query is then a gather of a few rows and one bincount.
+    """
+
+    def __init__(self, vocab: dict, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, n_docs: int) -> None:
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, corpus: Iterable[List[str]], k1: float = K1, b: float = B, epsilon: float = EPSILON) -> "SparseBM25":
+        """corpus: token lists in document order, read once (a generator keeps one document in memory)."""
+        vocab: dict = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_lens: List[int] = []
+        for d, tokens in enumerate(corpus):
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(d)
+                tfs.append(tf)
+        n_docs = len(doc_lens)
+        doc_len = np.asarray(doc_lens, dtype=np.float64)
+
+        t = np.asarray(term_ids, dtype=np.int64)
+        d = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float64)
+        order = np.lexsort((d, t))
+        t, d, tf = t[order], d[order], tf[order]
+
+        df = np.bincount(t, minlength=len(vocab))
+        # rank_bm25: idf = ln(N - n + 0.5) - ln(n + 0.5); negative idf -> epsilon * mean idf
+        idf = np.array([math.log(n_docs - n + 0.5) - math.log(n + 0.5) for n in df.tolist()])
+        if len(idf):
+            idf[idf < 0] = epsilon * (idf.sum() / len(idf))
+
+        avgdl = doc_len.sum() / n_docs if n_docs else 1.0
+        norm = k1 * (1 - b + b * doc_len[d] / avgdl)
+        weights = idf[t] * (tf * (k1 + 1) / (tf + norm))
+
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        return cls(vocab, indptr, d, weights, n_docs)
+
+    def get_scores(self, query_tokens: Sequence[str]) -> np.ndarray:
+        """BM25 score of every document; repeated query tokens count once per occurrence."""
+        rows = [self.vocab[q] for q in query_tokens if q in self.vocab]
+        if not rows:
+            return np.zeros(self.n_docs)
+        cols = np.concatenate([self.indices[self.indptr[r]:self.indptr[r + 1]] for r in rows])
+        vals = np.concatenate([self.weights[self.indptr[r]:self.indptr[r + 1]] for r in rows])
+        return np.bincount(cols, weights=vals, minlength=self.n_docs)
+
+    def get_scores_many(self, queries: Sequence[Sequence[str]]) -> np.ndarray:
+        """get_scores for a batch: one gather and one bincount for all queries, shape (len(queries), n_docs)."""
+        n = len(queries)
+        cols, vals, rows_of = [], [], []
+        for q, tokens in enumerate(queries):
+            for r in (self.vocab[t] for t in tokens if t in self.vocab):
+                lo, hi = self.indptr[r], self.indptr[r + 1]
+                cols.append(self.indices[lo:hi])
+                vals.append(self.weights[lo:hi])
+                rows_of.append(np.full(hi - lo, q, dtype=np.int64))
+        if not cols:
+            return np.zeros((n, self.n_docs))
+        flat = np.concatenate(rows_of) * self.n_docs + np.concatenate(cols)
+        scores = np.bincount(flat, weights=np.concatenate(vals), minlength=n * self.n_docs)
+        return scores.reshape(n, self.n_docs)
+
+    def top_k(self, query_tokens: Sequence[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and scores of the k best documents, best first; ties keep document order."""
+        return _top_k(self.get_scores(query_tokens), k)
+
+    def top_k_many(self, queries: Sequence[Sequence[str]], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """top_k for each query, scored in one batched pass."""
+        return [_top_k(row, k) for row in self.get_scores_many(queries)]
+
+    def save(self, directory: Path, fingerprint: str) -> None:
+        """Write postings as raw .npy arrays so load() can memory-map them (shared page cache)."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ("indptr", "indices", "weights"):
+            tmp = tmp_path(directory / f"{name}.npy")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)))
+            os.replace(tmp, directory / f"{name}.npy")
+        meta = {
+            "terms": sorted(self.vocab, key=self.vocab.get),
+            "n_docs": self.n_docs,
+            "fingerprint": fingerprint,
+        }
+        tmp = tmp_path(directory / "meta.json")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, directory / "meta.json")
+
+    @classmethod
+    def load(cls, directory: Path, fingerprint: str) -> Optional["SparseBM25"]:
+        """Memory-map a saved index, or None if missing or built from a different corpus."""
+        directory = Path(directory)
+        try:
+            meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+            if meta["fingerprint"] != fingerprint:
+                return None
+            arrays = [np.load(directory / f"{name}.npy", mmap_mode="r") for name in ("indptr", "indices", "weights")]
+        except Exception:
+            return None
+        vocab = {term: i for i, term in enumerate(meta["terms"])}
+        return cls(vocab, *arrays, n_docs=int(meta["n_docs"]))
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    # Take everything tied with the k-th score so ties resolve by document order
+    kth = -np.partition(-scores, k - 1)[k - 1]
+    top = np.flatnonzero(scores >= kth)
+    top = top[np.lexsort((top, -scores[top]))][:k]
+    return top, scores[top]
@@ -0,0 +1,69 @@
+"""Barge-in cancellation: a per-reply token that executor threads check, and accounting for the work it saved.
+
+asyncio cancellation stops coroutines (the Groq stream, Edge-TTS sockets) at their next await,
+but not a function already running in run_in_executor. A reply's CPU-bound retrieval therefore
+runs under a CancelToken made current with run_cancellable(); retrieval calls check_cancelled()
+between stages (after the query encode, between rerank batches) and stops there.
+"""
+import contextvars
+import threading
+import time
+from typing import Callable, Optional
+
+from app.metrics import observe
+
+
+class Cancelled(BaseException):
+    """
+    Raised in an executor thread at a stage boundary once its reply was cancelled. A
+    BaseException, like asyncio.CancelledError, so `except Exception` fallbacks (a failed
+    rerank keeps the fused order) do not swallow it.
+    """
+
+
+class CancelToken:
+    """Set once by the event loop when the awaiting coroutine is cancelled; read by the worker thread."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._cancelled_at = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        if not self._event.is_set():
+            self._cancelled_at = time.perf_counter()
+            self._event.set()
+
+    def check(self, stage: str) -> None:
+        if self._event.is_set():
+            observe_stopped(stage, self._cancelled_at)
+            raise Cancelled(stage)
+
+
+_current: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def check_cancelled(stage: str) -> None:
+    """Raise Cancelled if the current thread's reply was cancelled; a no-op outside run_cancellable()."""
+    token = _current.get()
+    if token is not None:
+        token.check(stage)
+
+
+def run_cancellable(token: CancelToken, fn: Callable, *args):
+    """Like tracing.run_in_context, and token is the current cancel token in the executor thread."""
+    ctx = contextvars.copy_context()
+
+    def _run():
+        _current.set(token)
+        return fn(*args)
+
+    return lambda: ctx.run(_run)
+
+
+def observe_stopped(stage: str, cancelled_at: float) -> None:
+    """How long a cancelled stage took to stop after the cancel (a perf_counter() timestamp)."""
+    observe("ist_cancel_seconds", time.perf_counter() - cancelled_at, stage=stage)
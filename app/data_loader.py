@@ -1,10 +1,34 @@
-"""Load and chunk all IST admission data from /data (PDFs and text)."""
+"""Load and chunk all IST admission data from /data (text, JSON and PDF), drop near-duplicate chunks; extract structured facts from the tabular files.
+
+Ingestion is a generator: each file is read and chunked on its own (in a process pool when the
+input is large, e.g. a set of prospectus PDFs) and its chunks are yielded before the next file's
+are collected, so only a few files' chunks are in flight at a time. iter_corpus() keeps that
+with dedup on: it holds one MinHash signature per chunk, not the texts, and chunks data/ twice.
+"""
 import json
+import logging
+import os
 import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import CHUNK_OVERLAP, CHUNK_SIZE, DATA_DIR, DEDUP_ENABLED, DEDUP_THRESHOLD, INGEST_WORKERS
+from app.dedup import dedup_report, dedup_signatures, signature
 
-from config import DATA_DIR
+logger = logging.getLogger("ist-agent.data_loader")
+
+SUPPORTED_SUFFIXES = (".txt", ".json", ".pdf")
+# Below this much input a pool costs more to start (spawned interpreters) than it saves
+INGEST_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+# Strings shorter than this in JSON are labels (titles, table cells outside a table, nav items)
+JSON_MIN_CHARS = 50
+_URL_RE = re.compile(r"^\s*(https?://|www\.)\S*\s*$", re.IGNORECASE)
 
 
 def _read_text_file(path: Path) -> str:
@@ -14,29 +38,66 @@ def _read_text_file(path: Path) -> str:
         return ""
 
 
-def _read_json_file(path: Path) -> List[str]:
-    """Extract text-like content from JSON for RAG (flatten to paragraphs)."""
+def _is_prose(text: str) -> bool:
+    """Not a URL and not a scraped menu ("Home Academics Academics Home ...")."""
+    if _URL_RE.match(text):
+        return False
+    words = text.lower().split()
+    return len(words) >= 5 and len(set(words)) >= 0.3 * len(words)
+
+
+def _json_sections(node: Any, path: str = "") -> Iterator[Tuple[str, str]]:
+    """
+    (path, text) for every prose string at any depth, plus each list of rows (a table) rendered
+    one row per line. path is the slash-joined keys/indices, for traceability.
+    """
+    if isinstance(node, str):
+        text = node.strip()
+        if len(text) >= JSON_MIN_CHARS and _is_prose(text):
+            yield path, text
+    elif isinstance(node, list):
+        if node and all(isinstance(row, list) for row in node):
+            lines = []
+            for row in node:
+                cells = [str(c).strip() for c in row if str(c).strip()]
+                line = " | ".join(cells)
+                if cells and (not lines or line != lines[-1]):
+                    lines.append(line)
+            text = "\n".join(lines)
+            if len(text) >= JSON_MIN_CHARS:
+                yield path, text
+            return
+        for i, item in enumerate(node):
+            yield from _json_sections(item, f"{path}/{i}" if path else str(i))
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            yield from _json_sections(value, f"{path}/{key}" if path else str(key))
+
+
+def _read_json_file(path: Path) -> List[Tuple[str, str]]:
+    """(path within the document, text) sections of a JSON file; [] if it does not parse."""
     try:
         data = json.loads(path.read_text(encoding="utf-8", errors="replace"))
-        texts = []
-        if isinstance(data, dict):
-            for k, v in data.items():
-                if isinstance(v, str) and len(v) > 50:
-                    texts.append(v)
-                elif isinstance(v, list):
-                    for item in v:
-                        if isinstance(item, str) and len(item) > 50:
-                            texts.append(item)
-                        elif isinstance(item, dict):
-                            for v2 in item.values():
-                                if isinstance(v2, str) and len(v2) > 50:
-                                    texts.append(v2)
-        return texts
     except Exception:
         return []
+    return list(_json_sections(data))
 
 
-def chunk_text(text: str, chunk_size: int = 600, overlap: int = 100) -> List[str]:
+def _read_pdf_file(path: Path) -> List[str]:
+    """Text of each page; [] if pypdf is not installed or the file cannot be read."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("pypdf is not installed, skipping %s", path.name)
+        return []
+    try:
+        return [(page.extract_text() or "").strip() for page in PdfReader(str(path)).pages]
+    except Exception as e:
+        logger.warning("could not read %s: %s", path.name, e)
+        return []
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """Split text into overlapping chunks (by characters)."""
     if not text or len(text) <= chunk_size:
         return [text] if text else []
@@ -56,34 +117,369 @@ def chunk_text(text: str, chunk_size: int = 600, overlap: int = 100) -> List[str
     return [c for c in chunks if c]
 
 
-def load_documents() -> List[Tuple[str, str]]:
+def _block_chunks(text: str, source: str) -> List[Tuple[str, str]]:
+    """Split on blank lines, then chunk each block; drops fragments too short to answer anything."""
+    out = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if len(block) < 30:
+            continue
+        for chunk in chunk_text(block):
+            if len(chunk) >= 50:
+                out.append((chunk, source))
+    return out
+
+
+def file_chunks(path: Path) -> List[Tuple[str, str]]:
+    """
+    (text_chunk, source_id) pairs of one file. Runs in a pool worker, so it only returns
+    chunks: the raw file text never crosses back to the parent process.
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".txt":
+        raw = _read_text_file(path)
+        return _block_chunks(raw, path.name) if raw else []
+    if suffix == ".json":
+        out = []
+        for section, text in _read_json_file(path):
+            for chunk in chunk_text(text):
+                if len(chunk) >= 50:
+                    out.append((chunk, f"{path.name}|{section}"))
+        return out
+    if suffix == ".pdf":
+        out = []
+        for number, page in enumerate(_read_pdf_file(path), 1):
+            out.extend(_block_chunks(page, f"{path.name}|p{number}"))
+        return out
+    return []
+
+
+def iter_documents(data_dir: Path = DATA_DIR, workers: int = INGEST_WORKERS) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (text_chunk, source_id) file by file, in file name order. With more than one worker
+    and at least INGEST_PARALLEL_MIN_BYTES of input, files are chunked in a process pool with
+    at most 2 files per worker in flight; the output is the same as the serial order.
+    """
+    data_path = Path(data_dir)
+    if not data_path.exists():
+        return
+    paths = [p for p in sorted(data_path.iterdir()) if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1 or sum(p.stat().st_size for p in paths) < INGEST_PARALLEL_MIN_BYTES:
+        for path in paths:
+            yield from file_chunks(path)
+        return
+    # spawn, not fork: the parent may already hold the embedding model and its threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending: Deque[Future] = deque()
+        queued = iter(paths)
+        for path in queued:
+            pending.append(pool.submit(file_chunks, path))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            chunks = pending.popleft().result()
+            path = next(queued, None)
+            if path is not None:
+                pending.append(pool.submit(file_chunks, path))
+            yield from chunks
+
+
+def load_documents(dedup: bool = DEDUP_ENABLED) -> List[Tuple[str, str]]:
     """
     Load all documents from DATA_DIR. Returns list of (text_chunk, source_id).
-    source_id is filename or 'filename|section' for traceability.
+    source_id is filename, 'filename|json/path' or 'filename|p<page>' for traceability.
+    With dedup, near-duplicate chunks are dropped (see load_corpus).
+    """
+    return load_corpus(dedup)[0]
+
+
+def iter_corpus(dedup: bool = DEDUP_ENABLED, data_dir: Path = DATA_DIR) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Yield (text_chunk, source_id, also_in) in iter_documents() order: also_in holds the other
+    sources whose near-duplicate chunks were merged into this one (empty without dedup).
+
+    Dedup needs every chunk before it can decide (the longest of a cluster is kept), so it
+    takes two passes over data/: the first keeps only a signature, length and source per
+    chunk, the second yields the kept chunks. Texts are never all in memory at once.
+    """
+    if not dedup:
+        for text, source in iter_documents(data_dir):
+            yield text, source, []
+        return
+    sigs, lengths, sources = [], [], []
+    for text, source in iter_documents(data_dir):
+        # MinHash values are the high 32 bits of a 64-bit hash: uint32 holds them exactly
+        sigs.append(signature(text).astype(np.uint32))
+        lengths.append(len(text))
+        sources.append(source)
+    if not sigs:
+        return
+    canonical, also_in, _ = dedup_signatures(np.stack(sigs), lengths, sources, DEDUP_THRESHOLD)
+    del sigs
+    logger.info("%s", dedup_report(DEDUP_THRESHOLD, lengths, sources, canonical).summary())
+    changed = "data/ changed between the two ingest passes; rebuild once it is stable"
+    count = 0
+    for i, (text, source) in enumerate(iter_documents(data_dir)):
+        if i >= len(lengths) or len(text) != lengths[i] or source != sources[i]:
+            raise RuntimeError(changed)
+        count = i + 1
+        if i not in canonical:
+            yield text, source, also_in.get(i, [])
+    if count != len(lengths):
+        raise RuntimeError(changed)
+
+
+def load_corpus(dedup: bool = DEDUP_ENABLED) -> Tuple[List[Tuple[str, str]], List[List[str]]]:
+    """
+    (text_chunk, source_id) pairs as load_documents, plus for each chunk the other sources whose
+    near-duplicate chunks were merged into it (empty lists without dedup). A list of the whole
+    corpus, for tools and benchmarks; the index build streams iter_corpus() instead.
+    """
+    documents, also_in = [], []
+    for text, source, merged in iter_corpus(dedup):
+        documents.append((text, source))
+        also_in.append(merged)
+    return documents, also_in
+
+
+# --- Structured facts (program x attribute) for the direct-answer path in app.facts ---
+
+# Canonical BS program -> spoken name and the phrases that refer to it (matched whole-word, longest first)
+PROGRAMS = {
+    "aerospace": ("BS Aerospace Engineering", ("aerospace", "aeronautics", "astronautics")),
+    "electrical": ("BS Electrical Engineering", ("electrical",)),
+    "mechanical": ("BS Mechanical Engineering", ("mechanical",)),
+    "avionics": ("BS Avionics Engineering", ("avionics",)),
+    "materials": ("BS Materials Science and Engineering", ("materials science", "material science", "materials")),
+    "computer_science": ("BS Computer Science", ("computer science", "bscs", "cs")),
+    "software": ("BS Software Engineering", ("software engineering", "software")),
+    "ai": ("BS Artificial Intelligence", ("artificial intelligence", "ai")),
+    "data_science": ("BS Data Science", ("data science", "ds")),
+    "computer_engineering": ("BS Computer Engineering", ("computer engineering",)),
+    "space_science": ("BS Space Science", ("space science",)),
+    "mathematics": ("BS Mathematics", ("mathematics", "maths", "math")),
+    "physics": ("BS Physics", ("physics",)),
+    "biotechnology": ("BS Biotechnology", ("biotechnology", "biotech")),
+}
+_ALIASES = sorted(
+    ((alias, key) for key, (_, aliases) in PROGRAMS.items() for alias in aliases),
+    key=lambda a: -len(a[0]),
+)
+_PROGRAM_RE = re.compile(r"\b(" + "|".join(re.escape(a) for a, _ in _ALIASES) + r")\b", re.IGNORECASE)
+_ALIAS_TO_PROGRAM = dict(_ALIASES)
+
+_RUPEES_RE = re.compile(r"(?:(\d+)\s*lakh)?\s*(?:(\d+)\s*thousand)?", re.IGNORECASE)
+_YEAR_MERIT_RE = re.compile(r"\b(20\d\d):\s*(\d+(?:\.\d+)?)")
+
+FACT_FILES = (
+    "FEE_STRUCTURE.txt",
+    "CLOSING_MERIT_HISTORY.txt",
+    "ADMISSION_DATES_AND_STATUS.txt",
+    "MERIT_CRITERIA_AND_AGGREGATE.txt",
+    "99_MASTER_JSON.json",
+)
+
+
+@dataclass
+class Fact:
+    """
+    One value for one program, a program group ("engineering", "non_engineering") or "*" for
+    every program at that level, with the line it came from.
+    """
+
+    attribute: str
+    value: Any
+    source: str
+    program: str = "*"
+    level: str = "BS"
+    text: str = ""
+
+
+def find_programs(text: str) -> List[str]:
+    """Canonical program keys mentioned in text, in order of first mention, without repeats."""
+    found: List[str] = []
+    for m in _PROGRAM_RE.finditer(text):
+        key = _ALIAS_TO_PROGRAM[m.group(1).lower()]
+        if key not in found:
+            found.append(key)
+    return found
+
+
+def parse_rupees(text: str) -> Optional[int]:
+    """First "N lakh M thousand" / "N thousand" amount in text, in rupees."""
+    for m in _RUPEES_RE.finditer(text):
+        lakh, thousand = m.group(1), m.group(2)
+        if lakh or thousand:
+            return int(lakh or 0) * 100_000 + int(thousand or 0) * 1_000
+    return None
+
+
+def _fee_facts(text: str, source: str) -> List[Fact]:
+    facts: List[Fact] = []
+    level, period = "BS", "semester"
+    for line in (ln.strip() for ln in text.splitlines()):
+        if not line:
+            continue
+        upper = line.split(":", 1)[0]
+        if upper.startswith("MS PROGRAMS") or upper.startswith("PhD PROGRAMS"):
+            level = "MS" if upper.startswith("MS") else "PhD"
+            amount = parse_rupees(line)
+            if amount:
+                facts.append(Fact("fee", {"amount": amount, "period": "year"}, source, level=level, text=line))
+            continue
+        if upper.startswith("BS PROGRAMS"):
+            level, period = "BS", "year" if "PER YEAR" in upper else "semester"
+            continue
+        if upper.startswith("ONE-TIME CHARGES"):
+            continue
+        lower = line.lower()
+        if lower.startswith("admission fee:") and "one-time" in lower:
+            total = re.search(r"total one-time:\s*([^.]*)", line, re.IGNORECASE)
+            amount = parse_rupees(total.group(1)) if total else None
+            if amount:
+                facts.append(Fact("one_time_fee", {"amount": amount}, source, text=line))
+            # The admission fee alone, the first of the one-time charges
+            own = re.match(r"admission fee:\s*([^.]*)", line, re.IGNORECASE)
+            amount = parse_rupees(own.group(1)) if own else None
+            if amount:
+                facts.append(Fact("admission_fee", {"amount": amount}, source, text=line))
+            continue
+        challan = re.search(r"last date to submit challan[^.]*? is (\d{1,2} \w+ \d{4})", line, re.IGNORECASE)
+        if challan:
+            facts.append(Fact("fee_deadline", {"date": challan.group(1)}, source, text=line))
+            continue
+        if level != "BS" or ":" not in line:
+            continue
+        # "Department of X (programs): About N per semester." - programs named before the colon
+        head, body = line.split(":", 1)
+        amount = parse_rupees(body)
+        if not amount:
+            continue
+        for program in find_programs(head):
+            facts.append(Fact("fee", {"amount": amount, "period": period}, source, program=program, text=line))
+        # "BS Space Science, BS Mathematics, BS Biotechnology: same, 1 lakh 2 thousand per semester."
+        for sentence in body.split(". ")[1:]:
+            if ":" in sentence and parse_rupees(sentence.split(":", 1)[1]):
+                for program in find_programs(sentence.split(":", 1)[0]):
+                    facts.append(Fact(
+                        "fee", {"amount": parse_rupees(sentence.split(":", 1)[1]), "period": period},
+                        source, program=program, text=sentence.strip(),
+                    ))
+    return facts
+
+
+def _merit_history_facts(text: str, source: str) -> List[Fact]:
+    facts: List[Fact] = []
+    formula = ""
+    program: Optional[str] = None
+    for line in (ln.strip() for ln in text.splitlines()):
+        section = re.match(r"^[A-Z -]+\(Merit = ([^)]*)\):$", line)
+        if section:
+            formula = section.group(1)
+            continue
+        heading = re.match(r"^BS ([^:]+):\s*(.*)$", line)
+        if heading:
+            programs = find_programs(heading.group(1))
+            program = programs[0] if len(programs) == 1 else None
+            note = re.search(r'say: "([^"]+)"', heading.group(2))
+            if program and note:
+                facts.append(Fact("closing_merit", {"years": {}, "note": note.group(1)}, source, program=program, text=line))
+                program = None
+            continue
+        years = _YEAR_MERIT_RE.findall(line)
+        if program and years:
+            facts.append(Fact(
+                "closing_merit",
+                {"years": {y: float(v) for y, v in years}, "formula": formula},
+                source, program=program, text=line,
+            ))
+            program = None
+    return facts
+
+
+_DATE_LABELS = {
+    "application opening": "admissions_open",
+    "application closing / last date to apply": "last_date",
+    "first merit list display": "merit_list",
+    "classes commencement": "classes_start",
+}
+
+
+def _dates_facts(text: str, source: str) -> List[Fact]:
+    facts: List[Fact] = []
+    for line in (ln.strip() for ln in text.splitlines()):
+        item = re.match(r"^- ([^:]+):\s*(.+?)\.?$", line)
+        if item and item.group(1).lower() in _DATE_LABELS:
+            facts.append(Fact(_DATE_LABELS[item.group(1).lower()], {"when": item.group(2)}, source, text=line))
+        elif line.startswith("Phone:"):
+            phone = re.search(r"Phone:\s*([\d ]+?)\s*\(main\)", line)
+            email = re.search(r"[\w.]+@[\w.]+\w", line)
+            if phone:
+                facts.append(Fact("admissions_phone", {"phone": phone.group(1)}, source, text=line))
+            if email:
+                facts.append(Fact("admissions_email", {"email": email.group(0)}, source, text=line))
+    return facts
+
+
+def _criteria_facts(text: str, source: str) -> List[Fact]:
+    facts: List[Fact] = []
+    category = None
+    for line in (ln.strip() for ln in text.splitlines()):
+        if line.startswith("2) Engineering programs"):
+            category = "engineering"
+        elif line.startswith("3) Non-engineering programs"):
+            category = "non_engineering"
+        elif line.startswith("4)"):
+            category = None
+        elif category and line.startswith("- Aggregate formula"):
+            formula = re.search(r"So ([^.]+)\.", line)
+            if formula:
+                facts.append(Fact("merit_formula", {"weights": formula.group(1)}, source, program=category, text=line))
+        elif category == "engineering" and line.startswith("- Eligibility"):
+            rule = line.split(":", 1)[1].strip().rstrip(".")
+            facts.append(Fact("eligibility", {"rule": rule}, source, program=category, text=line))
+    return facts
+
+
+def _offered_facts(path: Path) -> List[Fact]:
+    """Programs with a page on the website (categories.programs), as "offered" at their level."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8", errors="replace"))
+    except Exception:
+        return []
+    facts: List[Fact] = []
+    seen = set()
+    for url in data.get("categories", {}).get("programs", []):
+        section = re.search(r"section=(bs|ms|phd)-([a-z-]+)", url)
+        if not section:
+            continue
+        level = {"bs": "BS", "ms": "MS", "phd": "PhD"}[section.group(1)]
+        for program in find_programs(section.group(2).replace("-", " ")):
+            if (level, program) not in seen:
+                seen.add((level, program))
+                facts.append(Fact("offered", {"url": url}, path.name, program=program, level=level, text=url))
+    return facts
+
+
+def extract_facts() -> List[Fact]:
+    """
+    Structured facts from the tabular admission files (FACT_FILES). Anything a parser does not
+    recognize is skipped, so those questions keep going through retrieval and the LLM.
     """
-    documents: List[Tuple[str, str]] = []
     data_path = Path(DATA_DIR)
-    if not data_path.exists():
-        return documents
-
-    for path in sorted(data_path.iterdir()):
-        if path.suffix.lower() == ".txt":
-            raw = _read_text_file(path)
-            if not raw:
-                continue
-            # Split by double newlines or long blocks for better chunks
-            blocks = re.split(r"\n\s*\n", raw)
-            for block in blocks:
-                block = block.strip()
-                if len(block) < 30:
-                    continue
-                for chunk in chunk_text(block, chunk_size=600, overlap=100):
-                    if len(chunk) >= 50:
-                        documents.append((chunk, path.name))
-        elif path.suffix.lower() == ".json":
-            for i, text in enumerate(_read_json_file(path)):
-                for chunk in chunk_text(text, chunk_size=600, overlap=100):
-                    if len(chunk) >= 50:
-                        documents.append((chunk, f"{path.name}|{i}"))
-
-    return documents
+    parsers = {
+        "FEE_STRUCTURE.txt": _fee_facts,
+        "CLOSING_MERIT_HISTORY.txt": _merit_history_facts,
+        "ADMISSION_DATES_AND_STATUS.txt": _dates_facts,
+        "MERIT_CRITERIA_AND_AGGREGATE.txt": _criteria_facts,
+    }
+    facts: List[Fact] = []
+    for name, parse in parsers.items():
+        text = _read_text_file(data_path / name)
+        if text:
+            facts.extend(parse(text, name))
+    master = data_path / "99_MASTER_JSON.json"
+    if master.exists():
+        facts.extend(_offered_facts(master))
+    return facts
@@ -0,0 +1,181 @@
+"""Near-duplicate chunk elimination at ingest: MinHash signatures over word shingles, LSH banding, one canonical chunk per cluster.
+
+The site dumps in data/ (WEBSITE_FULL, IST_FULL_WEBSITE_MANUAL, 03_ABOUT, 99_MASTER_JSON) repeat
+much of the same text. Chunks whose estimated Jaccard similarity to an already kept chunk is at
+least DEDUP_THRESHOLD are dropped; the kept chunk records the sources of the ones it replaced.
+
+    python -m app.dedup [--threshold 0.8] [--examples 5]
+"""
+import argparse
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import DEDUP_THRESHOLD
+
+NUM_PERM = 128
+SHINGLE_WORDS = 3
+# Multiply-shift hash per permutation: high 32 bits of (a*x + b) mod 2^64, a odd. uint64 arrays wrap.
+_rng = np.random.RandomState(1)
+_A = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """CRC32 of each run of `size` consecutive lowercase words (the whole text if shorter)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    # crc32 rather than hash(): signatures must not depend on PYTHONHASHSEED
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def signature(text: str) -> np.ndarray:
+    """NUM_PERM-value MinHash of the text's shingle set."""
+    x = shingles(text)
+    return ((np.outer(_A, x) + _B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+def _bands_for(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """(bands, rows) whose LSH S-curve midpoint (1/b)^(1/r) is just below threshold, so few true pairs are missed."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold - 0.1:
+            best = (bands, rows)
+    return best
+
+
+@dataclass
+class DedupReport:
+    threshold: float
+    chunks_before: int = 0
+    chunks_after: int = 0
+    chars_before: int = 0
+    chars_after: int = 0
+    # source file -> chunks dropped from it
+    dropped_by_file: Dict[str, int] = field(default_factory=dict)
+    # (kept source, dropped source, similarity, kept text) for the largest clusters
+    examples: List[Tuple[str, str, float, str]] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines = [
+            f"near-duplicate threshold {self.threshold:g}: {self.chunks_before} -> {self.chunks_after} chunks "
+            f"(-{self.chunks_before - self.chunks_after}, {self._pct(self.chunks_before, self.chunks_after)}), "
+            f"{self.chars_before} -> {self.chars_after} chars ({self._pct(self.chars_before, self.chars_after)})",
+        ]
+        for name, n in sorted(self.dropped_by_file.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {name:<40} {n:>5} dropped")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _pct(before: int, after: int) -> str:
+        return f"-{100.0 * (before - after) / before:.1f}%" if before else "-0.0%"
+
+
+def dedup_signatures(
+    sigs: np.ndarray, lengths: Sequence[int], sources: Sequence[str], threshold: float = DEDUP_THRESHOLD
+) -> Tuple[Dict[int, int], Dict[int, List[str]], Dict[int, float]]:
+    """
+    The dedup decision from one signature, length and source per chunk, without the texts:
+    (dropped index -> kept index, kept index -> sources merged into it, dropped index -> similarity).
+
+    Longer chunks are considered first, so a cluster is represented by its most complete
+    text. A chunk is compared only against kept chunks (not against other dropped ones), so
+    similarity does not chain across a cluster.
+    """
+    bands, rows = _bands_for(threshold)
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+    canonical: Dict[int, int] = {}  # dropped index -> kept index
+    also_in: Dict[int, List[str]] = {}
+    similarity: Dict[int, float] = {}
+
+    for i in sorted(range(len(lengths)), key=lambda j: (-lengths[j], j)):
+        keys = [sigs[i, b * rows:(b + 1) * rows].tobytes() for b in range(bands)]
+        candidates = {k for b, key in enumerate(keys) for k in buckets[b].get(key, ())}
+        best, best_sim = -1, 0.0
+        for k in candidates:
+            sim = float(np.count_nonzero(sigs[i] == sigs[k])) / NUM_PERM
+            if sim > best_sim or (sim == best_sim and k < best):
+                best, best_sim = k, sim
+        if best >= 0 and best_sim >= threshold:
+            canonical[i] = best
+            similarity[i] = best_sim
+            merged = also_in.setdefault(best, [])
+            if sources[i] != sources[best] and sources[i] not in merged:
+                merged.append(sources[i])
+            continue
+        for b, key in enumerate(keys):
+            buckets[b].setdefault(key, []).append(i)
+    return canonical, also_in, similarity
+
+
+def dedup_report(
+    threshold: float, lengths: Sequence[int], sources: Sequence[str], canonical: Dict[int, int]
+) -> DedupReport:
+    """Chunk and character counts before and after, and drops per file (no examples)."""
+    report = DedupReport(threshold, chunks_before=len(lengths), chars_before=sum(lengths))
+    for i in canonical:
+        name = sources[i].split("|", 1)[0]
+        report.dropped_by_file[name] = report.dropped_by_file.get(name, 0) + 1
+    report.chunks_after = len(lengths) - len(canonical)
+    report.chars_after = report.chars_before - sum(lengths[i] for i in canonical)
+    return report
+
+
+def dedup_documents(
+    documents: Sequence[Tuple[str, str]], threshold: float = DEDUP_THRESHOLD
+) -> Tuple[List[Tuple[str, str]], List[List[str]], DedupReport]:
+    """
+    Drop near-duplicate (text, source) chunks. Returns the kept chunks in their original order,
+    per kept chunk the sources of the chunks merged into it, and a report with examples of the
+    largest clusters. See dedup_signatures for which chunk of a cluster is kept.
+    """
+    lengths = [len(t) for t, _ in documents]
+    sources = [s for _, s in documents]
+    if not documents:
+        return [], [], dedup_report(threshold, lengths, sources, {})
+    sigs = np.stack([signature(text) for text, _ in documents])
+    canonical, also_in, similarity = dedup_signatures(sigs, lengths, sources, threshold)
+    report = dedup_report(threshold, lengths, sources, canonical)
+
+    kept: List[Tuple[str, str]] = []
+    kept_also_in: List[List[str]] = []
+    for i, doc in enumerate(documents):
+        if i not in canonical:
+            kept.append(doc)
+            kept_also_in.append(also_in.get(i, []))
+    sizes: Dict[int, int] = {}
+    for k in canonical.values():
+        sizes[k] = sizes.get(k, 0) + 1
+    for k in sorted(sizes, key=lambda k: (-sizes[k], k))[:10]:
+        i = next(j for j, c in canonical.items() if c == k)
+        report.examples.append((documents[k][1], documents[i][1], similarity[i], documents[k][0]))
+    return kept, kept_also_in, report
+
+
+def main() -> None:
+    from app.data_loader import load_documents
+
+    parser = argparse.ArgumentParser(description="Report how much near-duplicate elimination shrinks the corpus")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    parser.add_argument("--examples", type=int, default=5, help="largest clusters to show")
+    args = parser.parse_args()
+
+    _, _, report = dedup_documents(load_documents(dedup=False), args.threshold)
+    print(report.summary())
+    for kept, dropped, sim, text in report.examples[:args.examples]:
+        print(f"\n[{sim:.2f}] kept {kept}, dropped e.g. {dropped}\n  {text[:160]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Local embedding service: one process holds the model and encodes for every job process.
+
+Run next to the agent worker: python -m app.embed_service
+Job processes use it when EMBED_SERVICE_ADDRESS points at the same Unix socket path.
+"""
+import logging
+import os
+import threading
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from config import EMBED_SERVICE_ADDRESS
+from app.embeddings import load_local_embedder, service_authkey
+
+logger = logging.getLogger("ist-agent.embed-service")
+
+
+def _handle(conn, model, lock: threading.Lock) -> None:
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "ping":
+                conn.send("pong")
+            elif message[0] == "encode":
+                _, texts, batch_size = message
+                with lock:
+                    embeddings = model.encode(texts, batch_size=batch_size)
+                conn.send(np.asarray(embeddings, dtype=np.float32))
+
+
+def serve(address: str = EMBED_SERVICE_ADDRESS) -> None:
+    if not address:
+        raise SystemExit("EMBED_SERVICE_ADDRESS is not set")
+    model = load_local_embedder()
+    model.encode(["warm up"])
+    lock = threading.Lock()
+    if os.path.exists(address):
+        os.unlink(address)
+    with Listener(address, authkey=service_authkey()) as listener:
+        os.chmod(address, 0o600)
+        logger.info("embedding service listening on %s", address)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # Failed handshake (wrong authkey) must not take the service down
+                logger.warning("rejected connection: %s", e)
+                continue
+            threading.Thread(target=_handle, args=(conn, model, lock), daemon=True).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
@@ -0,0 +1,198 @@
+"""Embedding backends: in-process SentenceTransformer or ONNX Runtime, the shared local embedding service, or an offline hashing stub."""
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+from multiprocessing.connection import Client
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from config import (
+    CHROMA_PERSIST_DIR,
+    EMBED_SERVICE_ADDRESS,
+    EMBED_SERVICE_AUTHKEY,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_INT8,
+    EMBEDDING_ONNX_THREADS,
+)
+
+logger = logging.getLogger("ist-agent.embeddings")
+
+_AUTHKEY_PATH = CHROMA_PERSIST_DIR / "embed_service.key"
+
+
+def service_authkey() -> bytes:
+    """EMBED_SERVICE_AUTHKEY, or a random key shared through a 0600 file next to the indexes."""
+    if EMBED_SERVICE_AUTHKEY:
+        return EMBED_SERVICE_AUTHKEY.encode("utf-8")
+    try:
+        fd = os.open(_AUTHKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _AUTHKEY_PATH.read_bytes()
+    key = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+class RemoteEmbedder:
+    """
+    Client for app.embed_service; exposes the subset of SentenceTransformer.encode we use.
+    One connection per thread, re-established once if the service restarted.
+    """
+
+    def __init__(self, address: str = EMBED_SERVICE_ADDRESS) -> None:
+        self._address = address
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self._address, authkey=service_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _call(self, message: tuple):
+        for attempt in range(2):
+            try:
+                conn = self._conn()
+                conn.send(message)
+                return conn.recv()
+            except (EOFError, OSError):
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def ping(self) -> bool:
+        try:
+            return self._call(("ping",)) == "pong"
+        except Exception:
+            return False
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self._call(("encode", list(texts), batch_size))
+
+
+class HashingEmbedder:
+    """
+    Offline stand-in for the sentence model: each word and word bigram is hashed into one of
+    `dim` buckets, counts are L2-normalized. No semantics beyond shared words, but deterministic
+    and instant, so benchmarks and CI run without the model cached.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> int:
+        return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little") % self.dim
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                out[row, self._bucket(feature)] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+class OnnxEmbedder:
+    """
+    EMBEDDING_MODEL as exported by app.onnx_export, run on ONNX Runtime: the same tokenizer,
+    truncation, mean pooling and L2 normalization as the sentence-transformers pipeline, without
+    importing PyTorch. Texts are sorted by length before batching so little padding is encoded.
+    """
+
+    def __init__(
+        self,
+        directory: Path = EMBEDDING_ONNX_DIR,
+        quantized: bool = EMBEDDING_ONNX_INT8,
+        threads: int = EMBEDDING_ONNX_THREADS,
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        directory = Path(directory)
+        try:
+            meta = json.loads((directory / "export.json").read_text(encoding="utf-8"))
+        except OSError as e:
+            raise RuntimeError(f"no ONNX export in {directory}; run python -m app.onnx_export") from e
+        if meta["model"] != EMBEDDING_MODEL:
+            raise RuntimeError(f"ONNX export in {directory} is {meta['model']}, not {EMBEDDING_MODEL}")
+        self.normalize = meta["normalize"]
+        self.dim = meta["dim"]
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_path = directory / ("model_int8.onnx" if quantized else "model.onnx")
+        self._session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_file(str(directory / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=meta["max_seq_length"])
+        self._tokenizer.enable_padding(pad_id=meta["pad_id"], pad_token=meta["pad_token"])
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            encodings = self._tokenizer.encode_batch([texts[i] for i in rows])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            hidden = self._session.run(None, feeds)[0]
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            out[rows] = pooled
+        return out
+
+
+def embedder_id() -> str:
+    """Identifies the vector space; indexes built under a different id are re-embedded."""
+    if EMBEDDING_BACKEND == "hashing":
+        return "hashing-384"
+    if EMBEDDING_BACKEND == "onnx" and EMBEDDING_ONNX_INT8:
+        # fp32 ONNX matches PyTorch to float error and shares its index; int8 vectors drift slightly
+        return f"{EMBEDDING_MODEL}+onnx-int8"
+    return EMBEDDING_MODEL
+
+
+def load_local_embedder():
+    """EMBEDDING_MODEL in this process: on ONNX Runtime if EMBEDDING_BACKEND is "onnx", else PyTorch."""
+    if EMBEDDING_BACKEND == "onnx":
+        return OnnxEmbedder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def load_embedder():
+    """
+    The hashing stub if EMBEDDING_BACKEND is "hashing"; otherwise the embedding service when
+    EMBED_SERVICE_ADDRESS is set and reachable, else the local model.
+    """
+    if EMBEDDING_BACKEND == "hashing":
+        return HashingEmbedder()
+    if EMBEDDING_BACKEND not in ("sentence-transformers", "onnx"):
+        raise ValueError(f"unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    if EMBED_SERVICE_ADDRESS:
+        remote = RemoteEmbedder(EMBED_SERVICE_ADDRESS)
+        if remote.ping():
+            return remote
+        logger.warning("embedding service at %s unreachable; loading model in-process", EMBED_SERVICE_ADDRESS)
+    return load_local_embedder()
@@ -0,0 +1,308 @@
+"""Direct answers for fee, closing merit, date and merit-formula questions from the structured facts, without retrieval or the LLM.
+
+The facts are extracted from data/ by app.data_loader.extract_facts() and cached as facts.json
+in the data fingerprint's index generation directory. FactStore.answer() matches one intent and the program or degree level it
+needs; anything ambiguous, conversational or not covered returns None and goes through RAG.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.answer_cache import is_cacheable
+from app.data_loader import PROGRAMS, Fact, extract_facts, find_programs
+from app.lead_capture import extract_pakistani_phone
+from app.shared_index import data_fingerprint, generation_dir, tmp_path
+
+logger = logging.getLogger("ist-agent.facts")
+
+FACTS_VERSION = 2
+# Longer questions usually carry conditions ("if I have 80% in FSC...") the templates cannot honor
+MAX_QUERY_WORDS = 25
+
+_LEVEL_RE = re.compile(r"\b(ms|mphil|masters?|phd|ph\.d|doctorate|bs|bachelors?|undergraduate)\b", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b(20\d\d)\b")
+_PERIOD_RE = re.compile(r"\b(per (year|annum|semester)|(?:a|each|every) (year|semester)|annual(?:ly)?|yearly)\b", re.IGNORECASE)
+# A question naming one program next to a conjunction probably names another we did not recognize
+_CONJUNCTION_RE = re.compile(r"\b(and|or|vs|versus)\b|[&,/]", re.IGNORECASE)
+_PROGRAM_ALT = "|".join(sorted(
+    (re.escape(alias) for _, aliases in PROGRAMS.values() for alias in aliases), key=len, reverse=True
+))
+
+# intent -> pattern; a question must match exactly one
+_INTENTS: Dict[str, re.Pattern] = {
+    "fee": re.compile(r"\b(fees?|tuition|cost|charges|how much)\b", re.IGNORECASE),
+    "closing_merit": re.compile(
+        r"\b(closing merit|last merit|merit (?:of|for)|cut ?off|last year'?s merit|previous merit|merit (?:was|in) 20\d\d)\b",
+        re.IGNORECASE,
+    ),
+    "dates": re.compile(
+        r"\b(last date|deadline|when\b.*\b(?:open|start|close|merit list|classes)|merit list\b.*\bwhen)\b",
+        re.IGNORECASE,
+    ),
+    "merit_formula": re.compile(r"\b(aggregate|merit (?:formula|criteria|calculat\w*)|how is merit)\b", re.IGNORECASE),
+    "contact": re.compile(r"\b(phone|contact number|helpline|email address|e-mail)\b", re.IGNORECASE),
+    # Only when the program is the whole object: "do you offer BS physics?", not "is there a lab for physics?"
+    "offered": re.compile(
+        r"^(?:(?:does ist|does the institute|do you|do they)\s+(?:offer|have)\s+"
+        r"(?:an?\s+)?(?:(?:bs|ms|mphil|phd|bachelors?|masters?)(?:\s+(?:in|of))?\s+)?"
+        rf"(?:{_PROGRAM_ALT})(?:\s+engineering)?(?:\s+(?:program|programme|degree)s?)?"
+        r"|is\s+there\s+(?:an?\s+)?(?:(?:bs|ms|mphil|phd|bachelors?|masters?)(?:\s+(?:in|of))?\s+)?"
+        rf"(?:{_PROGRAM_ALT})(?:\s+engineering)?\s+(?:program|programme|degree)"
+        rf"|is\s+(?:(?:bs|ms|mphil|phd)\s+)?(?:{_PROGRAM_ALT})(?:\s+engineering)?\s+offered)"
+        r"(?:\s+(?:at\s+ist|here))?\s*[?.!]*$",
+        re.IGNORECASE,
+    ),
+}
+# Questions that need judgment, arithmetic on the caller's marks, or today's date stay with the LLM
+_NEEDS_LLM = re.compile(
+    r"\b(will i|get admission|chances?|increase|decrease|go up|go down|trend|predict|my|i got|i have|"
+    r"scholarship|refund|installment|hostel|transport|are admissions open|is admission open|"
+    # Fees other than tuition and the admission charges are not in the facts
+    r"application|processing|entry test|test fee|form)\b",
+    re.IGNORECASE,
+)
+_MONTHS = {"january", "february", "march", "april", "may", "june", "july", "august",
+           "september", "october", "november", "december"}
+_ENGINEERING = {"aerospace", "electrical", "mechanical", "avionics", "materials", "computer_science",
+                "software", "ai", "data_science", "computer_engineering"}
+
+
+def spoken_rupees(amount: int) -> str:
+    """148000 -> "1 lakh 48 thousand rupees" (the style FEE_STRUCTURE.txt asks for)."""
+    lakh, rest = divmod(int(amount), 100_000)
+    thousand = rest // 1000
+    parts = []
+    if lakh:
+        parts.append(f"{lakh} lakh")
+    if thousand:
+        parts.append(f"{thousand} thousand")
+    return " ".join(parts or [str(amount)]) + " rupees"
+
+
+def _period(query: str) -> Optional[str]:
+    """"year" or "semester" if the question asks for the fee per one of them."""
+    m = _PERIOD_RE.search(query)
+    if m is None:
+        return None
+    word = (m.group(2) or m.group(3) or "year").lower()
+    return "semester" if word == "semester" else "year"
+
+
+def _level(query: str) -> Optional[str]:
+    levels = set()
+    for m in _LEVEL_RE.finditer(query):
+        word = m.group(1).lower().replace(".", "")
+        levels.add("MS" if word in ("ms", "mphil", "master", "masters") else "PhD" if word in ("phd", "doctorate") else "BS")
+    return levels.pop() if len(levels) == 1 else None
+
+
+class FactStore:
+    """Facts indexed by (attribute, level, program); program "*" applies to the whole level."""
+
+    def __init__(self, facts: List[Fact], fingerprint: str = "") -> None:
+        self.fingerprint = fingerprint
+        self._facts: Dict[Tuple[str, str, str], Fact] = {}
+        for fact in facts:
+            self._facts[(fact.attribute, fact.level, fact.program)] = fact
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def get(self, attribute: str, level: str = "BS", program: str = "*") -> Optional[Fact]:
+        return self._facts.get((attribute, level, program))
+
+    def answer(self, query: str) -> Optional[str]:
+        query = query.strip()
+        if not query or len(query.split()) > MAX_QUERY_WORDS or not is_cacheable(query) or _NEEDS_LLM.search(query):
+            return None
+        if extract_pakistani_phone(query):
+            return None  # the caller is leaving a number; the LLM turn handles the callback
+        intents = [name for name, pattern in _INTENTS.items() if pattern.search(query)]
+        # "merit list ... when" is a date question even though it says merit
+        if "dates" in intents and "closing_merit" in intents and "merit list" in query.lower():
+            intents.remove("closing_merit")
+        # "last date for the fee challan" is the fee deadline
+        if set(intents) == {"fee", "dates"}:
+            intents = ["fee"]
+        if len(intents) != 1:
+            return None
+        programs = find_programs(query)
+        if len(programs) == 1 and _CONJUNCTION_RE.search(query):
+            return None  # "fee for AI and biomedical": a partial answer would sound complete
+        return getattr(self, f"_{intents[0]}")(query, programs, _level(query))
+
+    def _fee(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        lower = query.lower()
+        if "challan" in lower or "last date" in lower or "deadline" in lower:
+            fact = self.get("fee_deadline")
+            if fact is None:
+                return None
+            date = " ".join(w.capitalize() if w.lower() in _MONTHS else w for w in fact.value["date"].split())
+            return f"The last date to submit the fee challan is {date}; after that it is accepted with a fine."
+        if "one time" in lower or "one-time" in lower or "total at admission" in lower:
+            fact = self.get("one_time_fee")
+            if fact is None:
+                return None
+            return (f"BS students pay one-time charges of {spoken_rupees(fact.value['amount'])} at admission: "
+                    f"the admission fee, endowment fund and library development fund.")
+        if "admission fee" in lower:
+            fact = self.get("admission_fee")
+            if fact is None or programs or level not in (None, "BS"):
+                return None
+            return f"The BS admission fee is {spoken_rupees(fact.value['amount'])}, paid once at admission."
+        # The templates quote a fee per the period it is listed for; another period goes to the LLM
+        period = _period(query)
+        if level in ("MS", "PhD") and not programs:
+            fact = self.get("fee", level)
+            if fact is None or period not in (None, fact.value["period"]):
+                return None
+            return f"{level} programs cost approximately {spoken_rupees(fact.value['amount'])} per {fact.value['period']}."
+        if not programs or level not in (None, "BS"):
+            return None
+        if len(programs) > 3:
+            return None
+        sentences = []
+        for program in programs:
+            fact = self.get("fee", "BS", program)
+            if fact is None or period not in (None, fact.value["period"]):
+                return None
+            sentences.append(f"The fee for {PROGRAMS[program][0]} is about {spoken_rupees(fact.value['amount'])} per {fact.value['period']}.")
+        return " ".join(sentences)
+
+    def _closing_merit(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        if len(programs) != 1 or level not in (None, "BS"):
+            return None
+        fact = self.get("closing_merit", "BS", programs[0])
+        if fact is None:
+            return None
+        years = fact.value.get("years", {})
+        if not years:
+            return fact.value.get("note")
+        asked = _YEAR_RE.search(query)
+        year = asked.group(1) if asked else max(years)
+        if year not in years:
+            return None
+        return f"The closing merit for {PROGRAMS[programs[0]][0]} in {year} was {years[year]:g} percent."
+
+    def _dates(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        if level not in (None, "BS"):
+            return None
+        lower = query.lower()
+        if "merit list" in lower:
+            attribute, template = "merit_list", "The first merit list is usually displayed in {when}."
+        elif "class" in lower:
+            attribute, template = "classes_start", "Classes usually start in {when}."
+        elif "last date" in lower or "deadline" in lower or "close" in lower:
+            if "challan" in lower or "fee" in lower:
+                return None
+            attribute, template = "last_date", "The last date to apply for BS admission is {when}."
+        elif "open" in lower or "start" in lower:
+            attribute, template = "admissions_open", "BS admissions open in {when}."
+        else:
+            return None
+        fact = self.get(attribute)
+        if fact is None:
+            return None
+        when = fact.value["when"]
+        first, _, rest = when.partition(" ")
+        if first.lower() not in _MONTHS:
+            when = f"{first.lower()} {rest}"  # "End of June" -> "end of June"
+        return template.format(when=when)
+
+    def _merit_formula(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        if level not in (None, "BS") or len(programs) > 1:
+            return None
+        if programs:
+            groups = [("engineering" if programs[0] in _ENGINEERING else "non_engineering", PROGRAMS[programs[0]][0])]
+        else:
+            groups = [("engineering", "engineering and computing programs"), ("non_engineering", "programs without an entry test")]
+        sentences = []
+        for group, label in groups:
+            fact = self.get("merit_formula", "BS", group)
+            if fact is None:
+                return None
+            sentences.append(f"For {label}, the aggregate is {fact.value['weights']}.")
+        return " ".join(sentences)
+
+    def _offered(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        """Only confirms: the website's program list is not complete enough to say no."""
+        if len(programs) != 1:
+            return None
+        level = level or "BS"
+        if self.get("offered", level, programs[0]) is None:
+            return None
+        subject = PROGRAMS[programs[0]][0][len("BS "):]
+        name = f"BS {subject}" if level == "BS" else f"an {level} in {subject}" if level == "MS" else f"a PhD in {subject}"
+        return f"Yes, IST offers {name}."
+
+    def _contact(self, query: str, programs: List[str], level: Optional[str]) -> Optional[str]:
+        phone, email = self.get("admissions_phone"), self.get("admissions_email")
+        if phone is None:
+            return None
+        text = f"The admissions office number is {phone.value['phone']}"
+        return text + (f", and the email is {email.value['email']}." if email else ".")
+
+
+def _facts_path(fingerprint: str) -> Path:
+    return generation_dir(fingerprint) / "facts.json"
+
+
+def _load(fingerprint: str) -> Optional[List[Fact]]:
+    try:
+        payload = json.loads(_facts_path(fingerprint).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if payload.get("version") != FACTS_VERSION or payload.get("fingerprint") != fingerprint:
+        return None
+    return [Fact(**f) for f in payload["facts"]]
+
+
+def build_facts(fingerprint: Optional[str] = None) -> List[Fact]:
+    """Extract the facts and write them into the generation directory atomically; done once with the indexes."""
+    fingerprint = fingerprint or data_fingerprint()
+    facts = extract_facts()
+    path = _facts_path(fingerprint)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_path(path)
+    tmp.write_text(json.dumps({
+        "version": FACTS_VERSION,
+        "fingerprint": fingerprint,
+        "facts": [asdict(f) for f in facts],
+    }), encoding="utf-8")
+    os.replace(tmp, path)
+    return facts
+
+
+_store: Optional[FactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_fact_store(fingerprint: Optional[str] = None) -> FactStore:
+    """
+    The fact store for a corpus fingerprint (the active index generation's, see app.rag);
+    without one, whichever is loaded, else the current data/. A different fingerprint replaces it.
+    """
+    global _store
+    store = _store
+    if store is not None and (fingerprint is None or store.fingerprint == fingerprint):
+        return store
+    with _store_lock:
+        if _store is None or (fingerprint is not None and _store.fingerprint != fingerprint):
+            current = data_fingerprint()
+            fingerprint = fingerprint or current
+            facts = _load(fingerprint)
+            if facts is None and fingerprint == current:
+                facts = build_facts(fingerprint)
+            elif facts is None:
+                # data/ has moved on since that generation was built; extracting now would mislabel
+                # the new facts, so its fact questions go through RAG until the next generation
+                logger.warning("no facts for corpus %s; fact answers are off until it is replaced", fingerprint[:12])
+                facts = []
+            _store = FactStore(facts, fingerprint)
+            logger.info("fact store: %d facts (corpus %s)", len(_store), fingerprint[:12])
+        return _store
@@ -0,0 +1,108 @@
+"""Score fusion for hybrid retrieval: dense and BM25 candidate lists -> one ranking over their union, on NumPy arrays.
+
+Strategies (FUSION_STRATEGY):
+    minmax  each list scaled to [0, 1], weighted sum; a chunk missing from a list scores 0 there
+    zscore  each list standardized, weighted sum; a chunk missing from a list gets that list's minimum
+    rrf     reciprocal rank fusion, sum of weight / (FUSION_RRF_K + rank); ignores score scale entirely
+"""
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+from config import FUSION_DENSE_WEIGHT, FUSION_RRF_K, FUSION_SPARSE_WEIGHT, FUSION_STRATEGY
+
+STRATEGIES = ("minmax", "zscore", "rrf")
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    lo = scores.min()
+    span = scores.max() - lo
+    if span < 1e-12:
+        return np.ones_like(scores)
+    return (scores - lo) / span
+
+
+def _zscore(scores: np.ndarray) -> np.ndarray:
+    centered = scores - scores.sum() / len(scores)
+    std = np.sqrt(np.dot(centered, centered) / len(scores))
+    if std < 1e-12:
+        return np.zeros_like(scores)
+    return centered / std
+
+
+def _union(dense_idx: List[int], sparse_idx: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Candidate union plus each list's positions in it. A dict beats np.unique at tens of candidates."""
+    slots: dict = {}
+    dense_pos = [slots.setdefault(i, len(slots)) for i in dense_idx]
+    sparse_pos = [slots.setdefault(i, len(slots)) for i in sparse_idx]
+    candidates = np.fromiter(slots, dtype=np.int64, count=len(slots))
+    return candidates, np.array(dense_pos, dtype=np.int64), np.array(sparse_pos, dtype=np.int64)
+
+
+def fuse(
+    dense_idx: Sequence[int],
+    dense_dist: Sequence[float],
+    sparse_idx: np.ndarray,
+    sparse_scores: np.ndarray,
+    strategy: str = FUSION_STRATEGY,
+    dense_weight: float = FUSION_DENSE_WEIGHT,
+    sparse_weight: float = FUSION_SPARSE_WEIGHT,
+    rrf_k: float = FUSION_RRF_K,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    dense_* are chunk indices with squared L2 distances on unit vectors (best first); sparse_*
+    are chunk indices with BM25 scores (best first, non-positive scores are not matches).
+    Returns (chunk indices, fused scores) over the union, best first.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown FUSION_STRATEGY: {strategy}")
+    # Squared L2 between unit vectors is 2 - 2*cos; fuse on cosine so the scale means something
+    dense_sim = 1.0 - np.asarray(dense_dist, dtype=np.float64) / 2.0
+    sparse_scores = np.asarray(sparse_scores, dtype=np.float64)
+    keep = sparse_scores > 0
+    sparse_scores = sparse_scores[keep]
+    candidates, dense_pos, sparse_pos = _union(
+        [int(i) for i in dense_idx], np.asarray(sparse_idx, dtype=np.int64)[keep].tolist()
+    )
+    if not len(candidates):
+        return candidates, np.zeros(0)
+
+    fused = np.zeros(len(candidates), dtype=np.float64)
+    if strategy == "rrf":
+        # Inputs are already in rank order; rank 1 is the best
+        fused[dense_pos] += dense_weight / (rrf_k + np.arange(1, len(dense_pos) + 1))
+        fused[sparse_pos] += sparse_weight / (rrf_k + np.arange(1, len(sparse_pos) + 1))
+    else:
+        norm = _minmax if strategy == "minmax" else _zscore
+        for pos, scores, weight in ((dense_pos, dense_sim, dense_weight), (sparse_pos, sparse_scores, sparse_weight)):
+            if len(pos):
+                scaled = norm(scores)
+                if strategy == "zscore":
+                    # Missing from this list = as bad as its worst candidate
+                    fused += weight * scaled.min()
+                    scaled = scaled - scaled.min()
+                fused[pos] += weight * scaled
+
+    # Stable sort: ties keep first-seen order (dense candidates first, in rank order)
+    order = np.argsort(-fused, kind="stable")
+    return candidates[order], fused[order]
+
+
+def drop_neighbors(
+    ranked_idx: np.ndarray,
+    scores: np.ndarray,
+    top_k: int,
+    is_neighbor: Callable[[int, int], bool],
+) -> List[Tuple[int, float]]:
+    """
+    Top top_k of a fused ranking, skipping a chunk that is_neighbor() of one already taken
+    (an overlapping window of the same passage); the next candidate takes its slot.
+    """
+    taken: List[Tuple[int, float]] = []
+    for idx, score in zip(ranked_idx.tolist(), scores.tolist()):
+        if any(is_neighbor(idx, kept) for kept, _ in taken):
+            continue
+        taken.append((idx, score))
+        if len(taken) == top_k:
+            break
+    return taken
@@ -0,0 +1,171 @@
+"""Process-wide async Groq client: pooled keep-alive connections, concurrency cap, per-call timing."""
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+import httpx
+from groq import AsyncGroq
+
+from config import (
+    GROQ_API_KEY,
+    GROQ_CONNECT_TIMEOUT_S,
+    GROQ_KEEPALIVE_EXPIRY_S,
+    GROQ_MAX_CONCURRENCY,
+    GROQ_MAX_CONNECTIONS,
+    GROQ_MAX_RETRIES,
+    GROQ_TIMEOUT_S,
+)
+from app.metrics import observe
+from app.tracing import mark, record_span
+
+logger = logging.getLogger("ist-agent.groq")
+
+
+@dataclass
+class CallTiming:
+    """Where one Groq call spent its time, in milliseconds from the start of the call."""
+
+    started: float = field(default_factory=time.perf_counter)
+    queue_ms: float = 0.0
+    connect_ms: float = 0.0
+    new_connection: bool = False
+    headers_ms: Optional[float] = None
+    first_token_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    # The awaiting task was cancelled (barge-in) before the call finished
+    cancelled: bool = False
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def mark_headers(self) -> None:
+        if self.headers_ms is None:
+            self.headers_ms = self.elapsed_ms()
+
+    def mark_first_token(self) -> None:
+        if self.first_token_ms is None:
+            self.first_token_ms = self.elapsed_ms()
+
+
+_current_timing: contextvars.ContextVar[Optional[CallTiming]] = contextvars.ContextVar(
+    "groq_call_timing", default=None
+)
+_connect_started: contextvars.ContextVar[float] = contextvars.ContextVar("groq_connect_started", default=0.0)
+
+
+def _on_trace(event: str) -> None:
+    """httpcore trace hook: accumulate TCP connect + TLS handshake time for the current call."""
+    timing = _current_timing.get()
+    if timing is None:
+        return
+    if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        _connect_started.set(time.perf_counter())
+    elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        timing.new_connection = True
+        timing.connect_ms += (time.perf_counter() - _connect_started.get()) * 1000.0
+
+
+async def _async_trace(event: str, info: dict) -> None:
+    _on_trace(event)
+
+
+async def _attach_async_trace(request: httpx.Request) -> None:
+    request.extensions["trace"] = _async_trace
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+        keepalive_expiry=GROQ_KEEPALIVE_EXPIRY_S,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(GROQ_TIMEOUT_S, connect=GROQ_CONNECT_TIMEOUT_S)
+
+
+# The async pool and semaphore belong to the event loop they were created on
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_client: Optional[AsyncGroq] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_async_client() -> AsyncGroq:
+    """Shared async client for the running event loop (one per worker process in practice)."""
+    global _async_loop, _async_client, _semaphore
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_loop = loop
+        _semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+        _async_client = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            max_retries=GROQ_MAX_RETRIES,
+            timeout=_timeout(),
+            http_client=httpx.AsyncClient(
+                limits=_limits(),
+                timeout=_timeout(),
+                event_hooks={"request": [_attach_async_trace]},
+            ),
+        )
+    return _async_client
+
+
+def _log_timing(timing: CallTiming) -> None:
+    logger.info(
+        "groq call: queue=%.0fms connect=%.0fms%s headers=%s ttft=%s total=%.0fms%s",
+        timing.queue_ms,
+        timing.connect_ms,
+        "" if timing.new_connection else " (reused)",
+        "-" if timing.headers_ms is None else f"{timing.headers_ms:.0f}ms",
+        "-" if timing.first_token_ms is None else f"{timing.first_token_ms:.0f}ms",
+        timing.total_ms or 0.0,
+        " (cancelled)" if timing.cancelled else "",
+    )
+
+
+@asynccontextmanager
+async def groq_call() -> AsyncIterator[CallTiming]:
+    """
+    Hold one of GROQ_MAX_CONCURRENCY slots for the duration of a call and time it.
+    Callers mark headers and first token on the yielded CallTiming; it is logged on exit.
+    """
+    get_async_client()
+    timing = CallTiming()
+    async with _semaphore:
+        timing.queue_ms = timing.elapsed_ms()
+        token = _current_timing.set(timing)
+        try:
+            yield timing
+        except (asyncio.CancelledError, GeneratorExit):
+            # Barge-in: the awaiting task was cancelled or the streaming generator closed
+            timing.cancelled = True
+            raise
+        finally:
+            _current_timing.reset(token)
+            timing.total_ms = timing.elapsed_ms()
+            _log_timing(timing)
+            _report_timing(timing)
+
+
+def _report_timing(timing: CallTiming) -> None:
+    """The call as an "llm" span of the current turn (plus the llm_first_token mark) and in the latency histograms."""
+    if not timing.cancelled:
+        # A call cut short by a barge-in says nothing about how long a reply takes
+        observe("ist_llm_seconds", (timing.total_ms or 0.0) / 1000)
+    if timing.first_token_ms is not None:
+        observe("ist_llm_first_token_seconds", timing.first_token_ms / 1000)
+        mark("llm_first_token", at_perf=timing.started + timing.first_token_ms / 1000)
+    record_span(
+        "llm",
+        timing.started,
+        timing.started + (timing.total_ms or 0.0) / 1000,
+        queue_ms=round(timing.queue_ms, 3),
+        connect_ms=round(timing.connect_ms, 3),
+        first_token_ms=timing.first_token_ms,
+        cancelled=timing.cancelled,
+    )
@@ -1,15 +1,25 @@
 """LLM layer: Groq (Llama-3-70b), strict system prompt, escalation, refusal interception."""
+import asyncio
+import logging
 import re
-from typing import List, Optional, Tuple
-
-from groq import Groq
+import time
+from typing import AsyncIterator, List, Optional, Tuple
 
 from config import (
+    ANSWER_CACHE_ENABLED,
     ESCALATION_MESSAGE,
-    GROQ_API_KEY,
-    MAX_HISTORY_TURNS,
+    FACTS_ENABLED,
 )
-from app.rag import get_rag
+from app.answer_cache import get_answer_cache, is_cacheable, log_query
+from app.cancellation import CancelToken, observe_stopped, run_cancellable
+from app.facts import get_fact_store
+from app.groq_client import get_async_client, groq_call
+from app.metrics import inc
+from app.prompt import PromptUsage, build_messages, count_tokens, log_usage
+from app.rag import Retrieval, get_rag
+from app.tracing import run_in_context, span
+
+logger = logging.getLogger("ist-agent.llm")
 
 
 SYSTEM_PROMPT = """You are the official voice assistant for the Institute of Space Technology (IST) Admissions. You answer only from the provided OFFICIAL CONTEXT below. You are speaking in a live phone call.
@@ -37,61 +47,292 @@ REFUSAL_PATTERNS = [
 ]
 
 
-def _refusal_or_error(text: str) -> bool:
-    if not text or len(text.strip()) < 10:
-        return True
+# End of a sentence followed by whitespace or end of buffer
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)\s*")
+# Shortest first sentence we release; matches the minimum reply length accepted below
+MIN_RELEASE_CHARS = 10
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+def _is_refusal(text: str) -> bool:
     lower = text.strip().lower()
     for pat in REFUSAL_PATTERNS:
         if re.search(pat, lower):
             return True
-    if "[ESCALATE]" in text:
+    return "[ESCALATE]" in text
+
+
+def _refusal_or_error(text: str) -> bool:
+    if not text or len(text.strip()) < 10:
         return True
-    return False
+    return _is_refusal(text)
 
 
-def _format_messages(history: List[Tuple[str, str]], query: str, context: str) -> list:
-    system = SYSTEM_PROMPT.format(context="\n\n---\n\n".join(context) if isinstance(context, list) else context)
-    messages = [{"role": "system", "content": system}]
-    for user, assistant in history[-MAX_HISTORY_TURNS:]:
-        messages.append({"role": "user", "content": user})
-        messages.append({"role": "assistant", "content": assistant})
-    messages.append({"role": "user", "content": query})
-    return messages
+class SpeechGate:
+    """
+    Releases a streamed reply one group of complete sentences at a time.
+    Nothing is released until the first sentence has been checked for [ESCALATE] or a
+    refusal pattern; a later sentence that trips a pattern ends the reply there.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self.released = False
+        self.escalate = False
+        self.closed = False
+
+    def push(self, delta: str) -> List[str]:
+        if self.escalate or self.closed:
+            return []
+        self._buffer += delta
+        end = None
+        for m in _SENTENCE_END.finditer(self._buffer):
+            end = m.end()
+        if end is None:
+            return []
+        head = self._buffer[:end]
+        if not self.released and len(head.strip()) < MIN_RELEASE_CHARS:
+            return []
+        self._buffer = self._buffer[end:]
+        return self._release(head)
+
+    def finish(self) -> List[str]:
+        if self.escalate or self.closed:
+            return []
+        rest, self._buffer = self._buffer, ""
+        if not self.released:
+            if _refusal_or_error(rest):
+                self.escalate = True
+                return []
+            return self._release(rest)
+        return self._release(rest) if rest.strip() else []
+
+    def _release(self, text: str) -> List[str]:
+        if _is_refusal(text):
+            if self.released:
+                self.closed = True
+            else:
+                self.escalate = True
+            return []
+        self.released = True
+        return [text]
 
 
-def get_response(
+def _prepare_messages(
     query: str,
-    history: Optional[List[Tuple[str, str]]] = None,
-    session_id: Optional[str] = None,
-) -> Tuple[str, bool]:
+    history: List[Tuple[str, str]],
+    usage: Optional[PromptUsage] = None,
+    retrieval: Optional[Retrieval] = None,
+) -> Tuple[list, Retrieval, PromptUsage]:
+    if retrieval is None:
+        retrieval = get_rag().retrieve(query, top_k=8)
+    messages, usage = build_messages(SYSTEM_PROMPT, retrieval.chunks, history, query, usage=usage)
+    return messages, retrieval, usage
+
+
+def _reported_prompt_tokens(usage_obj) -> Optional[int]:
+    """Groq's prompt token count from a response or final stream chunk, if it sent one."""
+    return getattr(usage_obj, "prompt_tokens", None) if usage_obj is not None else None
+
+
+def _fact_answer(query: str) -> Optional[str]:
+    """Templated answer from the structured fact store (fees, closing merit, dates), or None for RAG."""
+    if not FACTS_ENABLED:
+        return None
+    with span("facts") as attrs:
+        try:
+            answer = get_fact_store(get_rag().corpus_version).answer(query)
+        except Exception as e:
+            logger.warning("fact lookup failed, using RAG: %s", e)
+            answer = None
+        attrs["hit"] = answer is not None
+    return answer
+
+
+def _cached_answer(query: str, retrieval: Retrieval) -> Optional[str]:
+    """Stored answer for a near-duplicate of query over the same chunks, if the answer cache is on."""
+    if not ANSWER_CACHE_ENABLED or retrieval.embedding is None or not is_cacheable(query):
+        return None
+    cache = get_answer_cache()
+    answer = cache.lookup(retrieval.embedding, retrieval.chunk_ids, get_rag().corpus_version)
+    if answer is not None:
+        stats = cache.stats()
+        logger.info(
+            "answer cache hit: hit rate %.1f%% (%d/%d), %.0f ms of LLM time saved so far",
+            100 * stats["hit_rate"], stats["hits"], stats["lookups"], stats["ms_saved"],
+        )
+    return answer
+
+
+def _store_answer(query: str, retrieval: Retrieval, answer: str, llm_ms: float) -> None:
+    if ANSWER_CACHE_ENABLED and retrieval.embedding is not None and is_cacheable(query):
+        get_answer_cache().store(
+            query, retrieval.embedding, retrieval.chunk_ids, answer, get_rag().corpus_version, llm_ms
+        )
+
+
+def _log_query(
+    query: str,
+    session_id: Optional[str],
+    escalated: bool,
+    cached: bool = False,
+    fact: bool = False,
+    interrupted: bool = False,
+) -> None:
+    """Record the turn's outcome: query log line and the ist_answers_total counter."""
+    outcome = (
+        "escalated" if escalated else "interrupted" if interrupted
+        else "fact" if fact else "cached" if cached else "answered"
+    )
+    inc("ist_answers_total", outcome=outcome)
+    log_query(query, session_id, escalated)
+
+
+def _count_interrupted(stage: str, requested: bool, prompt_tokens: int, received: str, spoken: List[str]) -> None:
     """
-    Get LLM response with RAG context. Returns (reply_text, should_escalate).
-    If should_escalate is True, caller should say ESCALATION_MESSAGE and optionally ask for phone.
+    Account for a reply cut off by a barge-in: the stage it was stopped in, completion tokens
+    Groq had sent that were never released to speech, and the prompt of a call that released
+    nothing (paid for, no word of it heard).
     """
-    history = history or []
-    rag = get_rag()
-    chunks = rag.search(query, top_k=8)
-    context = "\n\n".join(chunks) if chunks else "No specific context available. For any query you cannot answer from this, output [ESCALATE]."
+    inc("ist_cancellations_total", stage=stage)
+    unspoken = count_tokens(received) - count_tokens("".join(spoken))
+    if unspoken > 0:
+        inc("ist_llm_wasted_tokens_total", unspoken, kind="completion")
+    if requested and not spoken and prompt_tokens:
+        inc("ist_llm_wasted_tokens_total", prompt_tokens, kind="prompt")
+
+
+def _prepare_turn(
+    query: str,
+    history: List[Tuple[str, str]],
+    usage: Optional[PromptUsage],
+    retrieval: Optional[Retrieval],
+) -> Tuple[list, Retrieval, PromptUsage, Optional[str]]:
+    """_prepare_messages plus the answer cache lookup: the blocking part of a streamed turn, run in the executor."""
+    messages, retrieval, usage = _prepare_messages(query, history, usage, retrieval)
+    return messages, retrieval, usage, _cached_answer(query, retrieval)
 
-    client = Groq(api_key=GROQ_API_KEY)
-    messages = _format_messages(history, query, context)
 
+async def stream_response(
+    query: str,
+    history: Optional[List[Tuple[str, str]]] = None,
+    session_id: Optional[str] = None,
+    usage: Optional[PromptUsage] = None,
+    retrieval: Optional[Retrieval] = None,
+) -> AsyncIterator[str]:
+    """
+    LLM reply with RAG context, streamed: yields reply text as soon as whole sentences have
+    passed the escalation/refusal checks. Yields only ESCALATION_MESSAGE when escalating.
+    If `usage` is given it is filled with this turn's prompt token accounting.
+    `retrieval` is a search for this query already done (speculatively); None searches now.
+
+    A barge-in either cancels the consuming task or closes this generator (aclose()). Both
+    close the Groq stream, which drops its connection, stop a retrieval still running in the
+    executor at its next stage, and record the turn as interrupted.
+    """
+    loop = asyncio.get_running_loop()
+    gate = SpeechGate()
+    cancel = CancelToken()
+    spoken: List[str] = []
+    received: List[str] = []
+    prepared = False
+    requested = False
+    usage_logged = False
+    logged = False
+    reported = None
+    failed = False
+    start = time.perf_counter()
     try:
-        resp = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            max_tokens=150,
-            temperature=0.3,
-        )
-        text = (resp.choices[0].message.content or "").strip()
-    except Exception:
-        return ESCALATION_MESSAGE, True
-
-    if "[ESCALATE]" in text or not text:
-        return ESCALATION_MESSAGE, True
-    if _refusal_or_error(text):
-        return ESCALATION_MESSAGE, True
-    return text, False
+        # Fact lookup, get_rag() (which may start loading a new index generation), retrieval
+        # and the answer cache all block; none of them runs on the event loop
+        fact = await loop.run_in_executor(None, run_in_context(_fact_answer, query))
+        if fact is not None:
+            _log_query(query, session_id, False, fact=True)
+            logged = True
+            yield fact
+            return
+        try:
+            messages, retrieval, usage, cached = await loop.run_in_executor(
+                None, run_cancellable(cancel, _prepare_turn, query, history or [], usage, retrieval)
+            )
+            prepared = True
+            if cached is not None:
+                usage.prompt_tokens = 0
+                _log_query(query, session_id, False, cached=True)
+                logged = True
+                yield cached
+                return
+            client = get_async_client()
+            start = time.perf_counter()
+            async with groq_call() as timing:
+                requested = True
+                stream = await client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=messages,
+                    max_tokens=150,
+                    temperature=0.3,
+                    stream=True,
+                )
+                timing.mark_headers()
+                cancelled_at = None
+                try:
+                    async for part in stream:
+                        if part.x_groq is not None and part.x_groq.usage is not None:
+                            reported = _reported_prompt_tokens(part.x_groq.usage)
+                        delta = part.choices[0].delta.content if part.choices else None
+                        if not delta:
+                            continue
+                        timing.mark_first_token()
+                        received.append(delta)
+                        for segment in gate.push(delta):
+                            spoken.append(segment)
+                            yield segment
+                        if gate.escalate or gate.closed:
+                            break
+                except (asyncio.CancelledError, GeneratorExit):
+                    cancelled_at = time.perf_counter()
+                    raise
+                finally:
+                    await stream.close()
+                    if cancelled_at is not None:
+                        observe_stopped("llm", cancelled_at)
+        except Exception:
+            if not gate.released:
+                gate.escalate = True
+            failed = True
+        if prepared:
+            if reported is not None:
+                usage.prompt_tokens = reported
+            log_usage(usage, session_id, reported=reported is not None)
+            usage_logged = True
+        for segment in gate.finish():
+            spoken.append(segment)
+            yield segment
+        # A reply cut short by an error or a late refusal is never cached
+        if gate.escalate:
+            yield ESCALATION_MESSAGE
+        elif prepared and not gate.closed and not failed:
+            await loop.run_in_executor(
+                None, _store_answer, query, retrieval, "".join(spoken).strip(), (time.perf_counter() - start) * 1000
+            )
+        _log_query(query, session_id, gate.escalate)
+    except (asyncio.CancelledError, GeneratorExit):
+        # Barge-in. The executor thread cannot be interrupted; this makes it stop at its next stage.
+        cancel.cancel()
+        if not logged:
+            if prepared and not usage_logged:
+                if reported is not None:
+                    usage.prompt_tokens = reported
+                log_usage(usage, session_id, reported=reported is not None)
+            _count_interrupted(
+                "llm" if prepared else "retrieval",
+                requested,
+                usage.prompt_tokens if prepared else 0,
+                "".join(received),
+                spoken,
+            )
+            _log_query(query, session_id, False, interrupted=True)
+        raise
 
 
 def get_escalation_message() -> str:
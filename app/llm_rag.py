@@ -1,4 +1,4 @@
-"""RAG-backed LLM for LiveKit: wraps app.llm.get_response and streams a single ChatChunk."""
+"""RAG-backed LLM for LiveKit: wraps app.llm.stream_response and streams sentence-level ChatChunks."""
 from __future__ import annotations
 
 import asyncio
@@ -7,32 +7,60 @@ from livekit.agents.llm import ChatChunk, ChoiceDelta, CompletionUsage, LLMStrea
 from livekit.agents.types import APIConnectOptions, DEFAULT_API_CONNECT_OPTIONS
 from livekit.agents.llm.chat_context import ChatContext
 
-from app.llm import get_response
+from app.llm import GROQ_MODEL, stream_response
+from app.metrics import inc
+from app.prompt import PromptUsage, count_tokens
+from app.speculative import SpeculativeRetriever
+from app.tracing import RoomTracer, mark, use_turn
 from app.lead_capture import extract_pakistani_phone, log_lead
 
 
+def _messages(chat_ctx: ChatContext) -> list:
+    """Chat messages in order (function calls and other items skipped)."""
+    return [item for item in chat_ctx.items if item.type == "message"]
+
+
 def _chat_ctx_to_history(chat_ctx: ChatContext) -> list:
-    """Convert ChatContext to list of (user, assistant) turns for get_response."""
+    """Convert ChatContext to list of (user, assistant) turns for stream_response."""
     history = []
-    for msg in chat_ctx.messages:
-        if msg.role == "user" and msg.content:
-            history.append((msg.content, ""))
-        elif msg.role == "assistant" and msg.content and history:
+    for msg in _messages(chat_ctx):
+        text = msg.text_content
+        if msg.role == "user" and text:
+            history.append((text, ""))
+        elif msg.role == "assistant" and text and history:
             user, _ = history[-1]
-            history[-1] = (user, msg.content)
+            history[-1] = (user, text)
     return history
 
 
 class RAGLLM(llm.LLM):
-    """LLM that uses RAG + Groq and streams one chunk. Handles escalation and lead capture."""
+    """LLM that uses RAG + Groq and streams checked sentences as they arrive. Handles escalation and lead capture."""
 
-    def __init__(self, *, session_id: str | None = None) -> None:
+    def __init__(
+        self,
+        *,
+        session_id: str | None = None,
+        speculative: SpeculativeRetriever | None = None,
+        tracer: RoomTracer | None = None,
+    ) -> None:
         super().__init__()
         self._session_id = session_id or ""
+        self._speculative = speculative
+        self._tracer = tracer
+
+    def on_user_transcript(self, transcript: str, is_final: bool) -> None:
+        """Forward STT transcripts (interim and final) so retrieval can start before the turn ends."""
+        if self._speculative is not None:
+            self._speculative.on_transcript(transcript, is_final)
+
+    async def aclose(self) -> None:
+        if self._speculative is not None:
+            self._speculative.close()
+        await super().aclose()
 
     @property
     def model(self) -> str:
-        return "llama-3.3-70b-versatile"
+        return GROQ_MODEL
 
     @property
     def provider(self) -> str:
@@ -53,20 +81,36 @@ class RAGLLM(llm.LLM):
             tools=tools,
             conn_options=conn_options,
             session_id=self._session_id,
+            speculative=self._speculative,
+            tracer=self._tracer,
         )
 
 
 class RAGLLMStream(LLMStream):
-    def __init__(self, *, session_id: str = "", **kwargs) -> None:
+    def __init__(
+        self,
+        *,
+        session_id: str = "",
+        speculative: SpeculativeRetriever | None = None,
+        tracer: RoomTracer | None = None,
+        **kwargs,
+    ) -> None:
         super().__init__(**kwargs)
         self._session_id = session_id
+        self._speculative = speculative
+        self._tracer = tracer
 
     async def _run(self) -> None:
+        # Spans recorded while answering (retrieval, Groq) belong to the room's current turn
+        with use_turn(self._tracer.current if self._tracer is not None else None):
+            await self._answer()
+
+    async def _answer(self) -> None:
         chat_ctx = self.chat_ctx
         last_user = ""
-        for m in reversed(chat_ctx.messages):
-            if m.role == "user" and m.content:
-                last_user = m.content
+        for m in reversed(_messages(chat_ctx)):
+            if m.role == "user" and m.text_content:
+                last_user = m.text_content
                 break
         if not last_user:
             return
@@ -75,24 +119,37 @@ class RAGLLMStream(LLMStream):
         if history and not history[-1][1]:
             history = history[:-1]
         loop = asyncio.get_event_loop()
-        reply, should_escalate = await loop.run_in_executor(
-            None,
-            lambda: get_response(last_user, history=history, session_id=self._session_id or None),
-        )
+        request_id = getattr(self, "_request_id", "rag-1")
+        retrieval = await self._speculative.take(last_user) if self._speculative is not None else None
+        if self._speculative is not None:
+            mark("speculative_retrieval", hit=retrieval is not None)
+            inc("ist_speculative_retrievals_total", result="hit" if retrieval is not None else "miss")
+        usage = PromptUsage()
+        completion_tokens = 0
+        async for segment in stream_response(
+            last_user,
+            history=history,
+            session_id=self._session_id or None,
+            usage=usage,
+            retrieval=retrieval,
+        ):
+            completion_tokens += count_tokens(segment)
+            self._event_ch.send_nowait(
+                ChatChunk(id=request_id, delta=ChoiceDelta(role="assistant", content=segment))
+            )
         # Log lead when user provides Pakistani phone (e.g. callback request)
         if phone and self._session_id:
             await loop.run_in_executor(
                 None,
                 lambda: log_lead(phone, last_user, self._session_id),
             )
-        request_id = getattr(self, "_request_id", "rag-1")
-        chunk = ChatChunk(
-            id=request_id,
-            delta=ChoiceDelta(role="assistant", content=reply),
-            usage=CompletionUsage(
-                completion_tokens=len(reply.split()) + 1,
-                prompt_tokens=0,
-                total_tokens=len(reply.split()) + 1,
-            ),
+        self._event_ch.send_nowait(
+            ChatChunk(
+                id=request_id,
+                usage=CompletionUsage(
+                    completion_tokens=completion_tokens + 1,
+                    prompt_tokens=usage.prompt_tokens,
+                    total_tokens=usage.prompt_tokens + completion_tokens + 1,
+                ),
+            )
         )
-        self._event_ch.send_nowait(chunk)
@@ -0,0 +1,267 @@
+"""Process-local counters and histograms, shared across processes as snapshot files and served in Prometheus text format.
+
+Hot path: inc() and observe() write to a per-thread shard, so no lock is taken. A background
+thread in each worker process sums its shards every METRICS_FLUSH_S and writes
+METRICS_DIR/<pid>.json atomically. The web process renders /metrics from all snapshot files
+plus its own registry. Gauges of processes that have exited are dropped; their counters and
+histograms are kept until the file is older than METRICS_RETENTION_S.
+
+The web app and the agent worker must therefore share LOG_DIR (one box, as start.sh and
+render.yaml run them). ist_metrics_sources reports how many live worker processes were read,
+and 0 is logged as a warning.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_DIR, METRICS_FLUSH_S, METRICS_RETENTION_S
+
+logger = logging.getLogger("ist-agent.metrics")
+
+# Seconds; covers a cache hit (ms) up to a slow LLM reply
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+# name -> (type, help). Every metric is declared here so /metrics always lists it.
+METRICS: Dict[str, Tuple[str, str]] = {
+    "ist_active_rooms": ("gauge", "Rooms with a live agent session"),
+    "ist_rooms_total": ("counter", "Agent sessions started"),
+    "ist_answers_total": ("counter", "User turns answered, by outcome (answered, escalated, cached, fact, interrupted)"),
+    "ist_metrics_sources": ("gauge", "Live agent worker processes whose snapshot this /metrics read; 0 means the worker does not share LOG_DIR"),
+    "ist_speculative_retrievals_total": ("counter", "Turns whose retrieval was started on interim transcripts, by result"),
+    "ist_query_cache_lookups_total": ("counter", "Retrieval query cache lookups"),
+    "ist_query_cache_hits_total": ("counter", "Retrieval query cache hits"),
+    "ist_answer_cache_lookups_total": ("counter", "Semantic answer cache lookups"),
+    "ist_answer_cache_hits_total": ("counter", "Semantic answer cache hits"),
+    "ist_answer_cache_ms_saved_total": ("counter", "Groq time saved by answer cache hits, in ms (each hit counts the duration of the call that produced the answer)"),
+    "ist_audio_cache_lookups_total": ("counter", "Synthesized phrase cache lookups (memory)"),
+    "ist_audio_cache_hits_total": ("counter", "Synthesized phrase cache hits (memory or disk)"),
+    "ist_index_reloads_total": ("counter", "Index generations loaded after a data/ change, by result (swapped, failed)"),
+    "ist_tokens_issued_total": ("counter", "LiveKit tokens issued by the web app"),
+    "ist_turn_latency_seconds": ("histogram", "End of user speech to first agent audio"),
+    "ist_retrieval_seconds": ("histogram", "Hybrid retrieval, including query encode"),
+    "ist_reranks_total": ("counter", "Cross-encoder reranks, by result (reranked, fallback to fused order)"),
+    "ist_rerank_seconds": ("histogram", "Cross-encoder rerank of the fused candidates"),
+    "ist_llm_first_token_seconds": ("histogram", "Groq call start to first streamed token"),
+    "ist_llm_seconds": ("histogram", "Whole Groq call"),
+    "ist_tts_first_byte_seconds": ("histogram", "Sentence sent to Edge-TTS to first audio byte"),
+    "ist_cancellations_total": ("counter", "Reply work stopped by a barge-in, by stage (retrieval, llm, tts)"),
+    "ist_cancel_seconds": ("histogram", "Barge-in to the cancelled stage having stopped (thread returned, Groq stream or Edge-TTS socket closed)"),
+    "ist_llm_wasted_tokens_total": ("counter", "Groq tokens spent on replies cut off by a barge-in, by kind (completion received but never spoken, prompt of calls that spoke nothing)"),
+    "ist_tts_audio_avoided_seconds_total": ("counter", "Estimated seconds of reply audio not synthesized because the caller interrupted"),
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Shard:
+    """One thread's share of the registry; only that thread writes to it."""
+
+    def __init__(self) -> None:
+        self.counters: Dict[Key, float] = {}
+        # key -> per-bucket counts (last slot is +Inf), then sum, then count
+        self.histograms: Dict[Key, List[float]] = {}
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()  # only taken when a thread writes its first sample
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Add to a counter, or to a gauge (negative values allowed for gauges)."""
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        row = histograms.get(key)
+        if row is None:
+            row = histograms[key] = [0.0] * (len(LATENCY_BUCKETS) + 3)
+        row[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        row[-2] += seconds
+        row[-1] += 1
+
+    def register_collector(self, fn: Callable[[], Dict[str, float]]) -> None:
+        """fn() returns current totals by metric name (e.g. a cache's own hit counters); read at snapshot time."""
+        self._collectors.append(fn)
+
+    def snapshot(self) -> dict:
+        counters: Dict[Key, float] = {}
+        histograms: Dict[Key, List[float]] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict/list copies are atomic under the GIL; a sample racing the copy lands in the next snapshot
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0.0) + value
+            for key, row in dict(shard.histograms).items():
+                row = list(row)
+                total = histograms.setdefault(key, [0.0] * len(row))
+                for i, v in enumerate(row):
+                    total[i] += v
+        for fn in self._collectors:
+            try:
+                for name, value in fn().items():
+                    counters[_key(name, {})] = counters.get(_key(name, {}), 0.0) + value
+            except Exception as e:
+                logger.debug("metrics collector failed: %s", e)
+        return {
+            "pid": os.getpid(),
+            "written": time.time(),
+            "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [[name, dict(labels), row] for (name, labels), row in histograms.items()],
+        }
+
+
+_registry = Registry()
+inc = _registry.inc
+observe = _registry.observe
+register_collector = _registry.register_collector
+
+
+def write_snapshot(directory=METRICS_DIR) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(_registry.snapshot(), separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+_exporter: Optional[threading.Thread] = None
+
+
+def start_exporter() -> None:
+    """Write this process's snapshot every METRICS_FLUSH_S (and once at exit). Idempotent."""
+    global _exporter
+    if _exporter is not None:
+        return
+
+    def _loop() -> None:
+        while True:
+            time.sleep(METRICS_FLUSH_S)
+            try:
+                write_snapshot()
+            except OSError as e:
+                logger.warning("could not write metrics snapshot: %s", e)
+
+    _exporter = threading.Thread(target=_loop, name="metrics-exporter", daemon=True)
+    _exporter.start()
+    atexit.register(write_snapshot)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots(directory) -> Iterable[dict]:
+    now = time.time()
+    own = os.getpid()
+    for path in directory.glob("*.json"):
+        try:
+            snap = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if snap.get("pid") == own:
+            continue  # served live from the registry instead
+        if now - snap.get("written", 0) > METRICS_RETENTION_S:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            continue
+        snap["alive"] = _pid_alive(snap["pid"])
+        yield snap
+
+
+def _labels(labels: dict, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+_warned_no_sources = False
+
+
+def render_prometheus(directory=METRICS_DIR) -> str:
+    """All processes' metrics summed, in Prometheus text exposition format 0.0.4."""
+    global _warned_no_sources
+    own = _registry.snapshot()
+    own["alive"] = True
+    snapshots = [own, *(_read_snapshots(directory) if directory.exists() else ())]
+    sources = sum(1 for snap in snapshots[1:] if snap["alive"])
+    if not sources and not _warned_no_sources:
+        _warned_no_sources = True
+        logger.warning(
+            "/metrics found no live agent worker snapshots in %s; the worker must run on this box "
+            "with the same LOG_DIR (start.sh) for its metrics to be exported", directory,
+        )
+    own["counters"].append(["ist_metrics_sources", {}, float(sources)])
+
+    counters: Dict[Key, float] = {}
+    histograms: Dict[Key, List[float]] = {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            if METRICS.get(name, ("counter",))[0] == "gauge" and not snap["alive"]:
+                continue
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, row in snap["histograms"]:
+            total = histograms.setdefault(_key(name, labels), [0.0] * len(row))
+            for i, v in enumerate(row):
+                total[i] += v
+
+    lines: List[str] = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            rows = {labels: row for (n, labels), row in histograms.items() if n == name}
+            for labels, row in sorted(rows.items()):
+                labels = dict(labels)
+                cumulative = 0.0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), row):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', le))} {_fmt(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_fmt(row[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {_fmt(row[-1])}")
+        else:
+            rows = {labels: v for (n, labels), v in counters.items() if n == name}
+            if not rows:
+                rows = {(): 0.0}
+            for labels, value in sorted(rows.items()):
+                lines.append(f"{name}{_labels(dict(labels))} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,99 @@
+"""Export EMBEDDING_MODEL to ONNX for EMBEDDING_BACKEND=onnx, plus an int8 dynamically quantized copy.
+
+    python -m app.onnx_export [--output DIR] [--no-quantize] [--opset 17]
+
+Needs sentence-transformers (PyTorch), onnx and onnxruntime once, at export time. Serving only
+needs onnxruntime and tokenizers. Writes model.onnx, model_int8.onnx, tokenizer.json and
+export.json (pooling and truncation settings read back by app.embeddings.OnnxEmbedder).
+Check the result with `python -m benchmarks.embedding_agreement`.
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR
+
+
+def export(output: Path = EMBEDDING_ONNX_DIR, quantize: bool = True, opset: int = 17) -> Path:
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    pooling = next(m for m in model.modules() if isinstance(m, Pooling))
+    if pooling.get_pooling_mode_str() != "mean":
+        raise SystemExit(f"{EMBEDDING_MODEL} uses {pooling.get_pooling_mode_str()} pooling; OnnxEmbedder only does mean")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    class _Encoder(torch.nn.Module):
+        """The transformer only, returning last_hidden_state; pooling runs in NumPy at encode time."""
+
+        def __init__(self, inner) -> None:
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    (output / "export.json").unlink(missing_ok=True)
+    sample = tokenizer(["warm up", "a longer sample sentence"], padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]}
+    tmp = output / "model.onnx.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(transformer),
+            tuple(sample[n] for n in names),
+            str(tmp),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=opset,
+        )
+    os.replace(tmp, output / "model.onnx")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp = output / "model_int8.onnx.tmp"
+        quantize_dynamic(str(output / "model.onnx"), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, output / "model_int8.onnx")
+
+    tokenizer.backend_tokenizer.save(str(output / "tokenizer.json"))
+    meta = {
+        "model": EMBEDDING_MODEL,
+        "dim": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "normalize": any(isinstance(m, Normalize) for m in model.modules()),
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+        "inputs": names,
+        "opset": opset,
+        "quantized": quantize,
+    }
+    # Written last: OnnxEmbedder refuses a directory without it
+    (output / "export.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=str(EMBEDDING_ONNX_DIR))
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    output = export(Path(args.output), quantize=not args.no_quantize, opset=args.opset)
+    sizes = {p.name: p.stat().st_size / 1e6 for p in sorted(output.glob("*.onnx"))}
+    print(f"exported {EMBEDDING_MODEL} to {output} in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{name} {mb:.1f} MB" for name, mb in sizes.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,136 +1,587 @@
-"""Hybrid RAG: ChromaDB (vector) + RankBM25 (keyword), rerank top 8, fallback query."""
-import re
-from typing import List, Optional
+"""Hybrid RAG: dense vectors (NumPy or ChromaDB) + sparse BM25 (keyword), rerank top 8, fallback query."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-from rank_bm25 import BM25Okapi
+import numpy as np
 
-from config import CHROMA_PERSIST_DIR, FALLBACK_QUERY, TOP_K
-from app.data_loader import load_documents
+from config import (
+    FALLBACK_QUERY,
+    FUSION_DEDUP_NEIGHBORS,
+    INDEX_MANIFEST_PATH,
+    INDEX_RELOAD_CHECK_S,
+    INDEX_RELOAD_ENABLED,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_S,
+    RERANK_CANDIDATES,
+    RERANK_ENABLED,
+    RERANK_TOP_K,
+    TOP_K,
+    VECTOR_BACKEND,
+)
+from app.bm25 import SparseBM25, tokenize
+from app.cancellation import check_cancelled
+from app.cache import LRUCache
+from app.data_loader import iter_corpus
+from app.embeddings import embedder_id, load_embedder
+from app.facts import get_fact_store
+from app.fusion import drop_neighbors, fuse
+from app.metrics import inc, observe, register_collector
+from app.rerank import get_reranker
+from app.shared_index import (
+    data_fingerprint,
+    generation_dir,
+    open_corpus,
+    open_texts,
+    read_generation,
+    tmp_path,
+    write_corpus_meta,
+    write_texts,
+)
+from app.tracing import record_span, span
+from app.vector_store import open_vector_store
+
+logger = logging.getLogger("ist-agent.rag")
+
+MANIFEST_VERSION = 1
+EMBED_BATCH_SIZE = 64
+# Queries per encode / similarity / BM25 pass in search_many
+SEARCH_BATCH_SIZE = 256
+UPSERT_BATCH_SIZE = 512
+# Leading characters of a chunk looked up in its predecessor to detect an overlapping window
+NEIGHBOR_OVERLAP_PROBE = 32
+# How long a first get_rag() waits for the published generation to become openable (a rebuild in flight)
+OPEN_WAIT_S = 120.0
+OPEN_RETRY_S = 0.5
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _ids_fingerprint(chunk_ids: List[str]) -> str:
+    return _text_hash("\n".join(chunk_ids))
+
+
+class _ChunkIds:
+    """
+    Assign each chunk, in corpus order, a stable id derived from (source, text hash, repeat count).
+    offset is the chunk's position within its source; it is recorded for traceability
+    but not part of the id, so edits earlier in a file only touch the chunks that changed.
+    """
+
+    def __init__(self) -> None:
+        self._offsets: Dict[str, int] = {}
+        self._seen: Dict[Tuple[str, str], int] = {}
+
+    def record(self, text: str, source: str) -> Tuple[str, dict]:
+        sha = _text_hash(text)
+        file_name = source.split("|", 1)[0]
+        offset = self._offsets.get(file_name, 0)
+        self._offsets[file_name] = offset + 1
+        repeat = self._seen.get((source, sha), 0)
+        self._seen[(source, sha)] = repeat + 1
+        chunk_id = _text_hash(f"{source}\0{sha}\0{repeat}")[:24]
+        return chunk_id, {"source": source, "file": file_name, "offset": offset, "sha": sha}
+
+
+@dataclass
+class _CachedQuery:
+    """Query embedding plus ranked chunk indices per top_k, valid for one build of the index."""
+
+    embedding: np.ndarray
+    ranked: Dict[int, List[int]] = field(default_factory=dict)
+
+
+@dataclass
+class Retrieval:
+    """Result of one retrieval: chunk texts, stable ids and fused scores in rank order, plus the query embedding."""
+
+    chunks: List[str]
+    chunk_ids: List[str]
+    embedding: Optional[np.ndarray] = None
+    scores: List[float] = field(default_factory=list)
+
+
+def normalize_query(query: str) -> str:
+    """Cache key: case, punctuation and spacing differences map to the same entry."""
+    return " ".join(tokenize(query))
+
+
+def _load_manifest() -> Optional[dict]:
+    try:
+        manifest = json.loads(INDEX_MANIFEST_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("model") != embedder_id()
+        or manifest.get("backend") != VECTOR_BACKEND
+    ):
+        return None
+    return manifest
+
+
+def _save_manifest(chunks: Dict[str, dict]) -> None:
+    """Write the manifest atomically so a crashed build never leaves a half-written file."""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "model": embedder_id(),
+        "backend": VECTOR_BACKEND,
+        "chunks": chunks,
+    }
+    tmp = tmp_path(INDEX_MANIFEST_PATH)
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, INDEX_MANIFEST_PATH)
 
 
 class HybridRAG:
-    def __init__(self):
-        self._chroma = None
-        self._collection = None
+    def __init__(self, embedder=None):
+        """embedder: an already loaded model to reuse (a new index generation keeps the old one's)."""
+        self._store = None
         self._bm25 = None
-        self._documents: List[str] = []
+        self._documents: Sequence[str] = []
         self._doc_sources: List[str] = []
+        # chunk id -> sources of near-duplicate chunks dropped at ingest in its favor
+        self._also_in: Dict[str, List[str]] = {}
+        self._chunk_ids: List[str] = []
         self._id_to_idx: dict = {}
-        self._embeddings_model = None
+        self._embeddings_model = embedder
+        self._query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S)
+        self.corpus_version = ""
 
     def _get_embedding_model(self):
         if self._embeddings_model is None:
-            from sentence_transformers import SentenceTransformer
-            self._embeddings_model = SentenceTransformer("all-MiniLM-L6-v2")
+            self._embeddings_model = load_embedder()
         return self._embeddings_model
 
     def build(self) -> None:
-        """Load data, chunk, index in ChromaDB and BM25."""
-        import chromadb
-        from chromadb.config import Settings
+        """
+        Load data, chunk, index in the vector store and BM25; run by app.warmup.build_indexes(),
+        job processes only open() the published generation.
+        If the generation for data/ is already on disk, it is only memory-mapped.
+        Otherwise the vector store is updated incrementally against the manifest: only new or
+        changed chunks are embedded and upserted, chunks that no longer exist are deleted.
+        """
+        # Ranked indices in the query cache refer to the previous chunk list
+        self._query_cache.clear()
+        fingerprint = data_fingerprint()
+        self.corpus_version = fingerprint
+        if self._open_shared(fingerprint):
+            return
 
-        raw_docs = load_documents()
-        self._documents = [d[0] for d in raw_docs]
-        self._doc_sources = [d[1] for d in raw_docs]
+        # One pass over data/: texts stream to disk, only ids, hashes and sources stay in memory
+        records: List[Tuple[str, dict]] = []
+        also_in: Dict[str, List[str]] = {}
+        ids = _ChunkIds()
 
-        if not self._documents:
+        def texts() -> Iterator[str]:
+            for text, source, merged in iter_corpus():
+                chunk_id, meta = ids.record(text, source)
+                records.append((chunk_id, meta))
+                if merged:
+                    also_in[chunk_id] = merged
+                yield text
+
+        write_texts(texts(), fingerprint)
+        if not records:
             return
+        documents = open_texts(fingerprint)
+        if documents is None or len(documents) != len(records):
+            raise RuntimeError("chunk texts were written but could not be mapped")
+        # Everything below reads texts from the mapped file, a page at a time
+        self._documents = documents
+        self._doc_sources = [meta["source"] for _, meta in records]
+        self._chunk_ids = [chunk_id for chunk_id, _ in records]
+        self._id_to_idx = {id_: i for i, id_ in enumerate(self._chunk_ids)}
+        self._also_in = also_in
 
-        # BM25: tokenize by simple word split
-        tokenized = [re.findall(r"\w+", d.lower()) for d in self._documents]
-        self._bm25 = BM25Okapi(tokenized)
+        # BM25: reuse the saved matrix when an interrupted build of this generation got that far
+        bm25_dir = generation_dir(fingerprint) / "bm25"
+        ids_fingerprint = _ids_fingerprint(self._chunk_ids)
+        bm25 = SparseBM25.load(bm25_dir, ids_fingerprint)
+        if bm25 is None:
+            SparseBM25.build(tokenize(d) for d in self._documents).save(bm25_dir, ids_fingerprint)
 
-        # ChromaDB with persistent storage
-        self._chroma = chromadb.PersistentClient(
-            path=str(CHROMA_PERSIST_DIR),
-            settings=Settings(anonymized_telemetry=False),
-        )
-        collection_name = "ist_admission"
-        try:
-            self._collection = self._chroma.get_collection(collection_name)
-            # Rebuild if empty
-            if self._collection.count() == 0:
-                raise ValueError("empty")
-        except Exception:
-            self._chroma.delete_collection(collection_name)
-            self._collection = self._chroma.create_collection(
-                name=collection_name,
-                metadata={"description": "IST admission knowledge base"},
-            )
+        self._store = open_vector_store()
+        self._sync_store(records)
+
+        # Written last: marks the on-disk set as current for this data/ fingerprint
+        write_corpus_meta(self._chunk_ids, self._doc_sources, fingerprint, also_in=self._also_in)
+        if not self._open_shared(fingerprint):
+            raise RuntimeError("index files were written but could not be reopened")
+
+    def open(self, fingerprint: str) -> bool:
+        """Map an index set another process built for fingerprint; False if it is not (or no longer) on disk."""
+        self._query_cache.clear()
+        if not self._open_shared(fingerprint):
+            return False
+        self.corpus_version = fingerprint
+        return True
+
+    def _open_shared(self, fingerprint: str) -> bool:
+        """Map texts, BM25 postings and the dense index from disk if they were built from this data."""
+        corpus = open_corpus(fingerprint)
+        if corpus is None:
+            return False
+        texts, chunk_ids, sources, also_in = corpus
+        if not chunk_ids:
+            return False
+        bm25 = SparseBM25.load(generation_dir(fingerprint) / "bm25", _ids_fingerprint(chunk_ids))
+        manifest = _load_manifest()
+        if bm25 is None or manifest is None or set(manifest["chunks"]) != set(chunk_ids):
+            return False
+        store = open_vector_store()
+        # Ids, not just the count: the dense index must be the one written for these chunks
+        if store.count() != len(chunk_ids) or store.ids() != set(chunk_ids):
+            return False
+        self._documents = texts
+        self._doc_sources = sources
+        self._also_in = also_in
+        self._chunk_ids = chunk_ids
+        self._id_to_idx = {id_: i for i, id_ in enumerate(chunk_ids)}
+        self._bm25 = bm25
+        self._store = store
+        return True
+
+    def _sync_store(self, records: List[Tuple[str, dict]]) -> None:
+        """
+        Bring the vector store in line with the current chunks, embedding only the delta.
+        records holds ids and hashes only; texts are read from the mapped corpus one
+        UPSERT_BATCH_SIZE slice at a time and encoded EMBED_BATCH_SIZE at a time.
+        """
+        manifest = _load_manifest()
+        indexed = set(manifest["chunks"]) if manifest else set()
+        if manifest is None or self._store.count() != len(indexed):
+            # No usable manifest (first run, model or backend change) or it drifted from
+            # the store: reconcile against the ids the store actually holds.
+            indexed = self._store.ids()
+
+        current = dict(records)
+        stale = [id_ for id_ in indexed if id_ not in current]
+        fresh = [i for i, (id_, _) in enumerate(records) if id_ not in indexed]
+
+        for start in range(0, len(stale), UPSERT_BATCH_SIZE):
+            self._store.delete(stale[start:start + UPSERT_BATCH_SIZE])
+
+        if fresh:
             model = self._get_embedding_model()
-            embeddings = model.encode(self._documents).tolist()
-            ids = [f"doc_{i}" for i in range(len(self._documents))]
-            self._id_to_idx = {id_: i for i, id_ in enumerate(ids)}
-            self._collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                documents=self._documents,
-                metadatas=[{"source": s} for s in self._doc_sources],
-            )
+            for start in range(0, len(fresh), UPSERT_BATCH_SIZE):
+                batch = fresh[start:start + UPSERT_BATCH_SIZE]
+                texts = [self._documents[i] for i in batch]
+                embeddings = model.encode(texts, batch_size=EMBED_BATCH_SIZE)
+                self._store.upsert(
+                    [records[i][0] for i in batch],
+                    embeddings,
+                    documents=texts,
+                    metadatas=[records[i][1] for i in batch],
+                )
+        self._store.persist()
+
+        if manifest is None or manifest["chunks"] != current:
+            _save_manifest(current)
 
     def search(self, query: str, top_k: int = TOP_K, use_fallback_if_empty: bool = True) -> List[str]:
         """
         Hybrid search: vector + keyword, rerank, return top_k chunks.
         If no good results and use_fallback_if_empty, run again with FALLBACK_QUERY.
         """
+        return self.retrieve(query, top_k=top_k, use_fallback_if_empty=use_fallback_if_empty).chunks
+
+    def retrieve(self, query: str, top_k: int = TOP_K, use_fallback_if_empty: bool = True) -> Retrieval:
+        """search() with chunk ids and the query embedding; the embedding is always the original query's."""
         if not self._documents:
-            return []
+            return Retrieval([], [])
 
+        start = time.perf_counter()
         query = query.strip()
         if not query and use_fallback_if_empty:
             query = FALLBACK_QUERY
 
-        # Vector search (ChromaDB)
+        entry = self._query_entry(query)
+        # A reply cancelled during the encode stops here; the embedding is already cached
+        check_cancelled("retrieval")
+        if RERANK_ENABLED:
+            ranked = self._rerank(query, self._ranked(query, entry, max(top_k, RERANK_CANDIDATES)), top_k)
+        else:
+            ranked = self._ranked(query, entry, top_k)
+
+        if not ranked and use_fallback_if_empty and query != FALLBACK_QUERY:
+            ranked = self._ranked(FALLBACK_QUERY, self._query_entry(FALLBACK_QUERY), top_k)
+        observe("ist_retrieval_seconds", time.perf_counter() - start)
+        return self._retrieval(ranked, entry.embedding)
+
+    def search_many(
+        self,
+        queries: Sequence[str],
+        top_k: int = TOP_K,
+        use_fallback_if_empty: bool = True,
+        batch_size: int = SEARCH_BATCH_SIZE,
+    ) -> List[Retrieval]:
+        """
+        retrieve() for many queries at once, for offline evaluation: one batched encode, one
+        matrix-matrix similarity and one BM25 scoring pass per batch, then the per-query rerank
+        when RERANK_ENABLED. Same rankings as retrieve(); bypasses the query cache so bulk runs
+        do not evict live entries.
+        """
+        if not self._documents:
+            return [Retrieval([], []) for _ in queries]
         model = self._get_embedding_model()
-        q_emb = model.encode([query]).tolist()
-        vector_results = self._collection.query(
-            query_embeddings=q_emb,
-            n_results=min(top_k * 2, self._collection.count()),
-            include=["documents", "distances", "ids"],
+        # Fused depth as in retrieve(): the rerank candidates when reranking, else top_k
+        depth = max(top_k, RERANK_CANDIDATES) if RERANK_ENABLED else top_k
+        k = min(depth * 2, self._store.count())
+        fallback: Optional[List[Tuple[int, float]]] = None
+        out: List[Retrieval] = []
+        for start in range(0, len(queries), batch_size):
+            batch = [q.strip() for q in queries[start:start + batch_size]]
+            if use_fallback_if_empty:
+                batch = [q or FALLBACK_QUERY for q in batch]
+            embeddings = model.encode(batch, batch_size=EMBED_BATCH_SIZE)
+            vector_hits = self._store.query_many(embeddings, k)
+            bm25_hits = self._bm25.top_k_many([tokenize(q) for q in batch], depth * 2)
+            for query, embedding, (v_ids, v_distances), (b_top, b_scores) in zip(
+                batch, embeddings, vector_hits, bm25_hits
+            ):
+                ranked = self._fuse(v_ids, v_distances, b_top, b_scores, depth)
+                if RERANK_ENABLED:
+                    ranked = self._rerank(query, ranked, top_k)
+                if not ranked and use_fallback_if_empty and query != FALLBACK_QUERY:
+                    if fallback is None:
+                        fallback = self._ranked(FALLBACK_QUERY, self._query_entry(FALLBACK_QUERY), top_k)
+                    ranked = fallback
+                out.append(self._retrieval(ranked, embedding))
+        return out
+
+    def _retrieval(self, ranked: List[Tuple[int, float]], embedding: Optional[np.ndarray]) -> Retrieval:
+        return Retrieval(
+            chunks=[self._documents[i] for i, _ in ranked],
+            chunk_ids=[self._chunk_ids[i] for i, _ in ranked],
+            embedding=embedding,
+            scores=[score for _, score in ranked],
         )
-        v_ids = vector_results["ids"][0] if vector_results.get("ids") else []
-        v_docs = vector_results["documents"][0] if vector_results["documents"] else []
-        v_distances = vector_results["distances"][0] if vector_results.get("distances") else []
+
+    def _query_entry(self, query: str) -> "_CachedQuery":
+        key = normalize_query(query)
+        entry = self._query_cache.get(key)
+        if entry is None:
+            model = self._get_embedding_model()
+            with span("embed", cached=False):
+                entry = _CachedQuery(embedding=model.encode([query])[0])
+            self._query_cache.put(key, entry)
+        return entry
+
+    def _ranked(self, query: str, entry: "_CachedQuery", top_k: int) -> List[Tuple[int, float]]:
+        """Ranked (chunk index, score) for query, served from the query cache entry when possible."""
+        ranked = entry.ranked.get(top_k)
+        if ranked is None:
+            ranked = self._hybrid_rank(query, entry.embedding, top_k)
+            entry.ranked[top_k] = ranked
+        return ranked
+
+    def _rerank(
+        self, query: str, candidates: List[Tuple[int, float]], top_k: int, timings: Optional[Dict[str, float]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Best min(top_k, RERANK_TOP_K) of candidates by cross-encoder score; the fused top_k if the
+        reranker ran out of budget or is unavailable.
+        """
+        if not candidates:
+            return candidates
+        start = time.perf_counter()
+        try:
+            with span("rerank", candidates=len(candidates)) as attrs:
+                scores = get_reranker().scores(
+                    normalize_query(query),
+                    query,
+                    [(self._chunk_ids[i], self._documents[i]) for i, _ in candidates],
+                )
+                attrs["within_budget"] = scores is not None
+        except Exception as e:
+            logger.warning("reranker failed, using fused order: %s", e)
+            scores = None
+        elapsed = time.perf_counter() - start
+        observe("ist_rerank_seconds", elapsed)
+        if timings is not None:
+            timings["rerank_ms"] = elapsed * 1000
+        if scores is None:
+            inc("ist_reranks_total", result="fallback")
+            return candidates[:top_k]
+        inc("ist_reranks_total", result="reranked")
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [(candidates[i][0], scores[i]) for i in order[:min(top_k, RERANK_TOP_K)]]
+
+    def _hybrid_rank(
+        self, query: str, q_emb, top_k: int, timings: Optional[Dict[str, float]] = None
+    ) -> List[Tuple[int, float]]:
+        """Vector + BM25 + fusion; per-stage milliseconds go into `timings` if given."""
+        t0 = time.perf_counter()
+        # Vector search (squared L2 distances from the configured store)
+        v_ids, v_distances = self._store.query(q_emb, min(top_k * 2, self._store.count()))
+        t1 = time.perf_counter()
 
         # BM25 keyword search
-        tokenized_q = re.findall(r"\w+", query.lower())
-        bm25_scores = self._bm25.get_scores(tokenized_q) if tokenized_q else [0.0] * len(self._documents)
-        bm25_top = sorted(
-            range(len(bm25_scores)),
-            key=lambda i: bm25_scores[i],
-            reverse=True,
-        )[: top_k * 2]
-
-        # Combine: by doc index; Chroma L2: smaller distance = better
-        doc_scores: dict = {}
-        if v_docs and v_distances is not None and v_ids:
-            max_d = max(v_distances) or 1
-            for i, id_ in enumerate(v_ids):
-                idx = self._id_to_idx.get(id_)
-                if idx is not None:
-                    norm_d = v_distances[i] / max_d
-                    doc_scores[idx] = doc_scores.get(idx, 0) + (1.0 - norm_d)
-        for idx in bm25_top:
-            if bm25_scores[idx] > 0:
-                max_b = max(bm25_scores) or 1
-                doc_scores[idx] = doc_scores.get(idx, 0) + (bm25_scores[idx] / max_b)
-
-        # Rerank and take top_k
-        ranked = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        out = [self._documents[i] for i, _ in ranked]
-
-        if not out and use_fallback_if_empty and query != FALLBACK_QUERY:
-            return self.search(FALLBACK_QUERY, top_k=top_k, use_fallback_if_empty=False)
-        return out
+        bm25_top, bm25_top_scores = self._bm25.top_k(tokenize(query), top_k * 2)
+        t2 = time.perf_counter()
+        ranked = self._fuse(v_ids, v_distances, bm25_top, bm25_top_scores, top_k)
+        t3 = time.perf_counter()
+        record_span("vector_query", t0, t1)
+        record_span("bm25", t1, t2)
+        record_span("fusion", t2, t3)
+        if timings is not None:
+            timings["vector_ms"] = (t1 - t0) * 1000
+            timings["bm25_ms"] = (t2 - t1) * 1000
+            timings["fusion_ms"] = (t3 - t2) * 1000
+        return ranked
+
+    def _fuse(self, v_ids, v_distances, bm25_top, bm25_top_scores, top_k: int) -> List[Tuple[int, float]]:
+        """Fused (chunk index, score) for the union of both candidate lists; see app.fusion."""
+        dense_idx, dense_dist = [], []
+        for id_, distance in zip(v_ids, v_distances):
+            idx = self._id_to_idx.get(id_)
+            if idx is not None:
+                dense_idx.append(idx)
+                dense_dist.append(distance)
+        ranked_idx, scores = fuse(dense_idx, dense_dist, bm25_top, bm25_top_scores)
+        if FUSION_DEDUP_NEIGHBORS:
+            return drop_neighbors(ranked_idx, scores, top_k, self._overlapping_neighbors)
+        return list(zip(ranked_idx[:top_k].tolist(), scores[:top_k].tolist()))
+
+    def _overlapping_neighbors(self, a: int, b: int) -> bool:
+        """Consecutive chunks of the same source whose windows overlap (CHUNK_OVERLAP)."""
+        if abs(a - b) != 1 or self._doc_sources[a] != self._doc_sources[b]:
+            return False
+        first, second = self._documents[min(a, b)], self._documents[max(a, b)]
+        head = second[:NEIGHBOR_OVERLAP_PROBE]
+        return len(head) == NEIGHBOR_OVERLAP_PROBE and head in first
+
+    def chunk_source(self, chunk_id: str) -> str:
+        idx = self._id_to_idx.get(chunk_id)
+        return self._doc_sources[idx] if idx is not None else ""
+
+    def chunk_sources(self, chunk_id: str) -> List[str]:
+        """The chunk's own source first, then those of near-duplicates merged into it at ingest."""
+        source = self.chunk_source(chunk_id)
+        return ([source] if source else []) + self._also_in.get(chunk_id, [])
 
+    def cache_stats(self) -> dict:
+        return self._query_cache.stats()
 
-# Singleton for app/agent use
+
+# Singleton for app/agent use. On a published new generation it is replaced, not mutated: a
+# search already holding the old object finishes on it, later get_rag() calls get the new one.
 _rag: Optional[HybridRAG] = None
+_rag_lock = threading.Lock()
+# The generation swapped out last; no newer one is loaded while something still holds it
+_retired: Optional["weakref.ref[HybridRAG]"] = None
+_retired_cache_stats = {"hits": 0, "misses": 0}
+_next_check = 0.0
+_reloading = False
+
+
+def _collect() -> dict:
+    rag = _rag
+    stats = rag.cache_stats() if rag is not None else {"hits": 0, "misses": 0}
+    hits = stats["hits"] + _retired_cache_stats["hits"]
+    return {
+        "ist_query_cache_lookups_total": hits + stats["misses"] + _retired_cache_stats["misses"],
+        "ist_query_cache_hits_total": hits,
+    }
+
+
+def _load_generation(fingerprint: str) -> None:
+    """Background thread: map the new generation, warm it, then swap it in."""
+    global _rag, _retired, _reloading
+    try:
+        current = _rag
+        start = time.perf_counter()
+        rag = HybridRAG(embedder=current._embeddings_model)
+        if not rag.open(fingerprint):
+            # Published files already replaced by a newer build, or not fully visible yet; retry on the next check
+            logger.warning("index generation %s could not be opened; keeping %s", fingerprint[:12], current.corpus_version[:12])
+            inc("ist_index_reloads_total", result="failed")
+            return
+        rag.search(FALLBACK_QUERY)
+        get_fact_store(fingerprint)
+        stats = current.cache_stats()
+        _retired_cache_stats["hits"] += stats["hits"]
+        _retired_cache_stats["misses"] += stats["misses"]
+        _retired = weakref.ref(current)
+        _rag = rag
+        inc("ist_index_reloads_total", result="swapped")
+        logger.info(
+            "index generation %s -> %s (%d chunks) swapped in after %.0f ms",
+            current.corpus_version[:12], fingerprint[:12], len(rag._chunk_ids), (time.perf_counter() - start) * 1000,
+        )
+    except Exception:
+        logger.exception("index reload failed")
+        inc("ist_index_reloads_total", result="failed")
+    finally:
+        _reloading = False
+
+
+def _check_generation() -> None:
+    """Start loading a newly published generation; at most one load, and two generations, at a time."""
+    global _next_check, _reloading
+    now = time.monotonic()
+    if now < _next_check or _reloading:
+        return
+    _next_check = now + INDEX_RELOAD_CHECK_S
+    generation = read_generation()
+    if generation is None or generation["fingerprint"] == _rag.corpus_version:
+        return
+    if _retired is not None and _retired() is not None:
+        return  # calls still running on the generation before this one
+    with _rag_lock:
+        if _reloading:
+            return
+        _reloading = True
+    threading.Thread(
+        target=_load_generation, args=(generation["fingerprint"],), name="index-reload", daemon=True
+    ).start()
+
+
+def _open_published() -> HybridRAG:
+    """
+    Map the published generation, even if data/ has changed since: only build_indexes() (at
+    worker startup, or the data/ watcher) builds, so two processes never write the same files.
+    The published set can be briefly unopenable while a rebuild replaces the dense index; the
+    rebuild then publishes its own generation, which is opened instead.
+    """
+    deadline = time.monotonic() + OPEN_WAIT_S
+    while True:
+        generation = read_generation()
+        if generation is None:
+            # Nothing built yet (a CLI or benchmark on a fresh checkout): this process is the builder
+            from app.warmup import build_indexes
+
+            return build_indexes()
+        rag = HybridRAG()
+        if not generation.get("chunks"):
+            rag.corpus_version = generation["fingerprint"]  # empty data/: nothing to map
+            return rag
+        if rag.open(generation["fingerprint"]):
+            return rag
+        if time.monotonic() >= deadline:
+            raise RuntimeError(
+                f"index generation {generation['fingerprint'][:12]} could not be opened; run build_indexes()"
+            )
+        time.sleep(OPEN_RETRY_S)
 
 
 def get_rag() -> HybridRAG:
     global _rag
     if _rag is None:
-        _rag = HybridRAG()
-        _rag.build()
+        with _rag_lock:
+            if _rag is None:
+                rag = _open_published()
+                _rag = rag
+                register_collector(_collect)
+    elif INDEX_RELOAD_ENABLED:
+        _check_generation()
     return _rag
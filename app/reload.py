@@ -0,0 +1,151 @@
+"""Hot reload of data/: rebuild the shared indexes as a new generation when data/ changes or a reload is requested.
+
+Runs in the agent worker's main process (the one that ran build_indexes() at startup). Every
+DATA_WATCH_INTERVAL_S it compares the names, sizes and mtimes of data/ files with the last poll
+and checks for RELOAD_REQUEST_PATH (created by POST /admin/reload). A change is built once it has
+been stable for one poll, so a file still being copied is not indexed half-written.
+
+The build writes the index files with atomic replaces and publishes the generation last; job
+processes notice on get_rag() and swap to it (see app.rag). Old memory-mapped files stay valid
+for searches still running on the previous generation. With VECTOR_BACKEND=chroma the dense
+collection is updated in place instead, so only texts, BM25 and facts are double-buffered.
+
+The watcher leaves a heartbeat in RELOAD_WATCHER_PATH on every poll. POST /admin/reload only
+queues a request when watcher_alive() sees it, i.e. the worker shares this chroma_db/.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config import DATA_DIR, DATA_WATCH_INTERVAL_S, RELOAD_REQUEST_PATH, RELOAD_WATCHER_PATH, VECTOR_BACKEND
+from app.shared_index import data_fingerprint, read_generation
+
+logger = logging.getLogger("ist-agent.reload")
+
+Snapshot = Tuple[Tuple[str, int, int], ...]
+
+
+def _snapshot(data_dir: Path = DATA_DIR) -> Snapshot:
+    """(name, size, mtime_ns) of every file in data_dir: a stat per file, no reads."""
+    try:
+        return tuple(
+            (p.name, st.st_size, st.st_mtime_ns)
+            for p in sorted(Path(data_dir).iterdir()) if p.is_file()
+            for st in (p.stat(),)
+        )
+    except OSError:
+        return ()
+
+
+# A watcher that missed this many polls is taken to be gone
+HEARTBEAT_MISSED_POLLS = 3
+# Poll period when DATA_WATCH_INTERVAL_S is 0 (request-only mode still polls for the request file)
+REQUEST_POLL_S = 10.0
+
+
+def _beat(poll_s: float, path: Path = RELOAD_WATCHER_PATH) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"pid": os.getpid(), "at": time.time(), "poll_s": poll_s}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def watcher_alive(path: Path = RELOAD_WATCHER_PATH) -> bool:
+    """True if a watcher on this filesystem polled recently enough to pick up a reload request."""
+    try:
+        beat = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return time.time() - beat.get("at", 0) <= HEARTBEAT_MISSED_POLLS * beat.get("poll_s", REQUEST_POLL_S)
+
+
+def request_reload(path: Path = RELOAD_REQUEST_PATH) -> None:
+    """Ask the watcher for a rebuild on its next poll, even if no data/ file looks changed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(str(time.time()), encoding="utf-8")
+
+
+class DataWatcher:
+    """Polls data/ and the reload request file; one rebuild at a time, in its own thread."""
+
+    def __init__(self, interval_s: float = DATA_WATCH_INTERVAL_S) -> None:
+        self.interval_s = interval_s
+        self._embedder = None
+        self._seen = _snapshot()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="data-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _heartbeat(self) -> None:
+        try:
+            _beat(self.interval_s or REQUEST_POLL_S)
+        except OSError as e:
+            logger.warning("could not write watcher heartbeat: %s", e)
+
+    def _loop(self) -> None:
+        poll_s = self.interval_s or REQUEST_POLL_S
+        pending = False
+        self._heartbeat()
+        while not self._stop.wait(poll_s):
+            self._heartbeat()
+            requested = RELOAD_REQUEST_PATH.exists()
+            current = _snapshot()
+            if self.interval_s and current != self._seen:
+                # Changed since the last poll: wait until it holds still for one interval
+                self._seen = current
+                pending = True
+                continue
+            if not (pending or requested):
+                continue
+            pending = False
+            try:
+                RELOAD_REQUEST_PATH.unlink()
+            except FileNotFoundError:
+                pass
+            self.rebuild(force=requested)
+
+    def rebuild(self, force: bool = False) -> Optional[str]:
+        """Build and publish a generation if data/ differs from the published one (or force); returns its fingerprint."""
+        from app.warmup import build_indexes
+
+        published = read_generation()
+        if not force and published is not None and published["fingerprint"] == data_fingerprint():
+            return None
+        try:
+            rag = build_indexes(self._embedder)
+        except Exception:
+            logger.exception("index rebuild failed; job processes keep the current generation")
+            return None
+        self._embedder = rag._embeddings_model or self._embedder
+        return rag.corpus_version
+
+
+_watcher: Optional[DataWatcher] = None
+
+
+def start_watcher() -> DataWatcher:
+    """Start the data/ watcher in this process. Idempotent."""
+    global _watcher
+    if _watcher is None:
+        _watcher = DataWatcher()
+        _watcher.start()
+        logger.info(
+            "watching %s every %ss for changes and %s for reload requests",
+            DATA_DIR, DATA_WATCH_INTERVAL_S or "-", RELOAD_REQUEST_PATH.name,
+        )
+        if VECTOR_BACKEND == "chroma":
+            logger.warning(
+                "VECTOR_BACKEND=chroma: reloads update the dense collection in place, so calls still "
+                "on the previous generation search the new vectors until they swap"
+            )
+    return _watcher
@@ -0,0 +1,98 @@
+"""Optional cross-encoder reranking of fused candidates, within a per-query time budget."""
+import logging
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from config import (
+    QUERY_CACHE_TTL_S,
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_SIZE,
+    RERANK_MODEL,
+)
+from app.cache import LRUCache
+from app.cancellation import check_cancelled
+
+logger = logging.getLogger("ist-agent.rerank")
+
+
+class Reranker:
+    """
+    Scores (query, chunk) pairs with a small local cross-encoder, RERANK_BATCH_SIZE pairs per
+    forward pass. Scores are cached per (normalized query, chunk id), so a repeated question
+    only scores chunks it has not seen. A batch is not started if the previous batch's time
+    says it would end past RERANK_BUDGET_MS; the caller then keeps the fused order. Nor is it
+    started once the reply was cancelled (app.cancellation).
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS) -> None:
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self._model = None
+        self._unavailable = False
+        self._load_lock = threading.Lock()
+        self._scores = LRUCache(RERANK_CACHE_SIZE, QUERY_CACHE_TTL_S)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def prewarm(self) -> None:
+        """Load the model and run one pair, so the first real query's budget is not spent on setup."""
+        self._get_model().predict([("warm-up", "warm-up")])
+
+    def scores(self, query_key: str, query: str, candidates: Sequence[Tuple[str, str]]) -> Optional[List[float]]:
+        """
+        Cross-encoder score for each (chunk id, text) in candidates, or None if the budget ran
+        out first. Pairs scored before the budget ran out are still cached.
+        """
+        start = time.perf_counter()
+        out: List[Optional[float]] = [self._scores.get((query_key, chunk_id)) for chunk_id, _ in candidates]
+        todo = [i for i, score in enumerate(out) if score is None]
+        if not todo:
+            return out
+        if self._unavailable:
+            return None
+        try:
+            model = self._get_model()
+        except Exception as e:
+            # Missing package or model: warn once, then every query keeps the fused order
+            logger.warning("cross-encoder %s unavailable, reranking disabled: %s", self.model_name, e)
+            self._unavailable = True
+            return None
+        batch_ms = 0.0
+        for b in range(0, len(todo), RERANK_BATCH_SIZE):
+            check_cancelled("retrieval")
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if b and elapsed_ms + batch_ms > self.budget_ms:
+                return None
+            t0 = time.perf_counter()
+            batch = todo[b:b + RERANK_BATCH_SIZE]
+            predicted = model.predict([(query, candidates[i][1]) for i in batch], batch_size=len(batch))
+            batch_ms = (time.perf_counter() - t0) * 1000
+            for i, score in zip(batch, predicted):
+                out[i] = float(score)
+                self._scores.put((query_key, candidates[i][0]), out[i])
+        # A batch that ended past the budget still counts: its time is already spent
+        return out
+
+    def clear(self) -> None:
+        self._scores.clear()
+
+    def stats(self) -> dict:
+        return self._scores.stats()
+
+
+_reranker: Optional[Reranker] = None
+
+
+def get_reranker() -> Reranker:
+    global _reranker
+    if _reranker is None:
+        _reranker = Reranker()
+    return _reranker
@@ -0,0 +1,81 @@
+"""Bulk retrieval CLI: ranked chunk ids and scores for a JSONL file of queries.
+
+    python -m app.search_cli questions.jsonl -o ranked.jsonl --top-k 8
+
+Each input line is {"query": "...", "id": optional} or a bare JSON string. Each output line
+is {"id", "query", "results": [{"chunk_id", "source", "also_in", "score"}, ...]}, in input order, so
+two runs against different data/ snapshots can be diffed directly.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import List, Tuple
+
+from config import TOP_K
+
+
+def read_queries(path: str) -> List[Tuple[str, str]]:
+    """(id, query) per non-empty line; id defaults to the 1-based line number."""
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                out.append((str(n), record))
+            else:
+                out.append((str(record.get("id", n)), record["query"]))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run hybrid retrieval for every query in a JSONL file")
+    parser.add_argument("queries", help="JSONL: {\"query\": ..., \"id\": ...} or a JSON string per line")
+    parser.add_argument("-o", "--output", default="-", help="output JSONL (default stdout)")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--no-fallback", action="store_true", help="return nothing instead of the fallback query's chunks")
+    args = parser.parse_args()
+
+    from app.rag import get_rag
+
+    start = time.perf_counter()
+    rag = get_rag()
+    loaded = time.perf_counter()
+    queries = read_queries(args.queries)
+    results = rag.search_many(
+        [q for _, q in queries], top_k=args.top_k, use_fallback_if_empty=not args.no_fallback
+    )
+    searched = time.perf_counter()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for (query_id, query), r in zip(queries, results):
+            out.write(json.dumps({
+                "id": query_id,
+                "query": query,
+                "results": [
+                    {
+                        "chunk_id": cid,
+                        "source": rag.chunk_source(cid),
+                        "also_in": rag.chunk_sources(cid)[1:],
+                        "score": round(score, 6),
+                    }
+                    for cid, score in zip(r.chunk_ids, r.scores)
+                ],
+            }) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(
+        f"{len(queries)} queries in {searched - loaded:.2f}s "
+        f"({(searched - loaded) / max(len(queries), 1) * 1000:.2f} ms/query; index load {loaded - start:.2f}s), "
+        f"corpus {rag.corpus_version[:12]}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Chunk texts as read-only memory-mapped files, so every worker process shares one copy in the page cache."""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    DATA_DIR,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    INDEX_GENERATION_PATH,
+    INDEX_GENERATIONS_DIR,
+)
+
+# Bump when chunking or loading changes, so indexes built by older code are not reused
+LOADER_VERSION = 3
+
+
+def data_fingerprint(data_dir: Path = DATA_DIR) -> str:
+    """Hash of the chunking and dedup settings and every file name and its bytes under data_dir (a few ms for the bundled corpus)."""
+    dedup = f"{DEDUP_THRESHOLD:g}" if DEDUP_ENABLED else "off"
+    h = hashlib.sha1(f"loader-{LOADER_VERSION}-{CHUNK_SIZE}-{CHUNK_OVERLAP}-dedup-{dedup}".encode())
+    data_path = Path(data_dir)
+    if data_path.exists():
+        for path in sorted(data_path.iterdir()):
+            if path.is_file():
+                h.update(path.name.encode("utf-8") + b"\0")
+                h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def tmp_path(path: Path) -> Path:
+    """A temp name next to path that no other writer (process or thread) uses, for write-then-os.replace."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+def generation_dir(fingerprint: str) -> Path:
+    """Corpus, BM25 and facts files built from one data fingerprint; a new fingerprint never touches another's."""
+    return INDEX_GENERATIONS_DIR / fingerprint[:16]
+
+
+class MappedTexts(Sequence[str]):
+    """List-like view of UTF-8 texts stored back to back in one file; decoded on access."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def _corpus_dir(fingerprint: str, directory: Optional[Path]) -> Path:
+    return Path(directory or generation_dir(fingerprint) / "corpus")
+
+
+def write_texts(texts: Iterable[str], fingerprint: str, directory: Optional[Path] = None) -> int:
+    """
+    Stream texts into texts.bin and their offsets into offsets.npy, one text in memory at a
+    time; returns how many. The set is complete only once write_corpus_meta() has run.
+    directory defaults to the fingerprint's generation_dir()/corpus.
+    """
+    directory = _corpus_dir(fingerprint, directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    offsets = [0]
+    tmp = tmp_path(directory / "texts.bin")
+    try:
+        with open(tmp, "wb") as f:
+            for text in texts:
+                encoded = text.encode("utf-8")
+                f.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+    except BaseException:
+        tmp.unlink(missing_ok=True)  # texts is a generator over data/, which can fail midway
+        raise
+    os.replace(tmp, directory / "texts.bin")
+    tmp = tmp_path(directory / "offsets.npy")
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(offsets, dtype=np.int64))
+    os.replace(tmp, directory / "offsets.npy")
+    return len(offsets) - 1
+
+
+def write_corpus_meta(
+    chunk_ids: Sequence[str],
+    sources: Sequence[str],
+    fingerprint: str,
+    directory: Optional[Path] = None,
+    also_in: Optional[Dict[str, List[str]]] = None,
+) -> None:
+    """
+    Write meta.json after write_texts(); it goes last and marks the set as complete.
+    also_in maps a chunk id to the other sources of the near-duplicates dropped in its favor.
+    """
+    directory = _corpus_dir(fingerprint, directory)
+    tmp = tmp_path(directory / "meta.json")
+    meta = {
+        "fingerprint": fingerprint,
+        "chunk_ids": list(chunk_ids),
+        "sources": list(sources),
+        "also_in": also_in or {},
+    }
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, directory / "meta.json")
+
+
+def open_texts(fingerprint: str, directory: Optional[Path] = None) -> Optional[MappedTexts]:
+    """Map texts.bin and offsets.npy as written by write_texts(), or None if missing or truncated."""
+    directory = _corpus_dir(fingerprint, directory)
+    try:
+        offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+        size = int(offsets[-1])
+        blob = (
+            np.memmap(directory / "texts.bin", dtype=np.uint8, mode="r")
+            if size else np.zeros(0, dtype=np.uint8)
+        )
+    except Exception:
+        return None
+    if len(blob) != size:
+        return None
+    return MappedTexts(blob, offsets)
+
+
+def open_corpus(
+    fingerprint: str, directory: Optional[Path] = None
+) -> Optional[Tuple[MappedTexts, List[str], List[str], Dict[str, List[str]]]]:
+    """(texts, chunk_ids, sources, also_in) if the files on disk were built from the same data, else None."""
+    directory = _corpus_dir(fingerprint, directory)
+    try:
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("fingerprint") != fingerprint:
+        return None
+    texts = open_texts(fingerprint, directory)
+    if texts is None or len(texts) != len(meta["chunk_ids"]):
+        return None
+    return texts, meta["chunk_ids"], meta["sources"], meta.get("also_in", {})
+
+
+def publish_generation(fingerprint: str, chunks: int, path: Path = INDEX_GENERATION_PATH) -> None:
+    """
+    Mark the index files on disk as a complete set for fingerprint; written after all of them.
+    Generation directories other than this one and the one it replaces are then removed.
+    """
+    previous = read_generation(path)
+    tmp = tmp_path(path)
+    tmp.write_text(json.dumps({
+        "fingerprint": fingerprint,
+        "dir": generation_dir(fingerprint).name,
+        "chunks": chunks,
+        "built_at": time.time(),
+    }), encoding="utf-8")
+    os.replace(tmp, path)
+    keep = {generation_dir(fingerprint).name}
+    if previous is not None:
+        keep.add(previous.get("dir") or generation_dir(previous["fingerprint"]).name)
+    # Processes still mapping a removed generation keep reading it; only new opens need it gone
+    if INDEX_GENERATIONS_DIR.exists():
+        for old in INDEX_GENERATIONS_DIR.iterdir():
+            if old.is_dir() and old.name not in keep:
+                shutil.rmtree(old, ignore_errors=True)
+
+
+def read_generation(path: Path = INDEX_GENERATION_PATH) -> Optional[dict]:
+    """The last published generation ({"fingerprint", "dir", "chunks", "built_at"}), or None before the first build."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,86 @@
+"""Speculative retrieval: search on interim transcripts so the final turn finds its context ready."""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from config import SPECULATIVE_MIN_WORDS, TOP_K
+from app.rag import Retrieval, get_rag, normalize_query
+from app.tracing import run_in_context
+
+logger = logging.getLogger("ist-agent.speculative")
+
+
+class SpeculativeRetriever:
+    """
+    One per call. Feed it every transcript event; when the user's turn is committed, take()
+    returns the retrieval already run (or still running) for that exact text, else None.
+
+    The text being speculated on is the turn's final segments so far plus the latest interim.
+    A new search starts only when that text changes after normalization (case, punctuation,
+    spacing), and a search still queued behind a newer one is cancelled. Searches run on a
+    single per-call thread, so a fast talker never has more than one stale search in flight.
+    """
+
+    def __init__(self, top_k: int = TOP_K, min_words: int = SPECULATIVE_MIN_WORDS) -> None:
+        self._top_k = top_k
+        self._min_words = min_words
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-rag")
+        self._finals: List[str] = []
+        self._key = ""
+        self._future: Optional[asyncio.Future] = None
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+
+    def on_transcript(self, transcript: str, is_final: bool) -> None:
+        """Call from the event loop for every interim and final STT transcript of the user's turn."""
+        transcript = transcript.strip()
+        if not transcript:
+            return
+        text = " ".join(self._finals + [transcript])
+        if is_final:
+            self._finals.append(transcript)
+        key = normalize_query(text)
+        if key == self._key or len(key.split()) < self._min_words:
+            return
+        if self._future is not None and not self._future.done():
+            self._future.cancel()
+        self._key = key
+        # With the caller's context, so embed/vector_query/bm25 spans land on the current turn
+        self._future = asyncio.get_running_loop().run_in_executor(
+            self._executor, run_in_context(self._search, text)
+        )
+        self.started += 1
+
+    def _search(self, text: str) -> Retrieval:
+        # Also fills HybridRAG's query cache, so a later identical search is free
+        return get_rag().retrieve(text, top_k=self._top_k)
+
+    async def take(self, query: str) -> Optional[Retrieval]:
+        """Prefetched retrieval for the committed query, waiting for it if still running; resets for the next turn."""
+        future, key = self._future, self._key
+        self._finals, self._key, self._future = [], "", None
+        if future is None or key != normalize_query(query):
+            self.misses += 1
+            if future is not None:
+                future.cancel()
+            return None
+        try:
+            # Shielded: if this turn is interrupted the search still completes into the query cache
+            retrieval = await asyncio.shield(future)
+        except Exception as e:
+            logger.warning("speculative retrieval failed: %s", e)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return retrieval
+
+    def close(self) -> None:
+        if self._future is not None:
+            self._future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(
+            "speculative retrieval: %d searches started, %d turns reused one, %d missed",
+            self.started, self.hits, self.misses,
+        )
@@ -0,0 +1,116 @@
+"""Summarize per-turn trace spans: p50/p95 per stage, broken down by room.
+
+    python -m app.trace_report [--room ROOM] [--since-hours 24] [--json] [files ...]
+
+Span stages (embed, vector_query, bm25, fusion, rerank, llm) report their duration. Marks
+(transcript_final, llm_first_token, tts_first_byte, first_audio_played) report the time
+since end_of_speech in the same turn, which is the latency the caller hears.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from config import TRACE_DIR
+
+SPAN_STAGES = ("embed", "vector_query", "bm25", "fusion", "rerank", "llm", "turn")
+MARK_STAGES = ("transcript_final", "llm_first_token", "tts_first_byte", "first_audio_played")
+ALL_ROOMS = "(all)"
+
+
+def read_spans(paths: Iterable[Path], since: float = 0.0) -> List[dict]:
+    spans = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash
+                if record.get("start", 0) >= since:
+                    spans.append(record)
+    return spans
+
+
+def stage_samples(spans: List[dict]) -> Dict[str, Dict[str, List[float]]]:
+    """room -> stage -> samples in ms (one per turn for marks, one per span otherwise)."""
+    turns: Dict[str, List[dict]] = defaultdict(list)
+    for s in spans:
+        turns[s["trace_id"]].append(s)
+
+    samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    for records in turns.values():
+        room = records[0]["room"]
+        # Last occurrence wins: a turn can have several final transcript segments
+        marks = {r["name"]: r["start"] for r in sorted(records, key=lambda r: r["start"]) if r["duration_ms"] == 0}
+        eos = marks.get("end_of_speech")
+        for r in records:
+            if r["name"] in SPAN_STAGES and r["duration_ms"] > 0:
+                if r["name"] == "turn" and (r.get("attrs") or {}).get("abandoned"):
+                    continue
+                for key in (room, ALL_ROOMS):
+                    samples[key][r["name"]].append(r["duration_ms"])
+        if eos is not None:
+            for name in MARK_STAGES:
+                if name in marks and marks[name] >= eos:
+                    for key in (room, ALL_ROOMS):
+                        samples[key][f"eos->{name}"].append((marks[name] - eos) * 1000)
+        for key in (room, ALL_ROOMS):
+            samples[key]["_turns"].append(1.0)
+    return samples
+
+
+def summarize(samples: Dict[str, Dict[str, List[float]]]) -> Dict[str, dict]:
+    order = list(SPAN_STAGES) + [f"eos->{m}" for m in MARK_STAGES]
+    out = {}
+    for room in sorted(samples, key=lambda r: (r != ALL_ROOMS, r)):
+        stages = samples[room]
+        out[room] = {"turns": len(stages.get("_turns", []))}
+        for name in order:
+            values = stages.get(name)
+            if values:
+                p50, p95 = np.percentile(values, [50, 95])
+                out[room][name] = {"n": len(values), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1)}
+    return out
+
+
+def print_table(summary: Dict[str, dict]) -> None:
+    for room, stages in summary.items():
+        print(f"\n{room}  ({stages['turns']} turns)")
+        print(f"  {'stage':<26} {'n':>6} {'p50 ms':>10} {'p95 ms':>10}")
+        for name, row in stages.items():
+            if name == "turns":
+                continue
+            print(f"  {name:<26} {row['n']:>6} {row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="p50/p95 per stage and room from trace spans")
+    parser.add_argument("files", nargs="*", help=f"span JSONL files (default: {TRACE_DIR}/*.jsonl)")
+    parser.add_argument("--room", help="only this room")
+    parser.add_argument("--since-hours", type=float, default=0.0, help="only turns from the last N hours")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    paths = [Path(f) for f in args.files] or sorted(Path(TRACE_DIR).glob("*.jsonl"))
+    if not paths:
+        print(f"no span files in {TRACE_DIR}", file=sys.stderr)
+        sys.exit(1)
+    since = time.time() - args.since_hours * 3600 if args.since_hours else 0.0
+    spans = read_spans(paths, since)
+    if args.room:
+        spans = [s for s in spans if s["room"] == args.room]
+    summary = summarize(stage_samples(spans))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_table(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Per-turn latency spans: one trace per room and user turn, written to JSONL and optionally to OpenTelemetry.
+
+Stages recorded on a turn (spans have a duration, marks are points in time):
+    end_of_speech, transcript_final            marks, from AgentSession events
+    embed, vector_query, bm25, fusion, rerank  spans, HybridRAG
+    llm (+ llm_first_token mark)               span, app.groq_client / app.llm
+    tts_first_byte                             mark, EdgeTTS
+    first_audio_played                         mark, agent starts speaking (ends the turn)
+
+Code that runs for a turn opens `use_turn(turn)`; span()/mark() anywhere below it (including
+executor threads started with run_in_context) attach to that turn and are no-ops otherwise.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from config import TRACE_DIR, TRACE_ENABLED, TRACE_MAX_MB, TRACE_OTEL_ENDPOINT, TRACE_RETENTION_DAYS
+
+logger = logging.getLogger("ist-agent.tracing")
+
+# perf_counter() -> wall-clock seconds, so spans from different processes line up
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+
+def wall_time(perf: float) -> float:
+    return perf + _EPOCH_OFFSET
+
+
+class JsonlSink:
+    """
+    Appends one JSON line per span to TRACE_DIR/spans-<pid>.jsonl (one file per process, no
+    cross-process locking). Past max_mb the file is renamed to spans-<pid>.<unix time ns>.jsonl and
+    a new one started; span files not written to for retention_days are then deleted.
+    """
+
+    def __init__(self, directory=TRACE_DIR, max_mb: float = TRACE_MAX_MB, retention_days: float = TRACE_RETENTION_DAYS) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self._dir = directory
+        self._path = directory / f"spans-{os.getpid()}.jsonl"
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._retention_s = retention_days * 86400
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._remove_expired()
+
+    def write(self, record: dict) -> None:
+        # ASCII-only (json.dumps escapes the rest), so len() is the byte count
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._path, "a", encoding="utf-8")
+                self._size = self._file.tell()
+            if self._size and self._size + len(line) > self._max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+            self._size += len(line)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        os.replace(self._path, self._path.with_name(f"{self._path.stem}.{time.time_ns()}.jsonl"))
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._size = 0
+        self._remove_expired()
+
+    def _remove_expired(self) -> None:
+        """Delete span files (any process's, including exited ones) last written before the retention window."""
+        cutoff = time.time() - self._retention_s
+        for path in self._dir.glob("spans-*.jsonl"):
+            try:
+                if path != self._path and path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+class OtelExporter:
+    """
+    Re-emits finished spans through the OpenTelemetry SDK (OTLP/HTTP to TRACE_OTEL_ENDPOINT),
+    each turn as one OTel trace: a root "turn" span with every stage as a child.
+    """
+
+    def __init__(self, endpoint: str) -> None:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": "ist-agent"}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._trace = trace
+        self._tracer = provider.get_tracer("ist-agent")
+        self._roots: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _root(self, turn: "TurnTrace"):
+        with self._lock:
+            root = self._roots.get(turn.trace_id)
+            if root is None:
+                root = self._tracer.start_span(
+                    "turn",
+                    start_time=int(turn.started * 1e9),
+                    attributes={"room": turn.room, "turn": turn.turn, "ist.trace_id": turn.trace_id},
+                )
+                self._roots[turn.trace_id] = root
+            return root
+
+    def export(self, turn: "TurnTrace", record: dict) -> None:
+        ctx = self._trace.set_span_in_context(self._root(turn))
+        start = int(record["start"] * 1e9)
+        span = self._tracer.start_span(
+            record["name"], context=ctx, start_time=start,
+            attributes={k: v for k, v in record.get("attrs", {}).items() if v is not None},
+        )
+        span.end(end_time=start + int(record["duration_ms"] * 1e6))
+
+    def finish(self, turn: "TurnTrace", end: float) -> None:
+        with self._lock:
+            root = self._roots.pop(turn.trace_id, None)
+        if root is not None:
+            root.end(end_time=int(end * 1e9))
+
+
+_sink: Optional[JsonlSink] = None
+_otel: Optional[OtelExporter] = None
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _exporters():
+    global _sink, _otel, _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _sink = JsonlSink()
+                if TRACE_OTEL_ENDPOINT:
+                    try:
+                        _otel = OtelExporter(TRACE_OTEL_ENDPOINT)
+                    except ImportError:
+                        logger.warning("TRACE_OTEL_ENDPOINT set but opentelemetry-sdk is not installed; JSONL only")
+                _initialized = True
+    return _sink, _otel
+
+
+class TurnTrace:
+    """One user turn in one room; every span and mark it records carries its trace id."""
+
+    def __init__(self, room: str, turn: int, started: Optional[float] = None) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.room = room
+        self.turn = turn
+        self.started = started if started is not None else time.time()
+        self.finished = False
+        self._marked: set = set()
+
+    def record(self, name: str, start: float, duration_ms: float, **attrs) -> None:
+        """Record a finished span; start is wall-clock seconds."""
+        record = {
+            "trace_id": self.trace_id,
+            "room": self.room,
+            "turn": self.turn,
+            "name": name,
+            "start": round(start, 6),
+            "offset_ms": round((start - self.started) * 1000, 3),
+            "duration_ms": round(duration_ms, 3),
+        }
+        if attrs:
+            record["attrs"] = attrs
+        sink, otel = _exporters()
+        try:
+            sink.write(record)
+            if otel is not None:
+                otel.export(self, record)
+        except Exception as e:
+            logger.warning("could not record span %s: %s", name, e)
+
+    def mark(self, name: str, at: Optional[float] = None, once: bool = True, **attrs) -> None:
+        """Point-in-time event (zero-duration span); with once=True only the first per turn counts."""
+        if once:
+            if name in self._marked:
+                return
+            self._marked.add(name)
+        self.record(name, at if at is not None else time.time(), 0.0, **attrs)
+
+    def finish(self, **attrs) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        end = time.time()
+        self.record("turn", self.started, (end - self.started) * 1000, **attrs)
+        _, otel = _exporters()
+        if otel is not None:
+            otel.finish(self, end)
+
+
+class RoomTracer:
+    """Turn bookkeeping for one room: a new TurnTrace each time the user starts speaking."""
+
+    def __init__(self, room: str) -> None:
+        self.room = room
+        self.current: Optional[TurnTrace] = None
+        self._turns = 0
+
+    def new_turn(self) -> Optional[TurnTrace]:
+        if not TRACE_ENABLED:
+            return None
+        if self.current is not None and not self.current.finished:
+            self.current.finish(abandoned=True)
+        self._turns += 1
+        self.current = TurnTrace(self.room, self._turns)
+        return self.current
+
+    def mark(self, name: str, at: Optional[float] = None, once: bool = True, **attrs) -> None:
+        if self.current is not None and not self.current.finished:
+            self.current.mark(name, at=at, once=once, **attrs)
+
+    def finish_turn(self, **attrs) -> None:
+        if self.current is not None:
+            self.current.finish(**attrs)
+
+
+_current_turn: contextvars.ContextVar[Optional[TurnTrace]] = contextvars.ContextVar("trace_turn", default=None)
+
+
+def current_turn() -> Optional[TurnTrace]:
+    return _current_turn.get()
+
+
+@contextmanager
+def use_turn(turn: Optional[TurnTrace]) -> Iterator[Optional[TurnTrace]]:
+    token = _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _current_turn.reset(token)
+
+
+def run_in_context(fn: Callable, *args):
+    """Wrap fn for run_in_executor so spans recorded in the thread still see the current turn."""
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """Time the block as a span of the current turn. The yielded dict adds attributes."""
+    turn = _current_turn.get()
+    if turn is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        turn.record(name, wall_time(start), (time.perf_counter() - start) * 1000, **attrs)
+
+
+def record_span(name: str, start_perf: float, end_perf: float, **attrs) -> None:
+    """Span of the current turn from perf_counter() timestamps taken elsewhere."""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.record(name, wall_time(start_perf), (end_perf - start_perf) * 1000, **attrs)
+
+
+def mark(name: str, at_perf: Optional[float] = None, **attrs) -> None:
+    """Mark on the current turn, now or at a perf_counter() timestamp taken elsewhere."""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.mark(name, at=wall_time(at_perf) if at_perf is not None else None, **attrs)
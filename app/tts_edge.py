@@ -1,17 +1,33 @@
-"""Edge-TTS plugin for LiveKit Agents: high quality, free, fast."""
+"""Edge-TTS plugin for LiveKit Agents: high quality, free, fast. Streams per sentence."""
 from __future__ import annotations
 
+import asyncio
+import time
 import uuid
+from contextlib import aclosing
 from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional
 
 import edge_tts
-from livekit.agents import tts
+from livekit.agents import tokenize, tts
 from livekit.agents.types import APIConnectOptions, DEFAULT_API_CONNECT_OPTIONS
+from livekit.agents.utils import codecs
+
+from app.audio_cache import audio_key, get_audio_cache
+from app.cancellation import observe_stopped
+from app.metrics import inc, observe
+from app.tracing import RoomTracer, TurnTrace
 
 # Edge-TTS typically outputs 24kHz mono MP3
 SAMPLE_RATE = 24000
 NUM_CHANNELS = 1
 DEFAULT_VOICE = "en-US-AriaNeural"
+# Sentences synthesized at once: N+1 is fetched while N's audio is still being played out
+MAX_PARALLEL_SENTENCES = 2
+# audio-24khz-48kbitrate-mono-mp3 is constant bitrate: 6000 bytes per second of speech
+MP3_BYTES_PER_S = 48000 / 8
+# Speaking rate of the neural voices at rate "+0%", for audio not synthesized yet
+SPEECH_CHARS_PER_S = 15.0
 
 
 @dataclass
@@ -21,6 +37,38 @@ class _EdgeOptions:
     volume: str
 
 
+async def _edge_audio(text: str, opts: _EdgeOptions) -> AsyncIterator[bytes]:
+    """MP3 chunks for text, yielded as Edge-TTS delivers them."""
+    communicate = edge_tts.Communicate(text, opts.voice, rate=opts.rate, volume=opts.volume)
+    async for chunk in communicate.stream():
+        if chunk.get("type") == "audio" and chunk.get("data"):
+            yield chunk["data"]
+
+
+async def _cached_audio(text: str, opts: _EdgeOptions) -> AsyncIterator[bytes]:
+    """Replay cached MP3 for (text, voice, rate, volume), or synthesize it and cache the result."""
+    cache = get_audio_cache()
+    key = audio_key(text, opts.voice, opts.rate, opts.volume)
+    data = await cache.get(key)
+    if data is not None:
+        yield data
+        return
+    parts = []
+    async for data in _edge_audio(text, opts):
+        parts.append(data)
+        yield data
+    # Only complete syntheses are cached; an interrupted stream never gets here
+    await cache.put(key, b"".join(parts))
+
+
+def _count_avoided(text_chars: int, mp3_bytes: int) -> None:
+    """A synthesis stopped by a barge-in: the speech its text would still have produced."""
+    inc("ist_cancellations_total", stage="tts")
+    avoided = text_chars / SPEECH_CHARS_PER_S - mp3_bytes / MP3_BYTES_PER_S
+    if avoided > 0:
+        inc("ist_tts_audio_avoided_seconds_total", avoided)
+
+
 class EdgeTTS(tts.TTS):
     def __init__(
         self,
@@ -28,13 +76,18 @@ class EdgeTTS(tts.TTS):
         voice: str = DEFAULT_VOICE,
         rate: str = "+0%",
         volume: str = "+0%",
+        tracer: Optional[RoomTracer] = None,
     ) -> None:
         super().__init__(
-            capabilities=tts.TTSCapabilities(streaming=False),
+            capabilities=tts.TTSCapabilities(streaming=True),
             sample_rate=SAMPLE_RATE,
             num_channels=NUM_CHANNELS,
         )
         self._opts = _EdgeOptions(voice=voice, rate=rate, volume=volume)
+        self._tracer = tracer
+
+    def _current_turn(self) -> Optional[TurnTrace]:
+        return self._tracer.current if self._tracer is not None else None
 
     @property
     def model(self) -> str:
@@ -44,6 +97,17 @@ class EdgeTTS(tts.TTS):
     def provider(self) -> str:
         return "microsoft"
 
+    async def prewarm_cache(self, phrases: Iterable[str]) -> None:
+        """
+        Synthesize fixed phrases into the audio cache with this voice, both whole (synthesize)
+        and split the way the streaming path splits them, so either path replays from cache.
+        """
+        splitter = tokenize.basic.SentenceTokenizer()
+        for phrase in phrases:
+            for text in [phrase, *splitter.tokenize(phrase)]:
+                async for _ in _cached_audio(text, self._opts):
+                    pass
+
     def synthesize(
         self,
         text: str,
@@ -52,6 +116,13 @@ class EdgeTTS(tts.TTS):
     ) -> tts.ChunkedStream:
         return EdgeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
 
+    def stream(
+        self,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.SynthesizeStream:
+        return EdgeSynthesizeStream(tts=self, conn_options=conn_options)
+
 
 class EdgeChunkedStream(tts.ChunkedStream):
     def __init__(
@@ -63,14 +134,9 @@ class EdgeChunkedStream(tts.ChunkedStream):
     ) -> None:
         super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
         self._edge_tts: EdgeTTS = tts
+        self._turn = tts._current_turn()
 
     async def _run(self, output_emitter: tts.AudioEmitter) -> None:
-        communicate = edge_tts.Communicate(
-            self.input_text,
-            self._edge_tts._opts.voice,
-            rate=self._edge_tts._opts.rate,
-            volume=self._edge_tts._opts.volume,
-        )
         request_id = str(uuid.uuid4())
         output_emitter.initialize(
             request_id=request_id,
@@ -78,10 +144,143 @@ class EdgeChunkedStream(tts.ChunkedStream):
             num_channels=NUM_CHANNELS,
             mime_type="audio/mpeg",
         )
+        start = time.perf_counter()
+        first = True
+        received = 0
         try:
-            async for chunk in communicate.stream():
-                if chunk.get("type") == "audio" and chunk.get("data"):
-                    output_emitter.push(chunk["data"])
+            # aclosing: however the loop ends, the Edge-TTS socket is closed before _run returns
+            async with aclosing(_cached_audio(self.input_text, self._edge_tts._opts)) as audio:
+                async for data in audio:
+                    if first:
+                        first = False
+                        observe("ist_tts_first_byte_seconds", time.perf_counter() - start)
+                        if self._turn is not None:
+                            self._turn.mark("tts_first_byte")
+                    received += len(data)
+                    output_emitter.push(data)
             output_emitter.flush()
+        except asyncio.CancelledError:
+            _count_avoided(len(self.input_text), received)
+            raise
         finally:
             output_emitter.end_input()
+
+
+class EdgeSynthesizeStream(tts.SynthesizeStream):
+    """
+    Incremental text in, audio out: text is split into sentences as it arrives and each
+    sentence is sent to Edge-TTS on its own. Up to MAX_PARALLEL_SENTENCES are synthesized
+    concurrently. Each sentence's MP3 is decoded to PCM by its own streaming decoder (every
+    sentence is a separate MP3 stream), and PCM is pushed in sentence order as it decodes.
+    Cancelling the stream (a barge-in) closes every open Edge-TTS socket before _run returns.
+    """
+
+    def __init__(self, *, tts: EdgeTTS, conn_options: APIConnectOptions) -> None:
+        super().__init__(tts=tts, conn_options=conn_options)
+        self._edge_tts: EdgeTTS = tts
+        self._turn = tts._current_turn()
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        request_id = str(uuid.uuid4())
+        output_emitter.initialize(
+            request_id=request_id,
+            sample_rate=SAMPLE_RATE,
+            num_channels=NUM_CHANNELS,
+            mime_type="audio/pcm",
+            stream=True,
+        )
+        output_emitter.start_segment(segment_id=request_id)
+
+        sentences = tokenize.basic.SentenceTokenizer().stream()
+        # One audio queue per sentence, in order; None closes each queue and the ordering queue
+        ordered: asyncio.Queue[Optional[asyncio.Queue]] = asyncio.Queue()
+        slots = asyncio.Semaphore(MAX_PARALLEL_SENTENCES)
+        synth_tasks: list[asyncio.Task] = []
+        # Text received and MP3 bytes synthesized so far, for the audio a barge-in avoided
+        text_chars = 0
+        mp3_bytes = 0
+
+        async def _read_input() -> None:
+            nonlocal text_chars
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    sentences.flush()
+                else:
+                    text_chars += len(data)
+                    sentences.push_text(data)
+            sentences.end_input()
+
+        async def _synthesize(text: str, audio: asyncio.Queue) -> None:
+            decoder = codecs.AudioStreamDecoder(
+                sample_rate=SAMPLE_RATE, num_channels=NUM_CHANNELS, format="audio/mpeg"
+            )
+
+            async def _feed() -> None:
+                nonlocal mp3_bytes
+                start = time.perf_counter()
+                first = True
+                try:
+                    async for data in _cached_audio(text, self._edge_tts._opts):
+                        if first:
+                            first = False
+                            observe("ist_tts_first_byte_seconds", time.perf_counter() - start)
+                            if self._turn is not None:
+                                self._turn.mark("tts_first_byte")
+                        mp3_bytes += len(data)
+                        decoder.push(data)
+                finally:
+                    decoder.end_input()
+
+            feed = asyncio.create_task(_feed())
+            try:
+                async for frame in decoder:
+                    audio.put_nowait(bytes(frame.data))
+                await feed
+            finally:
+                audio.put_nowait(None)
+                slots.release()
+                # Wait for the cancelled feed, so its Edge-TTS socket is closed when this returns
+                feed.cancel()
+                await asyncio.gather(feed, return_exceptions=True)
+                await decoder.aclose()
+
+        async def _schedule() -> None:
+            try:
+                async for ev in sentences:
+                    if not ev.token.strip():
+                        continue
+                    await slots.acquire()
+                    audio: asyncio.Queue = asyncio.Queue()
+                    synth_tasks.append(asyncio.create_task(_synthesize(ev.token, audio)))
+                    ordered.put_nowait(audio)
+            finally:
+                ordered.put_nowait(None)
+
+        async def _emit() -> None:
+            while (audio := await ordered.get()) is not None:
+                while (data := await audio.get()) is not None:
+                    output_emitter.push(data)
+            output_emitter.flush()
+
+        tasks = [
+            asyncio.create_task(_read_input()),
+            asyncio.create_task(_schedule()),
+            asyncio.create_task(_emit()),
+        ]
+        cancelled_at = None
+        try:
+            await asyncio.gather(*tasks)
+            # Surface synthesis errors so the framework's retry/error handling sees them
+            await asyncio.gather(*synth_tasks)
+            output_emitter.end_segment()
+        except asyncio.CancelledError:
+            cancelled_at = time.perf_counter()
+            raise
+        finally:
+            for task in tasks + synth_tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, *synth_tasks, return_exceptions=True)
+            await sentences.aclose()
+            if cancelled_at is not None:
+                _count_avoided(text_chars, mp3_bytes)
+                observe_stopped("tts", cancelled_at)
@@ -0,0 +1,245 @@
+"""Dense vector backends for HybridRAG: exact NumPy matrix (memory-mapped) or ChromaDB."""
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from config import CHROMA_PERSIST_DIR, VECTOR_BACKEND, VECTOR_DTYPE, VECTOR_INDEX_PATH
+from app.shared_index import tmp_path
+
+COLLECTION_NAME = "ist_admission"
+# int8 rows store round(v * 127) of unit vectors
+INT8_SCALE = 127.0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorStore:
+    """
+    Exact cosine search over a contiguous matrix of unit vectors saved as one .npy file and
+    opened with mmap. Distances are squared L2 (2 - 2 cos), the same scale Chroma reports.
+    int8 shrinks the file and page cache 4x and is upcast per query; float16 halves the file
+    but is upcast once on load, since numpy's half-precision conversion is too slow per query.
+
+    Every persist() writes the matrix to a new file (dense_index.<token>.npy) and then
+    replaces the meta JSON, which names that file next to its ids. The meta replace is the
+    only publish step, so a reader never pairs a matrix with another write's ids. The
+    previous matrix file is kept for a reader that has just read the previous meta.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path: Path = VECTOR_INDEX_PATH, dtype: str = VECTOR_DTYPE) -> None:
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"unsupported VECTOR_DTYPE: {dtype}")
+        self._path = Path(path)
+        self._meta_path = self._path.with_suffix(".json")
+        self._dtype = dtype
+        self._ids: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._search_matrix: Optional[np.ndarray] = None
+        self._pending: Dict[str, np.ndarray] = {}
+        self._deleted: Set[str] = set()
+        self._load()
+
+    def _matrix_path(self, meta: dict) -> Path:
+        # Meta written before matrix files were named per write points at the fixed path
+        return self._path.with_name(meta["matrix"]) if "matrix" in meta else self._path
+
+    def _load(self) -> None:
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            if meta.get("dtype") != self._dtype:
+                return
+            matrix = np.load(self._matrix_path(meta), mmap_mode="r")
+        except Exception:
+            return
+        if matrix.ndim != 2 or matrix.shape[0] != len(meta["ids"]):
+            return
+        self._ids = list(meta["ids"])
+        self._set_matrix(matrix)
+
+    def _set_matrix(self, matrix: np.ndarray) -> None:
+        self._matrix = matrix
+        self._search_matrix = matrix.astype(np.float32) if self._dtype == "float16" else matrix
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> Set[str]:
+        return set(self._ids)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        self._deleted.update(ids)
+
+    def upsert(self, ids: Sequence[str], embeddings: np.ndarray, documents=None, metadatas=None) -> None:
+        for id_, vec in zip(ids, _normalize(embeddings)):
+            self._pending[id_] = vec
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        if self._dtype == "int8":
+            return rows.astype(np.float32) / INT8_SCALE
+        return rows.astype(np.float32)
+
+    def _quantize(self, rows: np.ndarray) -> np.ndarray:
+        if self._dtype == "int8":
+            return np.clip(np.rint(rows * INT8_SCALE), -127, 127).astype(np.int8)
+        return rows.astype(self._dtype)
+
+    def persist(self) -> None:
+        """Apply pending upserts/deletes, write the matrix atomically and re-open it with mmap."""
+        if not self._pending and not self._deleted:
+            return
+        keep = [
+            i for i, id_ in enumerate(self._ids)
+            if id_ not in self._deleted and id_ not in self._pending
+        ]
+        ids = [self._ids[i] for i in keep] + list(self._pending)
+        parts = []
+        if keep and self._matrix is not None:
+            parts.append(self._dequantize(self._matrix[keep]))
+        if self._pending:
+            parts.append(np.stack(list(self._pending.values())))
+        dim = parts[0].shape[1] if parts else 0
+        matrix = np.ascontiguousarray(self._quantize(np.concatenate(parts) if parts else np.zeros((0, dim))))
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            previous = json.loads(self._meta_path.read_text(encoding="utf-8")).get("matrix")
+        except (OSError, ValueError):
+            previous = None
+        path = self._path.with_name(f"{self._path.stem}.{uuid.uuid4().hex[:12]}.npy")
+        tmp = tmp_path(path)
+        with open(tmp, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp, path)
+        tmp_meta = tmp_path(self._meta_path)
+        tmp_meta.write_text(json.dumps({"dtype": self._dtype, "ids": ids, "matrix": path.name}), encoding="utf-8")
+        os.replace(tmp_meta, self._meta_path)
+        self._remove_old_matrices(keep={path.name, previous})
+
+        self._pending.clear()
+        self._deleted.clear()
+        self._ids = ids
+        self._set_matrix(np.load(path, mmap_mode="r"))
+
+    def _remove_old_matrices(self, keep: Set[Optional[str]]) -> None:
+        # Processes still mapping a removed file keep reading it; only new opens need it gone
+        for old in self._path.parent.glob(f"{self._path.stem}*.npy"):
+            if old.name not in keep:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+
+    def query(self, embedding: np.ndarray, k: int) -> Tuple[List[str], List[float]]:
+        if self._matrix is None or not self._ids or k <= 0:
+            return [], []
+        q = _normalize(embedding).reshape(-1)
+        sims = self._search_matrix.astype(np.float32, copy=False) @ q
+        if self._dtype == "int8":
+            sims /= INT8_SCALE
+        k = min(k, sims.shape[0])
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [self._ids[i] for i in top], (2.0 - 2.0 * sims[top]).tolist()
+
+    def query_many(self, embeddings: np.ndarray, k: int) -> List[Tuple[List[str], List[float]]]:
+        """query() for a batch of embeddings with one matrix-matrix product."""
+        n = len(embeddings)
+        if self._matrix is None or not self._ids or k <= 0:
+            return [([], [])] * n
+        q = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(n, -1))
+        sims = q @ self._search_matrix.astype(np.float32, copy=False).T
+        if self._dtype == "int8":
+            sims /= INT8_SCALE
+        k = min(k, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        return [
+            ([self._ids[i] for i in row], (2.0 - 2.0 * row_sims).tolist())
+            for row, row_sims in zip(top, top_sims)
+        ]
+
+
+class ChromaVectorStore:
+    """ChromaDB persistent collection behind the same interface as NumpyVectorStore."""
+
+    name = "chroma"
+
+    def __init__(self) -> None:
+        import chromadb
+        from chromadb.config import Settings
+
+        self._chroma = chromadb.PersistentClient(
+            path=str(CHROMA_PERSIST_DIR),
+            settings=Settings(anonymized_telemetry=False),
+        )
+        self._collection = self._chroma.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"description": "IST admission knowledge base"},
+        )
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def ids(self) -> Set[str]:
+        return set(self._collection.get(include=[])["ids"])
+
+    def delete(self, ids: Sequence[str]) -> None:
+        self._collection.delete(ids=list(ids))
+
+    def upsert(self, ids: Sequence[str], embeddings: np.ndarray, documents=None, metadatas=None) -> None:
+        self._collection.upsert(
+            ids=list(ids),
+            embeddings=np.asarray(embeddings).tolist(),
+            documents=documents,
+            metadatas=metadatas,
+        )
+
+    def persist(self) -> None:
+        pass
+
+    def query(self, embedding: np.ndarray, k: int) -> Tuple[List[str], List[float]]:
+        if k <= 0:
+            return [], []
+        results = self._collection.query(
+            query_embeddings=[np.asarray(embedding).reshape(-1).tolist()],
+            n_results=k,
+            include=["distances"],
+        )
+        ids = results["ids"][0] if results.get("ids") else []
+        distances = results["distances"][0] if results.get("distances") else []
+        return ids, distances
+
+    def query_many(self, embeddings: np.ndarray, k: int) -> List[Tuple[List[str], List[float]]]:
+        if k <= 0:
+            return [([], [])] * len(embeddings)
+        results = self._collection.query(
+            query_embeddings=np.asarray(embeddings).reshape(len(embeddings), -1).tolist(),
+            n_results=k,
+            include=["distances"],
+        )
+        ids = results.get("ids") or [[] for _ in embeddings]
+        distances = results.get("distances") or [[] for _ in embeddings]
+        return list(zip(ids, distances))
+
+
+def open_vector_store():
+    """Open the backend selected by VECTOR_BACKEND ("numpy" or "chroma")."""
+    if VECTOR_BACKEND == "chroma":
+        return ChromaVectorStore()
+    if VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore()
+    raise ValueError(f"unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
@@ -0,0 +1,100 @@
+"""Worker warm-up: bring indexes up to date and load models before any call is accepted."""
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict
+
+from config import ESCALATION_MESSAGE, FALLBACK_QUERY, GREETING_MESSAGE, RERANK_ENABLED, TTS_VOICE
+from app.facts import build_facts, get_fact_store
+from app.rag import HybridRAG, get_rag
+from app.shared_index import publish_generation
+
+logger = logging.getLogger("ist-agent.warmup")
+
+_ready = threading.Event()
+
+
+def build_indexes(embedder=None) -> HybridRAG:
+    """
+    Update the on-disk indexes once in the supervising process, so job processes that
+    prewarm in parallel only load them instead of racing to embed and write the same files.
+    Publishes the result as the current index generation. embedder is a loaded model to reuse
+    for any chunks that need embedding; the returned instance holds the one it used, if any.
+    """
+    start = time.perf_counter()
+    rag = HybridRAG(embedder=embedder)
+    rag.build()
+    facts = build_facts(rag.corpus_version)
+    publish_generation(rag.corpus_version, len(rag._chunk_ids))
+    logger.info(
+        "indexes up to date in %.1fs (corpus %s, %d chunks, %d structured facts)",
+        time.perf_counter() - start, rag.corpus_version[:12], len(rag._chunk_ids), len(facts),
+    )
+    return rag
+
+
+# Said on (almost) every call; served from the audio cache instead of Edge-TTS
+FIXED_PHRASES = (GREETING_MESSAGE, ESCALATION_MESSAGE)
+
+
+def prewarm_audio() -> None:
+    """Synthesize FIXED_PHRASES into the on-disk audio cache once; job processes read it from there."""
+    from app.tts_edge import EdgeTTS
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(EdgeTTS(voice=TTS_VOICE).prewarm_cache(FIXED_PHRASES))
+    except Exception as e:
+        # Not fatal: the phrases are synthesized (and cached) on first use instead
+        logger.warning("audio cache prewarm failed: %s", e)
+        return
+    logger.info("fixed phrases cached in %.1fs", time.perf_counter() - start)
+
+
+def rss_mb() -> Dict[str, float]:
+    """
+    Resident memory of this process in MB (Linux /proc). RssAnon is private to the process;
+    RssFile includes the memory-mapped index files, whose pages are shared between processes.
+    """
+    out: Dict[str, float] = {}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    out[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return out
+
+
+def prewarm_rag() -> None:
+    """Build this process's RAG singleton and run one query: model load, encode, index pages."""
+    start = time.perf_counter()
+    if RERANK_ENABLED:
+        from app.rerank import get_reranker
+        try:
+            get_reranker().prewarm()
+        except Exception as e:
+            logger.warning("reranker prewarm failed: %s", e)
+    rag = get_rag()
+    rag.search(FALLBACK_QUERY)
+    get_fact_store(rag.corpus_version)
+    rss = rss_mb()
+    logger.info(
+        "RAG warm in %.1fs, rss=%.0fMB (anon %.0fMB, file-backed %.0fMB)",
+        time.perf_counter() - start,
+        rss.get("VmRSS", 0.0),
+        rss.get("RssAnon", 0.0),
+        rss.get("RssFile", 0.0),
+    )
+
+
+def mark_ready() -> None:
+    _ready.set()
+
+
+def is_ready() -> bool:
+    """True once this process has finished prewarm and may take calls."""
+    return _ready.is_set()
@@ -1,10 +1,14 @@
 """Flask app: token endpoint, health, static frontend. Bind 0.0.0.0:PORT for Render."""
+import hmac
 import os
 import uuid
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 
-from config import LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL
+from config import LIVEKIT_API_KEY, LIVEKIT_API_SECRET, LIVEKIT_URL, RELOAD_TOKEN
+from app.metrics import inc, render_prometheus
+from app.reload import request_reload, watcher_alive
+from app.shared_index import read_generation
 
 app = Flask(__name__, static_folder="static", static_url_path="")
 
@@ -23,7 +27,37 @@ def _create_token(room_name: str, participant_identity: str, participant_name: s
 
 @app.route("/health")
 def health() -> tuple:
-    return jsonify({"status": "ok"}), 200
+    generation = read_generation() or {}
+    return jsonify({
+        "status": "ok",
+        "corpus_version": generation.get("fingerprint"),
+        "corpus_built_at": generation.get("built_at"),
+    }), 200
+
+
+@app.route("/admin/reload", methods=["POST"])
+def reload_index() -> tuple:
+    """
+    Ask the agent worker to rebuild the indexes from data/ now. Needs Authorization: Bearer
+    RELOAD_TOKEN. 503 if no worker watcher shares this chroma_db/ (a separate worker box
+    would never see the request).
+    """
+    if not RELOAD_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), RELOAD_TOKEN.encode("utf-8")):
+        return jsonify({"error": "unauthorized"}), 401
+    if not watcher_alive():
+        return jsonify({"error": "no data watcher on this server; run the worker with the web app (start.sh)"}), 503
+    request_reload()
+    generation = read_generation() or {}
+    return jsonify({"requested": True, "corpus_version": generation.get("fingerprint")}), 202
+
+
+@app.route("/metrics")
+def metrics() -> Response:
+    """Prometheus scrape target: this process plus every agent worker process's latest snapshot."""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.route("/token", methods=["POST"])
@@ -36,6 +70,7 @@ def token() -> tuple:
     participant_identity = data.get("participant_identity") or f"user-{uuid.uuid4().hex[:8]}"
     participant_name = data.get("participant_name") or "Caller"
     jwt_token = _create_token(room_name, participant_identity, participant_name)
+    inc("ist_tokens_issued_total")
     return jsonify({
         "server_url": LIVEKIT_URL,
         "participant_token": jwt_token,
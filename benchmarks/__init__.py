@@ -0,0 +1 @@
+"""Offline benchmarks over the bundled data/ corpus."""
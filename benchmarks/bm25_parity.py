@@ -0,0 +1,84 @@
+"""Compare app.bm25.SparseBM25 with rank_bm25.BM25Okapi on the data/ corpus: rankings and speed.
+
+Run from the project root: python -m benchmarks.bm25_parity [--top-k 16] [--repeat 20]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.bm25 import SparseBM25, tokenize
+from app.data_loader import load_documents
+
+QUERIES = [
+    "What is the fee for BS Computer Science?",
+    "fee structure per semester for aerospace engineering",
+    "closing merit of electrical engineering last year",
+    "how is the aggregate calculated entry test matric fsc",
+    "is hostel available for girls",
+    "transport bus routes rawalpindi islamabad",
+    "when is the last date to apply for admission",
+    "entry test syllabus and date",
+    "PhD programs in space science",
+    "scholarships and financial aid for needy students",
+    "avionics engineering department faculty",
+    "materials science fee per semester",
+    "does IST offer MS in data science",
+    "admission helpline phone number",
+    "What about hostels for that program?",
+    "",
+]
+
+
+def _rank_reference(bm25: BM25Okapi, tokens, k: int):
+    scores = bm25.get_scores(tokens)
+    top = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+    return top, scores
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top-k", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = [tokenize(text) for text, _ in load_documents()]
+    t0 = time.perf_counter()
+    reference = BM25Okapi(corpus)
+    t1 = time.perf_counter()
+    sparse = SparseBM25.build(corpus)
+    t2 = time.perf_counter()
+    print(f"corpus: {len(corpus)} chunks, {len(sparse.vocab)} terms")
+    print(f"build: rank_bm25 {1000 * (t1 - t0):.1f} ms, sparse {1000 * (t2 - t1):.1f} ms")
+
+    mismatches = 0
+    ref_ms = []
+    sparse_ms = []
+    for query in QUERIES:
+        tokens = tokenize(query)
+        ref_top, ref_scores = _rank_reference(reference, tokens, args.top_k)
+        top, scores = sparse.top_k(tokens, args.top_k)
+        same_scores = np.allclose(ref_scores, sparse.get_scores(tokens), rtol=1e-9, atol=1e-12)
+        if top.tolist() != ref_top or not same_scores:
+            mismatches += 1
+            print(f"MISMATCH {query!r}: rank_bm25={ref_top} sparse={top.tolist()}")
+        ref_ms.append(_timed(lambda: _rank_reference(reference, tokens, args.top_k), args.repeat))
+        sparse_ms.append(_timed(lambda: sparse.top_k(tokens, args.top_k), args.repeat))
+
+    print(f"query (mean over {len(QUERIES)}): rank_bm25 {np.mean(ref_ms):.3f} ms, sparse {np.mean(sparse_ms):.3f} ms "
+          f"({np.mean(ref_ms) / max(np.mean(sparse_ms), 1e-9):.0f}x)")
+    print("rankings identical" if not mismatches else f"{mismatches} queries differ")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
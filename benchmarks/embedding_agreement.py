@@ -0,0 +1,115 @@
+"""ONNX Runtime embeddings (fp32 and int8) against the PyTorch sentence-transformers model on the data/ corpus.
+
+Run from the project root after `python -m app.onnx_export`:
+
+    python -m benchmarks.embedding_agreement [--min-cosine 0.99] [--output agreement.json]
+
+Every chunk of data/ and every benchmark question is encoded by each backend. The report gives
+per-chunk cosine between a backend's vector and the PyTorch one (mean, p1, min), how much of the
+PyTorch top-8 dense neighbours each backend returns for the questions, single-query encode
+latency, corpus encode throughput, model load time and RSS growth. Exits 1 if a backend's min
+cosine is below --min-cosine.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_THREADS
+from app.data_loader import load_documents
+from app.warmup import rss_mb
+from benchmarks.retrieval import QUESTIONS_PATH, _percentiles
+
+TOP_K = 8
+
+
+def _load(name: str):
+    if name == "pytorch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    from app.embeddings import OnnxEmbedder
+    return OnnxEmbedder(EMBEDDING_ONNX_DIR, quantized=name == "onnx-int8", threads=EMBEDDING_ONNX_THREADS)
+
+
+def _measure(name: str, chunks: List[str], questions: List[str]) -> dict:
+    rss_before = rss_mb().get("VmRSS", 0.0)
+    start = time.perf_counter()
+    model = _load(name)
+    model.encode(["warm up"])
+    load_s = time.perf_counter() - start
+    rss_loaded = rss_mb().get("VmRSS", 0.0)
+
+    start = time.perf_counter()
+    corpus = np.asarray(model.encode(chunks, batch_size=64), dtype=np.float32)
+    corpus_s = time.perf_counter() - start
+    single = []
+    for q in questions:
+        t0 = time.perf_counter()
+        model.encode([q])
+        single.append((time.perf_counter() - t0) * 1000)
+    return {
+        "corpus": corpus,
+        "queries": np.asarray(model.encode(questions), dtype=np.float32),
+        "load_s": round(load_s, 3),
+        "rss_growth_mb": round(rss_loaded - rss_before, 1),
+        "corpus_chunks_per_s": round(len(chunks) / corpus_s, 1),
+        "query_encode": _percentiles(single),
+    }
+
+
+def _unit(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="onnx-int8,onnx,pytorch",
+                        help="comma-separated, measured in this order; pytorch is the reference")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    if "pytorch" not in names:
+        raise SystemExit("pytorch must be one of --backends; it is the reference")
+    chunks = [text for text, _ in load_documents()]
+    questions = [q["question"] for q in json.loads(Path(QUESTIONS_PATH).read_text(encoding="utf-8"))]
+    # ONNX first: once PyTorch is imported, RSS growth of the others would hide under it
+    results: Dict[str, dict] = {name: _measure(name, chunks, questions) for name in names}
+
+    ref = results["pytorch"]
+    ref_top = np.argsort(-(_unit(ref["queries"]) @ _unit(ref["corpus"]).T), axis=1)[:, :TOP_K]
+    report = {"model": EMBEDDING_MODEL, "chunks": len(chunks), "questions": len(questions),
+              "onnx_threads": EMBEDDING_ONNX_THREADS, "backends": {}}
+    failed = False
+    for name, r in results.items():
+        cosine = np.sum(_unit(r["corpus"]) * _unit(ref["corpus"]), axis=1)
+        top = np.argsort(-(_unit(r["queries"]) @ _unit(r["corpus"]).T), axis=1)[:, :TOP_K]
+        overlap = [len(set(a) & set(b)) / TOP_K for a, b in zip(top.tolist(), ref_top.tolist())]
+        report["backends"][name] = {
+            "cosine_vs_pytorch": {
+                "mean": round(float(cosine.mean()), 6),
+                "p1": round(float(np.percentile(cosine, 1)), 6),
+                "min": round(float(cosine.min()), 6),
+            },
+            f"top{TOP_K}_overlap_vs_pytorch": round(float(np.mean(overlap)), 4),
+            **{k: v for k, v in r.items() if k not in ("corpus", "queries")},
+        }
+        if name != "pytorch" and cosine.min() < args.min_cosine:
+            failed = True
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    if failed:
+        print(f"min cosine below {args.min_cosine}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
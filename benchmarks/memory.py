@@ -0,0 +1,43 @@
+"""Resident memory per job process after RAG warm-up, split into private and shared (file-backed) pages.
+
+Run from the project root: python -m benchmarks.memory [--processes 4]
+Start app.embed_service and set EMBED_SERVICE_ADDRESS to see the model leave the job processes.
+"""
+import argparse
+import multiprocessing as mp
+
+from app.warmup import build_indexes
+
+
+def _child(queue) -> None:
+    from app.warmup import prewarm_rag, rss_mb
+
+    prewarm_rag()
+    queue.put(rss_mb())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    # Same order as the worker: indexes once, then job processes prewarm from them
+    build_indexes()
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_child, args=(queue,)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    rows = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    print(f"{'proc':>4} {'rss MB':>8} {'anon MB':>8} {'file MB':>8}")
+    for i, rss in enumerate(rows):
+        print(f"{i:>4} {rss.get('VmRSS', 0):8.1f} {rss.get('RssAnon', 0):8.1f} {rss.get('RssFile', 0):8.1f}")
+    private = sum(r.get("RssAnon", 0) for r in rows)
+    print(f"private total across {len(rows)} processes: {private:.1f} MB (file-backed pages are shared)")
+
+
+if __name__ == "__main__":
+    main()
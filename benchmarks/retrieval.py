@@ -0,0 +1,174 @@
+"""Retrieval quality and latency on the bundled corpus: recall@k, MRR, per-stage percentiles, peak memory.
+
+Run from the project root: python -m benchmarks.retrieval [--embedder hashing] [--output run.json]
+
+Builds the index from data/ into a scratch directory (the live index is never touched),
+runs every question in benchmarks/retrieval_questions.json and prints one JSON document.
+A question counts as found at rank r if the r-th chunk comes from one of its expected
+source files. Chunking follows CHUNK_SIZE / CHUNK_OVERLAP and fusion FUSION_*, so tuning runs look like:
+    CHUNK_SIZE=400 CHUNK_OVERLAP=80 python -m benchmarks.retrieval --output size400.json
+    FUSION_STRATEGY=rrf python -m benchmarks.retrieval --output rrf.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "retrieval_questions.json"
+RECALL_AT = (1, 3, 5, 8)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if samples else (0.0, 0.0, 0.0)
+    return {"p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4), "p99_ms": round(float(p99), 4)}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run(questions: List[dict], top_k: int, repeat: int) -> dict:
+    # Imported here so the environment set up in main() is what config.py reads
+    from config import (
+        CHUNK_OVERLAP,
+        CHUNK_SIZE,
+        DEDUP_ENABLED,
+        DEDUP_THRESHOLD,
+        FUSION_DEDUP_NEIGHBORS,
+        FUSION_DENSE_WEIGHT,
+        FUSION_SPARSE_WEIGHT,
+        FUSION_STRATEGY,
+        RERANK_CANDIDATES,
+        RERANK_ENABLED,
+        RERANK_MODEL,
+        RERANK_TOP_K,
+        VECTOR_BACKEND,
+        VECTOR_DTYPE,
+    )
+    from app.embeddings import embedder_id
+    from app.rag import HybridRAG
+    from app.rerank import get_reranker
+
+    start = time.perf_counter()
+    rag = HybridRAG()
+    rag.build()
+    build_s = time.perf_counter() - start
+    rss_after_build = _peak_rss_mb()
+    model = rag._get_embedding_model()
+    model.encode(["warm-up"])
+
+    stages: Dict[str, List[float]] = {"encode_ms": [], "vector_ms": [], "bm25_ms": [], "fusion_ms": [], "total_ms": []}
+    if RERANK_ENABLED:
+        stages["rerank_ms"] = []
+    ranks: List[int] = []
+    per_topic: Dict[str, List[int]] = {}
+    misses = []
+    for q in questions:
+        expected = set(q["sources"])
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            embedding = model.encode([q["question"]])[0]
+            encode_ms = (time.perf_counter() - t0) * 1000
+            timings: Dict[str, float] = {}
+            if RERANK_ENABLED:
+                # Time uncached reranks; the score cache would turn every repeat into a hit
+                get_reranker().clear()
+                candidates = rag._hybrid_rank(q["question"], embedding, max(top_k, RERANK_CANDIDATES), timings)
+                ranked = rag._rerank(q["question"], candidates, top_k, timings)
+            else:
+                ranked = rag._hybrid_rank(q["question"], embedding, top_k, timings)
+            stages["encode_ms"].append(encode_ms)
+            for name, ms in timings.items():
+                stages[name].append(ms)
+            stages["total_ms"].append((time.perf_counter() - t0) * 1000)
+        # Rank of the first chunk from an expected file, 0 if none in the top_k
+        rank = 0
+        for r, (idx, _) in enumerate(ranked, 1):
+            if any(s.split("|", 1)[0] in expected for s in rag.chunk_sources(rag._chunk_ids[idx])):
+                rank = r
+                break
+        ranks.append(rank)
+        per_topic.setdefault(q["topic"], []).append(rank)
+        if rank == 0:
+            misses.append({
+                "question": q["question"],
+                "expected": sorted(expected),
+                "got": [rag.chunk_source(rag._chunk_ids[i]) for i, _ in ranked[:3]],
+            })
+
+    def recall(rs: List[int], k: int) -> float:
+        return round(sum(1 for r in rs if 0 < r <= k) / len(rs), 4) if rs else 0.0
+
+    def mrr(rs: List[int]) -> float:
+        return round(sum(1.0 / r for r in rs if r) / len(rs), 4) if rs else 0.0
+
+    ks = [k for k in RECALL_AT if k <= top_k]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "embedder": embedder_id(),
+            "vector_backend": VECTOR_BACKEND,
+            "vector_dtype": VECTOR_DTYPE,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "dedup_threshold": DEDUP_THRESHOLD if DEDUP_ENABLED else None,
+            "fusion": FUSION_STRATEGY,
+            "fusion_weights": [FUSION_DENSE_WEIGHT, FUSION_SPARSE_WEIGHT],
+            "fusion_dedup_neighbors": FUSION_DEDUP_NEIGHBORS,
+            "rerank": {"model": RERANK_MODEL, "candidates": RERANK_CANDIDATES, "top_k": RERANK_TOP_K} if RERANK_ENABLED else None,
+            "top_k": top_k,
+            "repeat": repeat,
+            "python": platform.python_version(),
+        },
+        "corpus": {"version": rag.corpus_version, "chunks": len(rag._documents), "questions": len(questions)},
+        "quality": {
+            **{f"recall@{k}": recall(ranks, k) for k in ks},
+            "mrr": mrr(ranks),
+            "by_topic": {
+                topic: {f"recall@{ks[-1]}": recall(rs, ks[-1]), "mrr": mrr(rs), "questions": len(rs)}
+                for topic, rs in sorted(per_topic.items())
+            },
+            "misses": misses,
+        },
+        "latency": {name: _percentiles(samples) for name, samples in stages.items()},
+        "build_s": round(build_s, 3),
+        "memory": {"peak_rss_mb_after_build": rss_after_build, "peak_rss_mb": _peak_rss_mb()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embedder", choices=("model", "onnx", "hashing"), default="model",
+                        help="model = EMBEDDING_MODEL; onnx = its ONNX export; hashing = offline stub (no download, lexical only)")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per question")
+    parser.add_argument("--index-dir", help="scratch index directory (default: a fresh temporary one)")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    if args.embedder != "model":
+        os.environ["EMBEDDING_BACKEND"] = args.embedder
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="ist-bench-index-")
+    os.environ["CHROMA_PERSIST_DIR"] = str(Path(index_dir).resolve())
+
+    questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+    report = run(questions, args.top_k, args.repeat)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,48 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / os.getenv("DATA_DIR", "data")
 LOG_DIR = BASE_DIR / os.getenv("LOG_DIR", "logs")
+AUDIO_CACHE_DIR = BASE_DIR / os.getenv("AUDIO_CACHE_DIR", "audio_cache")
 CHROMA_PERSIST_DIR = BASE_DIR / os.getenv("CHROMA_PERSIST_DIR", "chroma_db")
+# Per-chunk content hashes of what is currently embedded in the index
+INDEX_MANIFEST_PATH = CHROMA_PERSIST_DIR / "index_manifest.json"
+# Dense vector backend: "numpy" (memory-mapped exact search) or "chroma"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")
+# Storage precision of the numpy matrix: float32, float16 or int8
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_INDEX_PATH = CHROMA_PERSIST_DIR / "dense_index.npy"
+# One directory per data fingerprint: chunk texts (memory-mapped, shared read-only by every
+# worker process), BM25 postings and facts, never rewritten once published
+INDEX_GENERATIONS_DIR = CHROMA_PERSIST_DIR / "generations"
+# Hot reload: the builder writes the fingerprint of the last complete index set here; every
+# process with a RAG swaps to it (checked at most every INDEX_RELOAD_CHECK_S, on get_rag())
+INDEX_GENERATION_PATH = CHROMA_PERSIST_DIR / "generation.json"
+INDEX_RELOAD_ENABLED = os.getenv("INDEX_RELOAD_ENABLED", "true").lower() in ("1", "true", "yes")
+INDEX_RELOAD_CHECK_S = float(os.getenv("INDEX_RELOAD_CHECK_S", "5"))
+# The agent worker's main process polls data/ this often and rebuilds on change; 0 = only on request
+DATA_WATCH_INTERVAL_S = float(os.getenv("DATA_WATCH_INTERVAL_S", "10"))
+# Created by POST /admin/reload, picked up by the watcher on its next poll
+RELOAD_REQUEST_PATH = CHROMA_PERSIST_DIR / "reload.request"
+# Rewritten by the watcher on every poll; /admin/reload refuses requests nobody would see
+RELOAD_WATCHER_PATH = CHROMA_PERSIST_DIR / "watcher.json"
+# Bearer token for POST /admin/reload; empty disables the endpoint
+RELOAD_TOKEN = os.getenv("RELOAD_TOKEN", "")
+# Optional local embedding service (Unix socket path); empty = encode in-process
+EMBED_SERVICE_ADDRESS = os.getenv("EMBED_SERVICE_ADDRESS", "")
+EMBED_SERVICE_AUTHKEY = os.getenv("EMBED_SERVICE_AUTHKEY", "")
+
+# Per-turn latency spans (JSONL, one file per process); optional OTLP/HTTP endpoint for OpenTelemetry
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_DIR = LOG_DIR / "traces"
+# A process's span file is rotated past this size; rotated files older than the retention are deleted
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", "50"))
+TRACE_RETENTION_DAYS = float(os.getenv("TRACE_RETENTION_DAYS", "7"))
+TRACE_OTEL_ENDPOINT = os.getenv("TRACE_OTEL_ENDPOINT", "")
+
+# Prometheus metrics: each process writes a snapshot here, the web app serves the sum at /metrics
+METRICS_DIR = LOG_DIR / "metrics"
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+# Snapshots of exited processes are kept (counters stay monotonic) until this old
+METRICS_RETENTION_S = float(os.getenv("METRICS_RETENTION_S", "86400"))
 
 # Ensure dirs exist
 LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -23,19 +64,84 @@ LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET", "")
 
 # Groq
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+# Shared client: cap on in-flight calls per process, HTTP pool size, timeouts and retries
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "32"))
+GROQ_KEEPALIVE_EXPIRY_S = float(os.getenv("GROQ_KEEPALIVE_EXPIRY_S", "120"))
+GROQ_TIMEOUT_S = float(os.getenv("GROQ_TIMEOUT_S", "20"))
+GROQ_CONNECT_TIMEOUT_S = float(os.getenv("GROQ_CONNECT_TIMEOUT_S", "5"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
 
 # Server
 PORT = int(os.getenv("PORT", "5000"))
 HOST = os.getenv("HOST", "0.0.0.0")
 
 # RAG
-CHUNK_SIZE = 600
-CHUNK_OVERLAP = 100
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "600"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
 TOP_K = 8
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# "sentence-transformers" (EMBEDDING_MODEL on PyTorch), "onnx" (the same model on ONNX Runtime, exported
+# with `python -m app.onnx_export`) or "hashing" (offline stub for benchmarks; no model download)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_ONNX_DIR = BASE_DIR / os.getenv("EMBEDDING_ONNX_DIR", "models/all-MiniLM-L6-v2-onnx")
+# Run the int8 dynamically quantized export (weights int8, activations quantized per call)
+EMBEDDING_ONNX_INT8 = os.getenv("EMBEDDING_ONNX_INT8", "true").lower() in ("1", "true", "yes")
+# Intra-op threads per process; several job processes share the CPUs, so keep it small
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "1"))
 FALLBACK_QUERY = "General IST Admission Overview"
+# Processes that read and chunk data/ files when the input is large (PDF sets); 0 = one per CPU, 1 = serial
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+# Drop chunks whose estimated word-shingle Jaccard similarity to a kept chunk is >= DEDUP_THRESHOLD (app/dedup.py)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Hybrid fusion of dense and BM25 candidates: "minmax", "zscore" or "rrf" (see app/fusion.py)
+FUSION_STRATEGY = os.getenv("FUSION_STRATEGY", "minmax")
+FUSION_DENSE_WEIGHT = float(os.getenv("FUSION_DENSE_WEIGHT", "1.0"))
+FUSION_SPARSE_WEIGHT = float(os.getenv("FUSION_SPARSE_WEIGHT", "1.0"))
+FUSION_RRF_K = float(os.getenv("FUSION_RRF_K", "60"))
+# Keep only the best of two overlapping neighbor chunks of the same source in the top_k
+FUSION_DEDUP_NEIGHBORS = os.getenv("FUSION_DEDUP_NEIGHBORS", "false").lower() in ("1", "true", "yes")
+# Optional cross-encoder rerank: score the top RERANK_CANDIDATES fused chunks, keep RERANK_TOP_K.
+# Past RERANK_BUDGET_MS the fused top_k is used unchanged.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "16"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "80"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+# Repeat-question cache: query embedding + ranked chunks, cleared on every index build
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "3600"))
+# Start retrieval on interim transcripts so it is done by the time the user's turn ends
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+# Interim text shorter than this (in words) is not worth a speculative search
+SPECULATIVE_MIN_WORDS = int(os.getenv("SPECULATIVE_MIN_WORDS", "3"))
+# Opt-in answer cache: reuse a non-escalated answer for a near-duplicate question (cosine >= threshold)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1024"))
+# Fee, closing merit, date and formula questions answered from facts extracted at index build (no LLM)
+FACTS_ENABLED = os.getenv("FACTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# One JSON line per answered query (phone numbers redacted); replayed by `python -m app.answer_cache`
+# to tune the threshold. Off by default: it records what callers said
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "false").lower() in ("1", "true", "yes")
+QUERY_LOG_PATH = LOG_DIR / "query_log.jsonl"
 
 # Session
 MAX_HISTORY_TURNS = 12
+# Prompt budget (approximate Llama-3 tokens) for system prompt + context + history + query
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2048"))
+# Most recent turns always sent verbatim; older ones are kept while they fit, else summarized
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "2"))
+GREETING_MESSAGE = "Hello! I'm the IST admissions assistant. How can I help you today?"
+
+# TTS
+TTS_VOICE = os.getenv("TTS_VOICE", "en-US-AriaNeural")
+# TTS audio cache: synthesized MP3 per (text, voice, rate, volume)
+AUDIO_CACHE_MEMORY_ITEMS = int(os.getenv("AUDIO_CACHE_MEMORY_ITEMS", "256"))
+AUDIO_CACHE_DISK_ITEMS = int(os.getenv("AUDIO_CACHE_DISK_ITEMS", "5000"))
 
 # Escalation
 ESCALATION_MESSAGE = (
@@ -9,4 +9,4 @@ AGENT_PID=$!
 echo "Agent worker started (PID: $AGENT_PID)"
 
 # Start the Flask web app (foreground - this is what Render monitors)
-exec gunicorn app:app --bind 0.0.0.0:$PORT --workers 1 --timeout 120
\ No newline at end of file
+exec gunicorn app.web:app --bind 0.0.0.0:$PORT --workers 1 --threads 4 --timeout 120
\ No newline at end of file
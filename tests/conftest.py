@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import app.* and config from the project root, as the worker and web app do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,134 @@
+"""FactStore intent matching and templated answers: what it answers, and what it must leave to RAG/LLM."""
+import pytest
+
+from app.data_loader import Fact, extract_facts, find_programs
+from app.facts import _INTENTS, FactStore, spoken_rupees
+
+FACTS = [
+    Fact("fee", {"amount": 126000, "period": "semester"}, "FEE_STRUCTURE.txt", program="computer_science"),
+    Fact("fee", {"amount": 126000, "period": "semester"}, "FEE_STRUCTURE.txt", program="ai"),
+    Fact("fee", {"amount": 126000, "period": "semester"}, "FEE_STRUCTURE.txt", program="data_science"),
+    Fact("fee", {"amount": 148000, "period": "semester"}, "FEE_STRUCTURE.txt", program="aerospace"),
+    Fact("fee", {"amount": 120000, "period": "year"}, "FEE_STRUCTURE.txt", level="MS"),
+    Fact("one_time_fee", {"amount": 49000}, "FEE_STRUCTURE.txt"),
+    Fact("admission_fee", {"amount": 35000}, "FEE_STRUCTURE.txt"),
+    Fact("fee_deadline", {"date": "3 march 2026"}, "FEE_STRUCTURE.txt"),
+    Fact("closing_merit", {"years": {"2023": 75.9, "2024": 77.2}}, "CLOSING_MERIT_HISTORY.txt", program="aerospace"),
+    Fact("last_date", {"when": "End of June"}, "ADMISSION_DATES_AND_STATUS.txt"),
+    Fact("classes_start", {"when": "September"}, "ADMISSION_DATES_AND_STATUS.txt"),
+    Fact("merit_formula", {"weights": "50% Matric, 50% FSC"}, "MERIT_CRITERIA_AND_AGGREGATE.txt", program="non_engineering"),
+    Fact("merit_formula", {"weights": "10% Matric, 40% FSC, 50% entry test"}, "MERIT_CRITERIA_AND_AGGREGATE.txt", program="engineering"),
+    Fact("admissions_phone", {"phone": "051 9075100"}, "99_MASTER_JSON.json"),
+    Fact("offered", {"url": ""}, "99_MASTER_JSON.json", program="physics"),
+    Fact("offered", {"url": ""}, "99_MASTER_JSON.json", program="aerospace", level="MS"),
+    Fact("offered", {"url": ""}, "99_MASTER_JSON.json", program="data_science"),
+]
+
+
+@pytest.fixture
+def store():
+    return FactStore(FACTS)
+
+
+def test_spoken_rupees():
+    assert spoken_rupees(148000) == "1 lakh 48 thousand rupees"
+    assert spoken_rupees(49000) == "49 thousand rupees"
+
+
+def test_find_programs_aliases():
+    assert find_programs("fee for the AI and DS programs") == ["ai", "data_science"]
+    assert find_programs("BSCS or computer science") == ["computer_science"]
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("What is the fee for computer science?", "fee"),
+    ("What was the closing merit for aerospace in 2023?", "closing_merit"),
+    ("When is the last date to apply?", "dates"),
+    ("How is the aggregate calculated?", "merit_formula"),
+    ("What is the admissions phone number?", "contact"),
+    ("Do you offer BS physics?", "offered"),
+    ("Does IST offer an MS in aerospace engineering?", "offered"),
+    ("Is there a data science program?", "offered"),
+    ("Is physics offered at IST?", "offered"),
+])
+def test_intent_matches(query, intent):
+    assert [name for name, p in _INTENTS.items() if p.search(query)] == [intent]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("What is the fee for computer science?",
+     "The fee for BS Computer Science is about 1 lakh 26 thousand rupees per semester."),
+    ("what is the cs fee per semester",
+     "The fee for BS Computer Science is about 1 lakh 26 thousand rupees per semester."),
+    ("fee for the AI and DS programs",
+     "The fee for BS Artificial Intelligence is about 1 lakh 26 thousand rupees per semester. "
+     "The fee for BS Data Science is about 1 lakh 26 thousand rupees per semester."),
+    ("What is the MS fee?", "MS programs cost approximately 1 lakh 20 thousand rupees per year."),
+    ("What is the one-time admission fee?",
+     "BS students pay one-time charges of 49 thousand rupees at admission: "
+     "the admission fee, endowment fund and library development fund."),
+    ("What is the admission fee?", "The BS admission fee is 35 thousand rupees, paid once at admission."),
+    ("last date for the fee challan",
+     "The last date to submit the fee challan is 3 March 2026; after that it is accepted with a fine."),
+    ("What was the closing merit for aerospace in 2023?",
+     "The closing merit for BS Aerospace Engineering in 2023 was 75.9 percent."),
+    ("What was the closing merit for aerospace?",
+     "The closing merit for BS Aerospace Engineering in 2024 was 77.2 percent."),
+    ("When is the last date to apply?", "The last date to apply for BS admission is end of June."),
+    ("When do classes start?", "Classes usually start in September."),
+    ("How is the aggregate calculated for physics?", "For BS Physics, the aggregate is 50% Matric, 50% FSC."),
+    ("How is the aggregate calculated for aerospace?",
+     "For BS Aerospace Engineering, the aggregate is 10% Matric, 40% FSC, 50% entry test."),
+    ("What is the admissions phone number?", "The admissions office number is 051 9075100."),
+    ("Do you offer BS physics?", "Yes, IST offers BS Physics."),
+    ("Does IST offer an MS in aerospace engineering?", "Yes, IST offers an MS in Aerospace Engineering."),
+    ("Is there a data science program?", "Yes, IST offers BS Data Science."),
+])
+def test_answers(store, query, expected):
+    assert store.answer(query) == expected
+
+
+FALSE_POSITIVES = [
+    # "is there a X for <program>" is about X, not whether the program exists
+    "Is there an entry test for computer science?",
+    "Is there an age limit for computer science?",
+    "Is there a waiting list for aerospace?",
+    "Is there an interview for data science?",
+    "Do you offer online classes for mathematics?",
+    "Is there a lab for physics?",
+    # Fees are listed per semester (BS) or per year (MS); another period is the LLM's to work out
+    "what is the cs fee per year",
+    "What is the annual fee for aerospace?",
+    "What is the MS fee per semester?",
+    # Fees the facts do not list must not fall through to semester tuition
+    "What is the application processing fee for AI?",
+    "What is the fee for the entry test for cs?",
+    "How much is the admission form?",
+    # A program we do not recognize next to one we do: no partial answer
+    "fee for AI and biomedical engineering",
+    "closing merit for aerospace and biomedical",
+    # Judgment the templates cannot give, two intents, or a caller leaving a number
+    "Will I get admission in cs with 80%?",
+    "Is there a scholarship for physics?",
+    "What is the fee for cs and what is the last date?",
+    "My number is 0300-1234567, call me about the fee",
+    "",
+]
+
+
+@pytest.mark.parametrize("query", FALSE_POSITIVES + ["What is the fee for mathematics?"])
+def test_left_to_llm(store, query):
+    assert store.answer(query) is None
+
+
+@pytest.mark.parametrize("query", FALSE_POSITIVES)
+def test_left_to_llm_on_corpus(query):
+    # Same questions against the facts extracted from data/, which is what the worker serves
+    assert FactStore(extract_facts()).answer(query) is None
+
+
+def test_admission_fee_on_corpus():
+    # FEE_STRUCTURE.txt: admission fee 35 thousand, 49 thousand with the other one-time charges
+    store = FactStore(extract_facts())
+    assert store.answer("What is the admission fee?") == "The BS admission fee is 35 thousand rupees, paid once at admission."
+    assert "49 thousand rupees" in store.answer("What are the one-time charges?")